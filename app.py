@@ -1,28 +1,49 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
 import streamlit as st
-from streamlit_gsheets import GSheetsConnection
 import pandas as pd
 from datetime import datetime
 import pytz
-import random
+import uuid
 import os
-import base64
-import io
-import qrcode
 import glob
 import math
 import mimetypes
-import time
 import html
-from weasyprint import HTML, CSS
-from weasyprint.text.fonts import FontConfiguration
-from PIL import Image
+import threading
+import shutil
+import tempfile
 import streamlit.components.v1 as components # <--- ✅ เพิ่มบรรทัดนี้
-import requests
-from PIL import Image, ImageOps  # ✅ เพิ่ม ImageOps เพื่อแก้ปัญหารูปหมุน
+from case_store import GSheetsCaseStore, SQLiteCaseStore, open_spreadsheet, ConflictError, LIST_COLUMNS, row_etag, filter_cases, prepare_case_frame
+from case_cache import CaseCache
+from case_search import CaseSearchIndex
+from case_tracking import TrackingIndex
+from case_stats import CaseStats
+from pdf_engine import PDF_CACHE
+from pdf_batch import export_pdfs
+from upload_pipeline import UploadPipeline, upload_to_drive
+from image_cache import IMAGE_CACHE, process_image
+from client_trace import client_fingerprint, security_trace
+from submit_guard import SubmissionLedger, TokenBucket
+from case_archive import CaseArchive
+from case_journal import CaseJournal, JournalFlusher, patch_case, with_pending
+from case_export import MIME, export_cases, iter_records
+from case_audit import GSheetsAuditStore, SQLiteAuditStore, audit_sheet_name, legacy_events, record_or_defer
+from case_options import LOCATION_OPTIONS, INCIDENT_TYPES, STATUS_OPTIONS, COORD_MAP
+from metrics import METRICS, instrument, log_event, timed, timed_import
+
 GAS_APP_URL = "https://script.google.com/macros/s/AKfycbzIKZM9T856HB9Y16F-yPrzu6VumTGf8ZUztBy8j83JRbipsGfCqNbRe5Itw-gyv34/exec"
 # --- 1. ตั้งค่าหน้าจอ ---
 st.set_page_config(page_title="ระบบรับแจ้งเหตุร้ายสถานีตำรวจภูธรโรงเรียนโพนทองพัฒนาวิทยา", page_icon="👮‍♂️", layout="wide")
 
+@st.cache_resource(show_spinner=False)
+def record_cold_start():
+    # เวลา import ทั้งหมดของ run แรกใน process (rerun ถัดไปได้จาก sys.modules แทบไม่เสียเวลา)
+    METRICS.observe("startup.imports", time.perf_counter() - _IMPORT_STARTED)
+    return True
+
+record_cold_start()
+
 # --- CSS: ซ่อนเมนู + ปรับแต่ง UI ---
 st.markdown("""
 <style>
@@ -58,46 +79,11 @@ def get_target_sheet_name():
     return f"Investigation_{ac_year}"
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-FONT_FILE = os.path.join(BASE_DIR, "THSarabunNew.ttf")
-
-# --- Image Helper (ปรับลดขนาดเพื่อแก้ปัญหา 50,000 chars) ---
-def get_base64_image(image_path):
-    if not image_path or not os.path.exists(image_path): return ""
-    try:
-        with open(image_path, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode('utf-8')
-    except: return ""
-
-def process_image(img_file):
-    if not img_file: return ""
-    try:
-        # เปิดรูปภาพ
-        img = Image.open(img_file).convert('RGB')
-        # 🚩 2. แก้ปัญหารูปหมุน (EXIF Orientation) 
-        # จะทำให้รูปแนวตั้งที่ถ่ายจากมือถือแสดงผลเป็นแนวตั้งจริงๆ ไม่นอนตะแคง
-        img = ImageOps.exif_transpose(img)
-        
-        # ✅ 1. เพิ่มความละเอียดจาก 800 เป็น 1600 (เหมาะสำหรับพิมพ์เอกสาร)
-        # 1600px จะให้รายละเอียดที่คมชัดมากแม้จะขยายภาพใน PDF
-        img.thumbnail((1600, 1600))
-        
-        buf = io.BytesIO()
-        
-        # ✅ 2. เพิ่มคุณภาพการบันทึกจาก 65 เป็น 90
-        # ค่า 90 คือระดับที่ตาแยกไม่ออกกับภาพต้นฉบับ แต่ไฟล์ยังไม่ใหญ่จนเกินไป
-        img.save(buf, format="JPEG", quality=85, optimize=True)
-        
-        return base64.b64encode(buf.getvalue()).decode()
-    except Exception as e:
-        print(f"Error processing image: {e}")
-        return ""
 
 # --- Logo Loading ---
 LOGO_PATH = None
 possible_logos = glob.glob(os.path.join(BASE_DIR, "school_logo*"))
 if possible_logos: LOGO_PATH = possible_logos[0]
-LOGO_BASE64 = get_base64_image(LOGO_PATH) if LOGO_PATH else ""
-LOGO_MIME = "image/png"
 
 def sanitize_input(text):
     if not text:
@@ -114,102 +100,212 @@ def sanitize_input(text):
     safe_text = html.escape(text_str)
     
     return safe_text.strip()
-def upload_to_drive(file_bytes, filename):
-    try:
-        b64_data = base64.b64encode(file_bytes).decode()
-        payload = {"filename": filename, "filedata": b64_data}
-        
-        # ส่งรูปไปที่สะพาน GAS
-        response = requests.post(GAS_APP_URL, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("status") == "success":
-                return result.get("url") # คืนค่าเป็นลิงก์รูป
-            else:
-                # 🚩 จะโชว์ถ้า Google Apps Script ส่ง Error กลับมา
-                st.error(f"❌ GAS Error: {result.get('message')}")
-        else:
-            # 🚩 จะโชว์ถ้าเชื่อมต่อ URL ไม่ได้ (เช่น URL ผิด หรือไม่ได้ตั้งค่า Anyone)
-            st.error(f"❌ Connection Error (HTTP {response.status_code})")
-        return ""
-    except Exception as e:
-        # 🚩 จะโชว์ถ้าเกิดปัญหาอื่น ๆ เช่น เน็ตหลุด หรือชื่อตัวแปรผิด
-        st.error(f"❌ Upload System Error: {e}")
-        return ""
 def get_security_trace():
-    try:
-        # ดึง IP จริง
-        ip = requests.get('https://api.ipify.org?format=json', timeout=5).json()['ip']
-        # ดึงข้อมูล Browser/รุ่นมือถือ
-        ua = st.context.headers.get("User-Agent", "Unknown Device")
-    except:
-        ip = "Unknown IP"
-        ua = "Unknown Device"
-    return f"IP: {ip} | Device: {ua}"
-
-def safe_ensure_columns_for_view(df):
-    required_cols = ['Report_ID', 'Timestamp', 'Reporter', 'Incident_Type', 'Location', 'Details', 'Status', 'Image_Data', 'Audit_Log', 'Victim', 'Accused', 'Witness', 'Teacher_Investigator', 'Student_Police_Investigator', 'Statement', 'Evidence_Image', 
-        'lat', 'lon']
-    if df is None or df.empty: return pd.DataFrame(columns=required_cols)
-    for col in required_cols:
-        if col not in df.columns: df[col] = ""
-    return df
-
-LOCATION_OPTIONS = ["อาคาร 1", "อาคาร 2", "อาคาร 3", "อาคาร 4", "อาคาร 5", "หอประชุมเทาทอง", "หอประชุมไทรทอง", "อาคารไฟฟ้าสนามฟุตบอล", "สนามบาส", "โรงอาหาร", "สนามปิงปอง", "สวนหลังห้องปกครอง", "สวนสนามเปตอง", "สวนเกษตร", "สวนหลังไทรทอง", "ห้องน้ำโรงอาหารติดอาคาร 4", "ห้องน้ำโรงอาหารติดประตูโรงอาหาร", "ห้องน้ำหลังอาคาร 3", "ห้องน้ำอาคารไฟฟ้า", "ห้องน้ำหลังอาคาร 5", "อื่นๆ"]
+    # อ่านจาก header ของคำขอ ไม่มีการเรียกเครือข่าย
+    return security_trace(st.context.headers)
+
 
 # --- PDF Function ---
+# ตัวสร้างจริงอยู่ใน pdf_engine (font/CSS compile ครั้งเดียว + LRU แคชตามเนื้อหาแถว)
+@instrument("pdf.create", size=len)
 def create_pdf(row):
-    rid = str(row.get('Report_ID', '')); date_str = str(row.get('Timestamp', ''))
-    reporter = str(row.get('Reporter', '-')); incident = str(row.get('Incident_Type', '-'))
-    location = str(row.get('Location', '-')); details = str(row.get('Details', '-'))
-    statement = str(row.get('Statement', '-')); audit_log = str(row.get('Audit_Log', ''))
-    latest_date = "-"
-    if audit_log:
-        try:
-            lines = [l for l in audit_log.split('\n') if l.strip()]
-            if lines and '[' in lines[-1] and ']' in lines[-1]:
-                latest_date = lines[-1][lines[-1].find('[')+1:lines[-1].find(']')]
-        except: pass
-
     printer_name = st.session_state.current_user['name'] if st.session_state.current_user else "System"
-    print_time = get_now_th().strftime("%d/%m/%Y %H:%M:%S")
-    
-    qr = qrcode.make(rid); qr_buffer = io.BytesIO(); qr.save(qr_buffer, format="PNG")
-    qr_base64 = base64.b64encode(qr_buffer.getvalue()).decode()
+    return PDF_CACHE.get_or_render(row, printer_name)
+
+# ไลบรารี PDF/QR/รูป import ตอนใช้ครั้งแรก; ตั้ง PRELOAD_HEAVY=0 ถ้าไม่ต้องการให้โหลดล่วงหน้าเบื้องหลัง
+PRELOAD_HEAVY = os.environ.get("PRELOAD_HEAVY", "1") != "0"
+
+@st.cache_resource(show_spinner=False)
+def start_warm_up():
+    # หลังหน้าแรกแสดงแล้วค่อยโหลด weasyprint/ฟอนต์/โลโก้ในเธรดเบื้องหลัง -> กด PDF ครั้งแรกไม่ต้องรอ
+    from pdf_engine import warm_up
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+# เปิดการเชื่อมต่อ Sheets ตอนต้องใช้จริงครั้งแรก (หน้าฟอร์มนักเรียนแสดงได้ก่อน ไม่ต้องรอ auth)
+def get_conn():
+    GSheetsConnection = timed_import("streamlit_gsheets").GSheetsConnection
+    return st.connection("gsheets", type=GSheetsConnection)
+
+def book_opener():
+    # อ่าน secrets ในเธรดหลัก แล้วคืนฟังก์ชันเปิดสเปรดชีตด้วย gspread (store เรียกตอนใช้ครั้งแรก อาจอยู่ในเธรดเบื้องหลัง)
+    settings = dict(st.secrets["connections"]["gsheets"])
+    return lambda: open_spreadsheet(settings)
+
+# --- Case Store (ที่เก็บรายงาน) ---
+# ตั้ง CASE_STORE=sqlite:///cases.db เพื่อใช้ฐานข้อมูลในเครื่องแทน Google Sheets
+CASE_STORE_URL = os.environ.get("CASE_STORE", "")
+
+@st.cache_resource
+def get_case_store(sheet_name):
+    if CASE_STORE_URL.startswith("sqlite:///"): return SQLiteCaseStore(CASE_STORE_URL[len("sqlite:///"):], sheet_name)
+    return GSheetsCaseStore(get_conn(), sheet_name, book_opener())
+
+# --- Audit: เหตุการณ์การแก้ไขคดีในตาราง/ชีตของตัวเอง (AuditLog_<ปี>) ---
+@st.cache_resource
+def get_audit_store(sheet_name):
+    if CASE_STORE_URL.startswith("sqlite:///"): return SQLiteAuditStore(CASE_STORE_URL[len("sqlite:///"):], audit_sheet_name(sheet_name))
+    return GSheetsAuditStore(book_opener(), audit_sheet_name(sheet_name))
+
+def with_last_updated(sheet_name, row):
+    # PDF/หน้ารายละเอียดใช้เวลาอัปเดตล่าสุดจาก audit store แทนการแยกข้อความ Audit_Log
+    return dict(row) | {"Last_Updated": get_audit_store(sheet_name).last_updated(row['Report_ID'])}
+
+# --- Journal: รับรายงานลง SQLite ในเครื่องก่อน แล้วทยอยส่งเข้าชีตเป็นชุดเบื้องหลัง ---
+# journal.db (รวม ledger ของ Report_ID) ควรอยู่บนดิสก์ถาวร: ตั้ง CASE_JOURNAL ไปที่ volume ที่ไม่หายตอน deploy
+# บน host ที่ดิสก์หายเมื่อรีสตาร์ต ledger เริ่มว่าง -> seed_ledger จองเลขที่อยู่ในชีตแล้วก่อนออกเลขใหม่
+CASE_JOURNAL_PATH = os.environ.get("CASE_JOURNAL", os.path.join(BASE_DIR, "journal.db"))
+
+@st.cache_resource
+def get_case_journal():
+    return CaseJournal(CASE_JOURNAL_PATH)
+
+@st.cache_resource
+def get_journal_flusher():
+    flusher = JournalFlusher(get_case_journal())
+    flusher.add_purger(get_submission_ledger().purge)  # คีย์ฟอร์มเก่าเกิน 7 วัน
+    flusher.start()
+    return flusher
+
+def ensure_journal_flusher(sheet_name):
+    # ลงทะเบียน store ของชีตปัจจุบันทุก run (ขึ้นปีการศึกษาใหม่ก็ได้ store ใหม่เอง)
+    flusher = get_journal_flusher()
+    flusher.register(sheet_name, get_case_store(sheet_name), get_audit_store(sheet_name))
+    return flusher
+
+def load_case_table(sheet_name, columns=LIST_COLUMNS):
+    # ค่าเริ่มต้นอ่านเฉพาะคอลัมน์ชั้นรายการ (ไม่มีรูป); columns=None = ทุกคอลัมน์
+    return with_pending(get_case_store(sheet_name).read(columns=columns), get_case_journal(), sheet_name)
+
+def load_case_row(sheet_name, rid):
+    # ชั้นรายละเอียด: อ่านแถวเดียวตอนเปิดดูคดี
+    return get_case_journal().get_pending(rid) or get_case_store(sheet_name).fetch(rid)
+
+def load_full_cases(sheet_name, report_ids):
+    # สำหรับงานพิมพ์หลายคดี: อ่านทุกคอลัมน์ครั้งเดียวแล้วกรองเฉพาะคดีที่เลือก
+    df = prepare_case_frame(load_case_table(sheet_name, columns=None))
+    return [with_last_updated(sheet_name, r) for r in df[df['Report_ID'].isin(set(report_ids))].to_dict("records")]
+
+# --- ด่านหน้าการส่งรายงาน: idempotency ต่อฟอร์ม + ออกเลขไม่ชน + จำกัดความถี่ต่อเครื่อง ---
+@st.cache_resource
+def get_submission_ledger():
+    return SubmissionLedger(CASE_JOURNAL_PATH)
+
+# ค่าเริ่มต้นเผื่อนักเรียนหลายคนใช้ Wi-Fi โรงเรียน (IP เดียวกัน) ปรับได้ด้วย env
+RATE_LIMITS = {
+    "submit": (float(os.environ.get("SUBMIT_PER_HOUR", "30")) / 3600, int(os.environ.get("SUBMIT_BURST", "5"))),
+    "track": (float(os.environ.get("TRACK_PER_MINUTE", "20")) / 60, int(os.environ.get("TRACK_BURST", "10"))),
+}
 
-    evidence_html = ""
-    if row.get('Evidence_Image'):
-        evidence_html = f"<div style='margin-top:10px;'><b>หลักฐาน:</b><br><img src='data:image/jpeg;base64,{row.get('Evidence_Image')}' style='max-height:150px;'></div>"
-    
-    logo_html = f'<img class="logo" src="data:{LOGO_MIME};base64,{LOGO_BASE64}">' if LOGO_BASE64 else ""
-
-    html_content = f"""
-    <!DOCTYPE html><html><head><style>
-        @font-face {{ font-family: 'THSarabunNew'; src: url('file://{FONT_FILE}'); }}
-        @page {{ size: A4; margin: 2cm; @bottom-right {{ content: "ผู้พิมพ์: {printer_name} | เวลา: {print_time}"; font-family: 'THSarabunNew'; font-size: 12pt; }} }}
-        body {{ font-family: 'THSarabunNew'; font-size: 16pt; line-height: 1.3; }}
-        .header {{ text-align: center; position: relative; margin-bottom: 20px; min-height: 80px; }}
-        .logo {{ position: absolute; top: 0; left: 0; width: 60px; }}
-        .qr {{ position: absolute; top: 0; right: 0; width: 60px; }}
-        .box {{ border: 1px solid #000; background: #f9f9f9; padding: 10px; min-height: 50px; white-space: pre-wrap; }}
-        .sig-table {{ width: 100%; margin-top: 30px; text-align: center; }} .sig-table td {{ padding-bottom: 30px; vertical-align: top; }}
-    </style></head><body>
-        <div class="header">{logo_html}<div style="font-size:22pt; font-weight:bold; margin-top:10px;">สถานีตำรวจภูธรโรงเรียนโพนทองพัฒนาวิทยา</div>
-        <div style="font-size:18pt; font-weight:bold;">ใบสรุปรายงานเหตุการณ์</div><img class="qr" src="data:image/png;base64,{qr_base64}"></div><hr>
-        <table style="width:100%"><tr><td width="60%"><b>เลขที่:</b> {rid}</td><td width="40%" align="right"><b>วันที่แจ้ง:</b> {date_str}<br><b>อัปเดต:</b> {latest_date}</td></tr></table>
-        <p><b>ผู้แจ้ง:</b> {reporter} | <b>เหตุ:</b> {incident} | <b>สถานที่:</b> {location}</p>
-        <div style="margin-top:10px;"><b>รายละเอียด:</b></div><div class="box">{details}</div>
-        <div><b>ผลการสอบสวน:</b></div><div class="box">{statement}</div>{evidence_html}
-        <table class="sig-table">
-            <tr><td width="50%">ลงชื่อ.......................................<br>({row.get('Victim','')})<br>ผู้เสียหาย</td><td width="50%">ลงชื่อ.......................................<br>({row.get('Accused','')})<br>ผู้ถูกกล่าวหา</td></tr>
-            <tr><td>ลงชื่อ.......................................<br>({row.get('Student_Police_Investigator','')})<br>ตำรวจนักเรียน</td><td>ลงชื่อ.......................................<br>({row.get('Witness','')})<br>พยาน</td></tr>
-            <tr><td colspan="2"><br>ลงชื่อ.......................................<br>({row.get('Teacher_Investigator','')})<br>ครูผู้สอบสวน</td></tr>
-        </table>
-    </body></html>"""
-    return HTML(string=html_content, base_url=BASE_DIR).write_pdf(font_config=FontConfiguration())
-
-conn = st.connection("gsheets", type=GSheetsConnection)
+@st.cache_resource
+def get_rate_limiter(name):
+    rate, burst = RATE_LIMITS[name]
+    return TokenBucket(rate, burst)
+
+def check_rate(name):
+    ok, wait = get_rate_limiter(name).allow(client_fingerprint(st.context.headers))
+    if not ok: st.toast(f"⚠️ ทำรายการถี่เกินไป กรุณารออีก {math.ceil(wait)} วินาที", icon="⚠️")
+    return ok
+
+@st.cache_resource(show_spinner=False)
+def get_seeded_sheets():
+    return set()  # ชีตที่จองเลขลง ledger แล้วใน process นี้
+
+def seed_ledger(sheet_name):
+    # ครั้งแรกต่อ process: อ่านคอลัมน์ Report_ID ของชีต (นอก transaction ของ ledger) แล้วจองเลขเหล่านั้นไว้
+    seeded = get_seeded_sheets()
+    if sheet_name in seeded: return
+    try: ids = get_case_store(sheet_name).existing_ids()
+    except Exception as e:
+        # Sheets ล่มไม่ควรทำให้ส่งรายงานไม่ได้ -> เหลือ ledger กันเลขชนอย่างเดียว ครั้งหน้าลองอ่านใหม่
+        log_event("submit.existing_ids", sheet=sheet_name, error=f"{type(e).__name__}: {e}")
+        return
+    get_submission_ledger().reserve(ids)
+    seeded.add(sheet_name)
+
+def allocate_report_id(form_key):
+    # ตรวจเลขซ้ำกับดัชนีติดตามผลในหน่วยความจำ; ดัชนียังไม่โหลด -> seed ledger จากชีตก่อน (ไม่โหลดทั้งชีต)
+    sheet_name = get_target_sheet_name()
+    tracking = get_tracking_index()
+    if tracking.lookup(sheet_name, "") is None: seed_ledger(sheet_name)
+    taken = lambda rid: any(r == rid for r, _ in tracking.lookup(sheet_name, rid[-4:]) or ())
+    return get_submission_ledger().claim(form_key, get_now_th().strftime('%Y%m%d'), taken)
+
+# แคชตารางร่วมทุก session: ไม่ต้องโหลดทั้งชีตทุกครั้งที่กดเปลี่ยนหน้า/ค้นหา
+CASE_CACHE_TTL = int(os.environ.get("CASE_CACHE_TTL", "120"))
+
+@st.cache_resource
+def get_case_search():
+    return CaseSearchIndex()
+
+# อัปโหลดรูปแบบเบื้องหลัง -> ได้ลิงก์แล้วค่อย patch ลงแถว (bytes อยู่ใน journal.db จนกว่าจะเสร็จ)
+@st.cache_resource
+def get_upload_pipeline():
+    return UploadPipeline(lambda data, filename: upload_to_drive(data, filename, GAS_APP_URL), journal=get_case_journal())
+
+def upload_callbacks(sheet_name):
+    # ดึง store/cache ในเธรดหลักก่อน เพราะ worker ไม่มี script context ของ streamlit
+    store, cache, journal, audit = get_case_store(sheet_name), get_case_cache(), get_case_journal(), get_audit_store(sheet_name)
+    def on_uploaded(report_id, url):
+        patch_case(journal, store, report_id, {"Image_Data": url})
+        cache.apply_update(sheet_name, report_id, {"Image_Data": url})
+        record_or_defer(audit, journal, sheet_name, report_id, "system", "attach_image", ["Image_Data"])
+    def on_failed(report_id, error):
+        # ลองครบแล้ว: รูปยังเก็บใน journal.db ส่วนคดีมีเหตุการณ์ให้เจ้าหน้าที่เห็นในประวัติ
+        record_or_defer(audit, journal, sheet_name, report_id, "system", "upload_failed", ["Image_Data"])
+    return on_uploaded, on_failed
+
+def image_filename(rid):
+    return f"{rid}_incident.jpg"
+
+def queue_image_upload(sheet_name, rid, img_bytes):
+    get_upload_pipeline().submit(sheet_name, rid, img_bytes, image_filename(rid), *upload_callbacks(sheet_name))
+
+@st.cache_resource(show_spinner=False)
+def resume_uploads():
+    # รูปที่ค้างจากรอบก่อน (เช่นหลังรีสตาร์ต) เข้าคิวใหม่ครั้งเดียวต่อ process — ไม่มีของค้างก็ไม่แตะ Sheets
+    return get_upload_pipeline().resume(upload_callbacks)
+
+@st.cache_resource
+def get_tracking_index():
+    return TrackingIndex()
+
+@st.cache_resource
+def get_case_stats():
+    return CaseStats()
+
+@st.cache_resource
+def get_case_cache():
+    cache = CaseCache(load_case_table, ttl=CASE_CACHE_TTL, row_loader=load_case_row)
+    cache.add_listener(get_case_search())
+    cache.add_listener(get_tracking_index())
+    cache.add_listener(get_case_stats())
+    return cache
+
+# คลังปีการศึกษาที่ปิดแล้ว (ไฟล์ Arrow ในเครื่อง ไม่ต้องอ่านจาก Sheets ซ้ำ)
+ARCHIVE_DIR = os.environ.get("CASE_ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
+
+@st.cache_resource
+def get_case_archive():
+    return CaseArchive(ARCHIVE_DIR)
+
+def with_archive_blobs(row):
+    # แถวจากคลังไม่มีคอลัมน์รูป -> ดึงเฉพาะคดีนี้จากไฟล์ blobs
+    row = dict(row)
+    for col in ('Image_Data', 'Evidence_Image'): row[col] = get_case_archive().blob(row['Sheet'], row['Report_ID'], col)
+    return row
+
+def with_history(history, current):
+    # ตารางเบาปีปัจจุบันมีคอลัมน์ category/เวลาแปลงแล้ว -> แปลงกลับเป็นข้อความก่อนต่อกับคลัง
+    current = current.drop(columns=['Submitted'], errors='ignore').astype(object)
+    return pd.concat([history, current], ignore_index=True).fillna("")
+
+def lookup_tracking(code):
+    # get() ให้แน่ใจว่าแคช (และดัชนี) ยังไม่หมดอายุ ส่วนใหญ่เป็น hit ไม่มีการโหลดชีต
+    sheet_name = get_target_sheet_name()
+    get_case_cache().get(sheet_name)
+    return get_tracking_index().lookup(sheet_name, code) or []
 
 def calculate_pagination(key, total_items, limit=5):
     if key not in st.session_state: st.session_state[key] = 1
@@ -221,10 +317,168 @@ def calculate_pagination(key, total_items, limit=5):
 # --- Callbacks ---
 def view_case(rid):
     st.session_state.selected_case_id = rid; st.session_state.view_mode = "detail"; st.session_state.unlock_password = ""
+    st.session_state.case_etag = None; st.session_state.pdf_case_id = None
 def back_to_list():
     st.session_state.view_mode = "list"; st.session_state.selected_case_id = None
 def clear_search_callback(): st.session_state.search_query = ""
 
+# --- Archive (คลังข้อมูลปีก่อน ๆ) ---
+def archive_panel():
+    archive = get_case_archive()
+    with st.expander("🗄️ คลังข้อมูลปีการศึกษาก่อน ๆ"):
+        st.caption("ในคลัง: " + (", ".join(archive.sheets()) or "ยังไม่มี"))
+        current_year = int(get_target_sheet_name().split("_")[1])
+        year = st.number_input("ปีการศึกษา (พ.ศ.) ที่ปิดแล้ว", min_value=2560, max_value=current_year - 1, value=current_year - 1, step=1, key="archive_year")
+        if st.button("📦 เก็บเข้าคลัง", key="archive_go"):
+            with st.spinner("กำลังดึงข้อมูลจาก Google Sheets..."):
+                sheet_name = f"Investigation_{int(year)}"
+                n = archive.snapshot(get_case_store(sheet_name).read(), sheet_name)
+            st.success(f"เก็บ {sheet_name} เข้าคลังแล้ว ({n} คดี)")
+
+def archived_case_view(row):
+    row = with_archive_blobs(row)
+    with st.container(border=True):
+        st.markdown(f"### 🗄️ {row['Report_ID']}")
+        st.caption(f"ข้อมูลจากคลัง {row['Sheet']} (อ่านอย่างเดียว)")
+        st.write(f"**ผู้แจ้ง:** {row['Reporter']} | **สถานที่:** {row['Location']} | **สถานะ:** {row['Status']}")
+        st.info(f"**รายละเอียด:** {row['Details']}")
+        preview = IMAGE_CACHE.get(row['Report_ID'], row['Image_Data'], "preview")
+        if preview: st.image(preview, width=400)
+        st.write(f"**ผู้เสียหาย:** {row['Victim']} | **ผู้ถูกกล่าวหา:** {row['Accused']} | **พยาน:** {row['Witness']}")
+        st.write(f"**ผลการสอบสวน:** {row['Statement']}")
+        try: st.download_button("📥 โหลด PDF", create_pdf(row), f"Report_{row['Report_ID']}.pdf", "application/pdf", type="primary", use_container_width=True)
+        except: st.error("PDF Error")
+
+# --- Batch PDF (พิมพ์หลายคดีพร้อมกัน) ---
+# --- ไฟล์ให้ดาวน์โหลด: อยู่บนดิสก์ session_state เก็บแค่ path ลบทิ้งเมื่อกดดาวน์โหลด/สร้างไฟล์ใหม่ ---
+DOWNLOAD_PREFIX = "police_download_"
+DOWNLOAD_MAX_AGE_S = 3600  # ไฟล์ของ session ที่ปิดไปโดยไม่กดดาวน์โหลด
+
+def drop_download(key):
+    entry = st.session_state.pop(key, None)
+    if entry:
+        try: os.remove(entry[0])
+        except OSError: pass
+
+def keep_download(key, out, fmt):
+    # out = SpooledTemporaryFile จาก export_* -> คัดลอกลงไฟล์ชั่วคราวทีละก้อน ไม่อ่านทั้งไฟล์เข้าแรม
+    drop_download(key)
+    for old in glob.glob(os.path.join(tempfile.gettempdir(), DOWNLOAD_PREFIX + "*")):
+        try:
+            if time.time() - os.path.getmtime(old) > DOWNLOAD_MAX_AGE_S: os.remove(old)
+        except OSError: pass
+    with out, tempfile.NamedTemporaryFile(prefix=DOWNLOAD_PREFIX, suffix=f".{fmt}", delete=False) as f:
+        shutil.copyfileobj(out, f)
+    st.session_state[key] = (f.name, fmt)
+
+def saved_file_button(key, name, mime):
+    path, _ = st.session_state[key]
+    if not os.path.exists(path):
+        st.session_state.pop(key, None); return
+    with open(path, "rb") as f:
+        st.download_button("📥 ดาวน์โหลด", f, name, mime, type="primary", key=f"{key}_download", on_click=drop_download, args=(key,))
+
+def batch_pdf_panel(df_cases, user):
+    with st.expander("🖨️ พิมพ์ PDF หลายคดี"):
+        c1, c2 = st.columns(2)
+        b_status = c1.multiselect("สถานะ", STATUS_OPTIONS, default=["ดำเนินการเรียบร้อย"], key="batch_status")
+        b_types = c2.multiselect("ประเภทเหตุ (ว่าง = ทั้งหมด)", INCIDENT_TYPES, key="batch_types")
+        b_range = c1.date_input("ช่วงวันที่แจ้ง", value=(), key="batch_range")
+        b_fmt = c2.radio("รูปแบบไฟล์", ["ZIP (ไฟล์ละคดี)", "PDF รวมเล่ม"], key="batch_fmt", horizontal=True)
+        d_from = b_range[0] if len(b_range) > 0 else None
+        d_to = b_range[1] if len(b_range) > 1 else d_from
+        cases = filter_cases(df_cases, b_status, d_from, d_to, b_types)
+        st.caption(f"พบ {len(cases)} คดี")
+        if st.button("เริ่มสร้างไฟล์", disabled=cases.empty, key="batch_go"):
+            bar = st.progress(0.0, text="กำลังสร้าง PDF...")
+            fmt = "pdf" if b_fmt.startswith("PDF") else "zip"
+            records = cases.to_dict("records")
+            rows = [with_archive_blobs(r) for r in records if r.get('Sheet')]
+            current_ids = [r['Report_ID'] for r in records if not r.get('Sheet')]
+            if current_ids: rows += load_full_cases(get_target_sheet_name(), current_ids)
+            out = export_pdfs(rows, user['name'], fmt,
+                              on_progress=lambda done, total: bar.progress(done / total, text=f"กำลังสร้าง PDF... {done}/{total}"))
+            keep_download("batch_file", out, fmt)
+            bar.empty()
+        if st.session_state.get("batch_file"):
+            fmt = st.session_state.batch_file[1]
+            saved_file_button("batch_file", f"Reports_{get_now_th().strftime('%Y%m%d_%H%M')}.{fmt}",
+                              "application/zip" if fmt == "zip" else "application/pdf")
+
+# --- Export (CSV/XLSX ตามตัวกรองปัจจุบัน ส่งฝ่ายบริหาร) ---
+def export_rows(cases, sheet_name):
+    # generator: แถวจากคลังมีข้อความครบอยู่แล้ว ส่วนปีปัจจุบันอ่านคอลัมน์ที่ไม่ใช่รูปจาก store ครั้งเดียว
+    current = cases
+    if 'Sheet' in cases.columns:
+        yield from iter_records(cases[cases['Sheet'] != ""])
+        current = cases[cases['Sheet'] == ""]
+    if current.empty: return
+    updated = get_audit_store(sheet_name).last_updated_map()
+    full = prepare_case_frame(load_case_table(sheet_name))
+    full = full.set_index('Report_ID', drop=False).loc[lambda d: ~d.index.duplicated()]
+    ids = [rid for rid in current['Report_ID'] if rid in full.index]
+    for row in iter_records(full.loc[ids]): yield row | {"Last_Updated": updated.get(row['Report_ID'], "")}
+
+def export_panel(filtered, sheet_name):
+    with st.expander("📤 ส่งออก CSV / Excel"):
+        c1, c2 = st.columns(2)
+        e_status = c1.multiselect("สถานะ (ว่าง = ทั้งหมด)", STATUS_OPTIONS, key="export_status")
+        e_fmt = c2.radio("รูปแบบ", ["csv", "xlsx"], key="export_fmt", horizontal=True)
+        cases = filtered[filtered['Status'].isin(e_status)] if e_status else filtered
+        st.caption(f"{len(cases)} คดีตามคำค้นหา/ตัวกรองปัจจุบัน (ไม่รวมรูปภาพและ IP ผู้แจ้ง)")
+        if st.button("เตรียมไฟล์", disabled=cases.empty, key="export_go"):
+            with st.spinner("กำลังสร้างไฟล์..."):
+                keep_download("export_file", export_cases(export_rows(cases, sheet_name), e_fmt), e_fmt)
+        if st.session_state.get("export_file"):
+            fmt = st.session_state.export_file[1]
+            saved_file_button("export_file", f"Cases_{get_now_th().strftime('%Y%m%d_%H%M')}.{fmt}", MIME[fmt])
+
+# --- Metrics (เวลาของเส้นทางหลัก สะสมตั้งแต่ process เริ่ม) ---
+def metrics_panel():
+    snap = METRICS.snapshot()
+    if not snap:
+        st.info("ยังไม่มีข้อมูลการวัด"); return
+    table = pd.DataFrame.from_dict(snap, orient="index")
+    table.index.name = "op"
+    st.dataframe(table, use_container_width=True)
+    c1, c2 = st.columns(2)
+    c1.caption(f"PDF cache: {PDF_CACHE.stats()} | รูป: {IMAGE_CACHE.stats()}")
+    c1.caption(" | ".join(f"จำกัดความถี่ {name}: {get_rate_limiter(name).stats()}" for name in RATE_LIMITS))
+    c2.download_button("📤 Prometheus text", METRICS.prometheus_text(), "metrics.prom", "text/plain", use_container_width=True)
+    if st.button("ล้างค่าการวัด", key="metrics_reset"): METRICS.reset(); st.rerun()
+
+# --- Stats Dashboard (อ่านจากตัวนับที่อัปเดตแบบ incremental ไม่ group-by ใหม่ทุก rerun) ---
+SCHOOL_CENTER = {"lat": 16.293596638838643, "lon": 103.97250289339189}
+
+def stats_dashboard(sheet_name):
+    import plotly.express as px
+    agg = get_case_stats().snapshot(sheet_name)
+    if not agg or not agg['status']:
+        st.info("ยังไม่มีข้อมูลสถิติ"); return
+
+    def counts(dim, key_name):
+        return pd.DataFrame(sorted(agg[dim].items()), columns=[key_name, "จำนวน"])
+
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("ทั้งหมด", sum(agg['status'].values()))
+    m2.metric("รอดำเนินการ", agg['status'].get("รอดำเนินการ", 0))
+    m3.metric("ระหว่างดำเนินการ", agg['status'].get("อยู่ระหว่างการดำเนินการ", 0))
+    m4.metric("เรียบร้อย", agg['status'].get("ดำเนินการเรียบร้อย", 0))
+
+    c1, c2 = st.columns(2)
+    with c1: st.plotly_chart(px.bar(counts('type', "ประเภทเหตุ").sort_values("จำนวน"), x="จำนวน", y="ประเภทเหตุ", orientation="h", title="แยกตามประเภทเหตุ"), use_container_width=True)
+    with c2: st.plotly_chart(px.pie(counts('status', "สถานะ"), names="สถานะ", values="จำนวน", title="แยกตามสถานะ"), use_container_width=True)
+    st.plotly_chart(px.bar(counts('location', "สถานที่").sort_values("จำนวน"), x="จำนวน", y="สถานที่", orientation="h", title="แยกตามสถานที่"), use_container_width=True)
+    c3, c4 = st.columns(2)
+    with c3: st.plotly_chart(px.line(counts('day', "วันที่"), x="วันที่", y="จำนวน", markers=True, title="รายวัน"), use_container_width=True)
+    with c4: st.plotly_chart(px.bar(counts('hour', "ชั่วโมง"), x="ชั่วโมง", y="จำนวน", title="ช่วงเวลาที่เกิดเหตุ"), use_container_width=True)
+
+    heat = pd.DataFrame([(lat, lon, n) for (lat, lon), n in agg['coord'].items()], columns=["lat", "lon", "จำนวน"])
+    if not heat.empty:
+        fig = px.density_mapbox(heat, lat="lat", lon="lon", z="จำนวน", radius=30, center=SCHOOL_CENTER, zoom=16.5,
+                                mapbox_style="open-street-map", title="แผนที่ความหนาแน่นของเหตุในโรงเรียน")
+        st.plotly_chart(fig, use_container_width=True)
+
 # --- Dashboard (เจ้าหน้าที่) ---
 def officer_dashboard():
     # (ส่วนนี้คงเดิมตามที่คุณส่งมา)
@@ -236,29 +490,39 @@ def officer_dashboard():
         st.markdown(f"<div style='font-size: 26px; font-weight: bold; color: #1E3A8A; padding-top: 20px;'>🏢 ระบบสอบสวน คุณ{user['name']}</div>", unsafe_allow_html=True)
     with col_h3: 
         st.write(""); 
+        if st.button("🔄 รีเฟรช", use_container_width=True):
+            get_case_cache().invalidate(get_target_sheet_name()); get_audit_store(get_target_sheet_name()).invalidate()
         #if st.button("🔴 Logout", use_container_width=True): st.session_state.current_user = None; st.rerun()
 
     try:
         target_sheet = get_target_sheet_name()
-        df_raw = conn.read(worksheet=target_sheet, ttl="0")
-        df_display = safe_ensure_columns_for_view(df_raw.copy()).fillna("")
-        df_display['Report_ID'] = df_display['Report_ID'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
+        df_display = get_case_cache().get(target_sheet)
 
         if st.session_state.view_mode == "list":
-            tab_list, tab_dash = st.tabs(["📋 รายการแจ้งเหตุ", "📊 แดชบอร์ดสถิติ"])
+            tab_list, tab_dash, tab_perf = st.tabs(["📋 รายการแจ้งเหตุ", "📊 แดชบอร์ดสถิติ", "⏱️ ประสิทธิภาพระบบ"])
             with tab_list:
                 c_search, c_btn_search, c_btn_clear = st.columns([3, 1, 1])
                 with c_search: search_q = st.text_input("ค้นหา", key="search_query", label_visibility="collapsed")
                 with c_btn_search: st.button("🔍 ค้นหา", use_container_width=True)
                 with c_btn_clear: st.button("❌ ล้าง", on_click=clear_search_callback, use_container_width=True)
+                include_history = st.checkbox("รวมข้อมูลปีการศึกษาก่อน ๆ (จากคลัง)", key="include_history")
                 
-                filtered = df_display.copy()
-                if search_q: filtered = filtered[filtered.apply(lambda r: r.astype(str).str.contains(search_q, case=False).any(), axis=1)]
+                with timed("officer.search") as m:
+                    filtered = df_display
+                    if search_q:
+                        hits = get_case_search().search(target_sheet, search_q)
+                        if hits is not None: filtered = filtered[filtered.index.isin(hits)]
+                    if include_history:
+                        # คลังอยู่ก่อน ปีปัจจุบันอยู่ท้าย -> เมื่อกลับลำดับแสดง ปีปัจจุบันจะขึ้นก่อน
+                        history = get_case_archive().search(search_q) if search_q else get_case_archive().frame()
+                        filtered = with_history(history, filtered)
+                    m["rows"] = len(filtered)
                 
                 df_p = filtered[filtered['Status'].isin(["รอดำเนินการ", "อยู่ระหว่างการดำเนินการ"])][::-1]
                 df_f = filtered[filtered['Status'] == "ดำเนินการเรียบร้อย"][::-1]
 
                 st.markdown("<h4 style='color:#1E3A8A; background:#f0f2f6; padding:10px; border-radius:5px;'>⏳ รายการที่รอการดำเนินการ</h4>", unsafe_allow_html=True)
+                updated = get_audit_store(target_sheet).last_updated_map()
                 sp, ep, cp, tp = calculate_pagination('page_pending', len(df_p), 5)
                 
                 # Header
@@ -270,6 +534,7 @@ def officer_dashboard():
                     cc1, cc2, cc3, cc4 = st.columns([2.5, 2, 3, 1.5])
                     with cc1: st.button(f"📝 {row['Report_ID']}", key=f"p_{i}", use_container_width=True, on_click=view_case, args=(row['Report_ID'],))
                     cc2.write(row['Timestamp']); cc3.write(row['Incident_Type'])
+                    if updated.get(row['Report_ID']): cc2.caption(f"อัปเดต {updated[row['Report_ID']]}")
                     with cc4: st.markdown(f"<span style='color:orange;font-weight:bold'>⏳ {row['Status']}</span>", unsafe_allow_html=True)
                     st.divider()
                 
@@ -288,25 +553,52 @@ def officer_dashboard():
                     cc1, cc2, cc3, cc4 = st.columns([2.5, 2, 3, 1.5])
                     with cc1: st.button(f"✅ {row['Report_ID']}", key=f"f_{i}", use_container_width=True, on_click=view_case, args=(row['Report_ID'],))
                     cc2.write(row['Timestamp']); cc3.write(row['Incident_Type'])
+                    if updated.get(row['Report_ID']): cc2.caption(f"อัปเดต {updated[row['Report_ID']]}")
                     with cc4: st.markdown("<span style='color:green;font-weight:bold'>✅ เรียบร้อย</span>", unsafe_allow_html=True)
                     st.divider()
 
+                export_panel(filtered, target_sheet)
+                batch_pdf_panel(with_history(get_case_archive().frame(), df_display) if include_history else df_display, user)
+                archive_panel()
+
+                cs = get_case_cache().stats()
+                js = get_case_journal().stats()
+                st.caption(f"แคชข้อมูล: hit {cs['hits']} / miss {cs['misses']} (อายุสูงสุด {CASE_CACHE_TTL} วินาที) | รอส่งเข้าชีต: {js['pending']} รายการ"
+                           + (f" (ส่งไม่สำเร็จ หยุดลองแล้ว {js['dead']} รายการ)" if js['dead'] else "")
+                           + (f" | รูปรออัปโหลด: {js['uploads']}" if js['uploads'] else "")
+                           + (f" | รูปอัปโหลดไม่สำเร็จ: {js['uploads_failed']}" if js['uploads_failed'] else "")
+                           + (f" | ประวัติการแก้ไขรอส่ง: {js['audit_pending']}" if js['audit_pending'] else ""))
+
             with tab_dash:
-                st.info("ส่วนแสดง Dashboard (ตามโค้ดเดิม)")
-                # (ใส่โค้ด Dashboard เดิมของคุณที่นี่)
+                stats_dashboard(target_sheet)
+            with tab_perf:
+                metrics_panel()
 
         elif st.session_state.view_mode == "detail":
             st.button("⬅️ กลับหน้ารายการ", on_click=back_to_list, use_container_width=True)
             sid = str(st.session_state.selected_case_id).strip()
-            sel = df_display[df_display['Report_ID'] == sid]
+            # เปิดจากรายการที่รวมคลัง -> ดูในคลังก่อน ไม่ต้อง fetch เลขปีเก่าจากชีตปีปัจจุบัน
+            arch_row = None
+            if st.session_state.get("include_history"):
+                arch = get_case_archive().frame()
+                arch_sel = arch[arch['Report_ID'] == sid]
+                if not arch_sel.empty: arch_row = arch_sel.iloc[0].to_dict()
+            row = get_case_cache().get_row(target_sheet, sid) if arch_row is None else None
             
-            if not sel.empty:
-                idx = sel.index[0]; row = sel.iloc[0]
+            if row is not None:
+                # จำ ETag ตอนเปิดคดี -> ถ้ามีคนอื่นบันทึกทับก่อนเรา จะตรวจเจอตอนกดบันทึก
+                if st.session_state.get("case_etag") is None: st.session_state.case_etag = row_etag(row)
+                audit = get_audit_store(target_sheet)
+                row = with_last_updated(target_sheet, row)
                 with st.container(border=True):
                     st.markdown(f"### 📝 {sid}")
                     st.write(f"**ผู้แจ้ง:** {row['Reporter']} | **สถานที่:** {row['Location']}")
+                    if row['Last_Updated']: st.caption(f"อัปเดตล่าสุด: {row['Last_Updated']}")
                     st.info(f"**รายละเอียด:** {row['Details']}")
-                    if clean_val(row['Image_Data']): st.image(base64.b64decode(row['Image_Data']), width=400)
+                    if str(row['Image_Data']).strip():
+                        preview = IMAGE_CACHE.get(sid, row['Image_Data'], "preview")
+                        if preview: st.image(preview, width=400)
+                        elif str(row['Image_Data']).startswith("http"): st.markdown(f"[🔗 เปิดรูปภาพ]({row['Image_Data']})")
                     
                     st.markdown("---"); st.write("#### ✍️ บันทึกผล")
                     # Form Logic (Simplified)
@@ -315,22 +607,43 @@ def officer_dashboard():
                     wit = c1.text_input("พยาน", row['Witness']); tea = c2.text_input("ครูผู้สอบสวน", row['Teacher_Investigator'])
                     stu = c1.text_input("ตำรวจนักเรียน", row['Student_Police_Investigator'])
                     stmt = st.text_area("ผลการสอบสวน", row['Statement'])
-                    sta = st.selectbox("สถานะ", ["รอดำเนินการ", "อยู่ระหว่างการดำเนินการ", "ดำเนินการเรียบร้อย", "ยกเลิก"], index=["รอดำเนินการ", "อยู่ระหว่างการดำเนินการ", "ดำเนินการเรียบร้อย", "ยกเลิก"].index(row['Status']) if row['Status'] in ["รอดำเนินการ", "อยู่ระหว่างการดำเนินการ", "ดำเนินการเรียบร้อย", "ยกเลิก"] else 0)
+                    sta = st.selectbox("สถานะ", STATUS_OPTIONS, index=STATUS_OPTIONS.index(row['Status']) if row['Status'] in STATUS_OPTIONS else 0)
                     
                     if st.button("💾 บันทึก"):
-                        df_raw.at[idx, 'Victim'] = vic; df_raw.at[idx, 'Accused'] = acc
-                        df_raw.at[idx, 'Witness'] = wit; df_raw.at[idx, 'Teacher_Investigator'] = tea
-                        df_raw.at[idx, 'Student_Police_Investigator'] = stu; df_raw.at[idx, 'Statement'] = stmt
-                        df_raw.at[idx, 'Status'] = sta
-                        df_raw.at[idx, 'Audit_Log'] = f"{row['Audit_Log']}\nUpdate by {user['name']}"
-                        conn.update(worksheet=target_sheet, data=df_raw.fillna(""))
-                        st.success("บันทึกแล้ว"); time.sleep(1); st.rerun()
+                        form = {'Victim': vic, 'Accused': acc, 'Witness': wit, 'Teacher_Investigator': tea,
+                                'Student_Police_Investigator': stu, 'Statement': stmt, 'Status': sta}
+                        # เขียนเฉพาะเซลล์ที่เปลี่ยนของแถวนี้แถวเดียว ประวัติการแก้ไขไปอยู่ใน audit store (ไม่ต่อท้าย Audit_Log แล้ว)
+                        changes = {k: v for k, v in form.items() if str(row.get(k, "")) != str(v)}
+                        if not changes: st.info("ไม่มีข้อมูลที่เปลี่ยนแปลง")
+                        else:
+                            try:
+                                patch_case(get_case_journal(), get_case_store(target_sheet), sid, changes, expected_etag=st.session_state.case_etag)
+                            except ConflictError:
+                                get_case_cache().invalidate(target_sheet); st.session_state.case_etag = None
+                                st.warning("⚠️ มีเจ้าหน้าที่ท่านอื่นบันทึกคดีนี้ไปก่อนแล้ว ระบบโหลดข้อมูลล่าสุดให้ กรุณาตรวจสอบแล้วบันทึกอีกครั้ง")
+                            else:
+                                get_case_cache().apply_update(target_sheet, sid, changes); st.session_state.case_etag = None
+                                action = "status" if 'Status' in changes else "update"
+                                if not record_or_defer(audit, get_case_journal(), target_sheet, sid, user['name'], action, list(changes)):
+                                    # ข้อมูลคดีบันทึกแล้ว ประวัติค้างใน journal รอ flusher ส่งซ้ำ
+                                    ensure_journal_flusher(target_sheet).wake()
+                                    st.toast("⚠️ บันทึกแล้ว แต่ประวัติการแก้ไขยังส่งไม่สำเร็จ ระบบจะส่งซ้ำให้อัตโนมัติ", icon="⚠️")
+                                st.success("บันทึกแล้ว"); time.sleep(1); st.rerun()
+
+                    with st.expander("🕘 ประวัติการแก้ไข"):
+                        # ใหม่สุดอยู่บน: เหตุการณ์จาก audit store ตามด้วยบรรทัดจาก Audit_Log แบบเก่า
+                        for ev in reversed(legacy_events(sid, row['Audit_Log']) + audit.timeline(sid)):
+                            st.write(f"{ev.timestamp or '-'} · {ev.actor or '-'} · {ev.action}" + (f" ({', '.join(ev.fields)})" if ev.fields else ""))
                     
-                    # PDF Button
-                    try:
-                        pdf = create_pdf(row)
-                        st.download_button("📥 โหลด PDF", pdf, f"Report_{sid}.pdf", "application/pdf", type="primary", use_container_width=True)
-                    except: st.error("PDF Error")
+                    # PDF Button: สร้างเมื่อกดขอเท่านั้น ไม่สร้างทุก rerun
+                    if st.session_state.get("pdf_case_id") != sid:
+                        if st.button("📄 สร้าง PDF", use_container_width=True): st.session_state.pdf_case_id = sid; st.rerun()
+                    else:
+                        try:
+                            pdf = create_pdf(row)
+                            st.download_button("📥 โหลด PDF", pdf, f"Report_{sid}.pdf", "application/pdf", type="primary", use_container_width=True)
+                        except: st.error("PDF Error")
+            elif arch_row is not None: archived_case_view(arch_row)
 
     except Exception as e: st.error(f"Error: {e}")
 
@@ -356,29 +669,6 @@ def show_success_popup(rid):
         st.rerun()
 
 # --- 5. Main Page (นักเรียน) ---
-# สร้างตารางอ้างอิงพิกัด (ตัวเลขสมมติ คุณนำพิกัดจริงมาเปลี่ยนได้เลย)
-COORD_MAP = {
-    "อาคาร 1": {"lat": 16.293080624461656, "lon": 103.97334404257019},
-    "อาคาร 2": {"lat": 16.29279814390506, "lon": 103.97334845175875},
-    "อาคาร 3": {"lat": 16.292547130677022, "lon": 103.9742885660193},
-    "อาคาร 4": {"lat": 16.292464708883504, "lon": 103.97328212630455},
-    "อาคาร 5": {"lat": 16.29409615213189, "lon": 103.97431743733651},
-    "หอประชุมเทาทอง": {"lat": 16.2933910148143, "lon": 103.97435250954894},
-    "หอประชุมไทรทอง": {"lat": 16.292976522262947, "lon": 103.97455635743196},
-    "อาคารไฟฟ้าสนามฟุตบอล": {"lat": 16.29471891331982, "lon": 103.97219748923851},
-    "สนามบาส": {"lat": 16.294180437912743, "lon": 103.97201431305878},
-    "โรงอาหาร": {"lat": 16.292685117630384, "lon": 103.97202378933812},
-    "สนามปิงปอง": {"lat": 16.293241855058024, "lon": 103.97291845970389},
-    "สวนหลังห้องปกครอง": {"lat": 16.29356823258865, "lon": 103.97472900714698},
-    "สนามเปตอง": {"lat": 16.29400957119914, "lon": 103.97312938272556},
-    "สวนเกษตร": {"lat": 16.294127310210936, "lon": 103.97369507232361},
-    "สวนหลังไทรทอง": {"lat": 16.29297281083706, "lon": 103.9741158275382},
-    "ห้องน้ำโรงอาหาารติดอาคาร4": {"lat": 16.292463682879095, "lon": 103.97264722383926},
-    "ห้องน้ำหลังอาคาร3": {"lat": 16.292126722514713, "lon": 103.97403520772245},
-    "ห้องน้ำอาคารไฟฟ้า": {"lat": 16.29465819963838, "lon": 103.97237918736676},
-    "ห้องน้ำหลังอาคาร5": {"lat": 16.293816914880985, "lon": 103.97437580456852},
-    "อื่นๆ": {"lat": 16.293596638838643, "lon": 103.97250289339189} # พิกัดกลางโรงเรียน
-}
 def main_page():
     # 1. Pop-up Logic
     if "show_popup" not in st.session_state: st.session_state.show_popup = False
@@ -394,13 +684,15 @@ def main_page():
     tab1, tab2 = st.tabs(["📝 แจ้งเหตุ", "🔍 ติดตามผล"])
     
     with tab1:
+        # คีย์ของฟอร์มนี้: กดส่งซ้ำ/rerun ระหว่างบันทึก -> ได้ Report_ID เดิม ไม่เกิดแถวซ้ำ
+        if "submit_key" not in st.session_state: st.session_state.submit_key = uuid.uuid4().hex
         # เริ่มฟอร์ม
         with st.form("report_form", clear_on_submit=True):
             st.info("ข้อมูลของท่านจะถูกเก็บเป็นความลับไม่เปิดเผยต่อคู่กรณี")
             
             # --- Input Fields ---
             rep = sanitize_input(st.text_input("ชื่อผู้แจ้ง *", max_chars=100))
-            typ = st.selectbox("ประเภทเหตุ", ["ทะเลาะวิวาท/ทำร้ายร่างกาย", "สารเสพติด/บุหรี่ไฟฟ้า", "พกพาอาวุธ", "ลักทรัพย์/ทำลายทรัพย์", "บูลลี่/Cyberbully", "ล่วงละเมิดทางเพศ", "ความรุนแรงในครอบครัว", "อื่นๆ"])
+            typ = st.selectbox("ประเภทเหตุ", INCIDENT_TYPES)
             loc = st.selectbox("สถานที่เกิดเหตุ *", LOCATION_OPTIONS)
             det = sanitize_input(st.text_area("รายละเอียด *", placeholder="เล่าเหตุการณ์...", max_chars=1000))
             img = st.file_uploader("รูปภาพประกอบ", type=['jpg','png'])
@@ -422,33 +714,22 @@ def main_page():
                 coords = COORD_MAP.get(loc, {"lat": 0.0, "lon": 0.0})
                 current_lat = coords["lat"]
                 current_lon = coords["lon"]
-                current_trace = get_security_trace()
 
                 if len(det) < 5: 
                     st.toast("⚠️ รายละเอียดสั้นเกินไป", icon="⚠️")
                 elif not pdpa_check: 
                     st.toast("⚠️ กรุณาติ๊กยืนยันข้อมูล", icon="⚠️")
-                elif rep and loc and det:
-                    rid = f"POL-{get_now_th().strftime('%Y%m%d')}-{random.randint(1000, 9999)}"
+                elif rep and loc and det and (get_submission_ledger().lookup(st.session_state.submit_key) or check_rate("submit")):
+                    current_trace = get_security_trace()  # เก็บร่องรอยเมื่อผ่านการตรวจสอบแล้วเท่านั้น
+                    form_key = st.session_state.submit_key
                     
-                    # --- 2. จัดการรูปภาพ ---
-                    img_data_for_sheet = "" 
-                    if img:
-                        with st.spinner("⏳ กำลังอัปโหลดรูปภาพ..."):
-                            img_b64 = process_image(img) 
-                            if img_b64:
-                                raw_bytes = base64.b64decode(img_b64)
-                                img_data_for_sheet = upload_to_drive(raw_bytes, f"{rid}_incident.jpg")
-
-                    # --- 3. บันทึกลง Google Sheets ---
+                    # --- 2. จัดการรูปภาพ (ย่อ/หมุนตอนนี้ ส่วนอัปโหลดทำเบื้องหลังหลังบันทึกแถวแล้ว) ---
+                    img_bytes = process_image(img) if img else b""
+
+                    # --- 3. บันทึกลง journal ในเครื่อง (ตัว flusher ส่งเข้า Google Sheets ให้เบื้องหลัง) ---
                     try:
                         target_sheet = get_target_sheet_name()
-                        df_current = conn.read(worksheet=target_sheet, ttl="0")
-                        
-                        if df_current is None:
-                            st.error("❌ ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
-                            st.stop()
-
+                        rid = allocate_report_id(form_key)
                         new_data = {
                             "Timestamp": get_now_th().strftime("%d/%m/%Y %H:%M:%S"), 
                             "Reporter": rep, 
@@ -457,17 +738,22 @@ def main_page():
                             "Details": det, 
                             "Status": "รอดำเนินการ", 
                             "Report_ID": rid, 
-                            "Image_Data": img_data_for_sheet,
+                            "Image_Data": "",
                             "Audit_Log": f"Created: {get_now_th()}",
                             "lat": current_lat,
                             "lon": current_lon,
                             "Security_Trace": current_trace 
                         }
-                        new_row = pd.DataFrame([new_data])
-
-                        combined_df = pd.concat([df_current, new_row], ignore_index=True).fillna("")
-                        conn.update(worksheet=target_sheet, data=combined_df)
+                        # enqueue ซ้ำด้วย Report_ID เดิมถูกเมิน -> run ที่ถูกขัดจังหวะแล้วส่งซ้ำจะไม่เกิดแถวซ้ำ
+                        # รูปลง journal ใน transaction เดียวกับแถว
+                        journal = get_case_journal()
+                        if journal.enqueue(target_sheet, new_data, (image_filename(rid), img_bytes) if img_bytes else None):
+                            ensure_journal_flusher(target_sheet).wake()
+                            get_case_cache().apply_append(target_sheet, new_data)
+                        # ครั้งแรก หรือส่งซ้ำหลังถูกขัดจังหวะก่อนเข้าคิว: รูปที่ยังค้างเข้าคิวอัปโหลด (pipeline กันซ้ำด้วย Report_ID)
+                        if img_bytes and journal.upload_pending(rid): queue_image_upload(target_sheet, rid, img_bytes)
                         
+                        del st.session_state.submit_key  # ฟอร์มถัดไปเป็นรายงานใหม่
                         st.session_state.popup_rid = rid
                         st.session_state.show_popup = True
                         st.rerun()
@@ -479,16 +765,13 @@ def main_page():
         c_code, c_btn = st.columns([3,1])
         code = c_code.text_input("เลข 4 ตัวท้าย", max_chars=4, label_visibility="collapsed")
         if c_btn.button("ค้นหา", use_container_width=True):
-            if len(code) == 4 and code.isdigit():
+            if len(code) == 4 and code.isdigit() and check_rate("track"):
                 try:
-                    df = conn.read(worksheet=get_target_sheet_name(), ttl=0).fillna("")
-                    df = safe_ensure_columns_for_view(df)
-                    df['Report_ID'] = df['Report_ID'].astype(str)
-                    match = df[df['Report_ID'].str.endswith(code)]
-                    if not match.empty:
-                        for _, r in match.iterrows():
-                            st.success(f"รหัส: {r['Report_ID']}")
-                            st.info(f"สถานะ: {r['Status']}")
+                    match = lookup_tracking(code)
+                    if match:
+                        for r_id, r_status in match:
+                            st.success(f"รหัส: {r_id}")
+                            st.info(f"สถานะ: {r_status}")
                     else: st.warning("ไม่พบข้อมูล")
                 except: st.error("Connection Error")
 
@@ -505,5 +788,14 @@ if 'view_mode' not in st.session_state: st.session_state.view_mode = "list"
 if 'page_pending' not in st.session_state: st.session_state.page_pending = 1
 if 'page_finished' not in st.session_state: st.session_state.page_finished = 1
 
-if st.session_state.current_user: officer_dashboard()
-else: main_page()
+if st.session_state.current_user:
+    with timed("page.officer"): officer_dashboard()
+else:
+    with timed("page.student"): main_page()
+
+# งานที่ไม่จำเป็นต่อการแสดงหน้าแรก ทำหลังวาดหน้าเสร็จ (streamlit ส่งหน้าให้เบราว์เซอร์ทยอยระหว่าง run แล้ว)
+# ส่งของที่ค้างจากรอบก่อน (เช่นหลังรีสตาร์ต) — ไม่มีของค้างและไม่ใช่หน้าเจ้าหน้าที่ก็ไม่สร้างการเชื่อมต่อ Sheets
+# (หน้านักเรียนเริ่ม flusher เองตอนกดส่ง)
+if st.session_state.current_user or get_case_journal().has_pending(): ensure_journal_flusher(get_target_sheet_name())
+resume_uploads()
+if PRELOAD_HEAVY: start_warm_up()
@@ -0,0 +1 @@
+"""ชุดวัดความเร็วแบบ offline (python -m benchmarks.run --help)"""
@@ -0,0 +1,165 @@
+"""GSheetsConnection ปลอมในหน่วยความจำ สำหรับวัดความเร็วแบบ offline
+
+มีเฉพาะส่วนที่แอปเรียกจริง: conn.read(worksheet, ttl) และ
+conn.open_spreadsheet() (แทน case_store.open_spreadsheet) .worksheet(name) / add_worksheet -> row_values / col_values /
+get_all_values / batch_get / append_row(s) / batch_update / add_cols / col_count
+ทุกคำขอหน่วงเวลา latency (+ jitter) วินาทีเหมือนเรียก Google API และนับจำนวนครั้งไว้
+"""
+import random
+import re
+import threading
+import time
+
+import pandas as pd
+
+_A1_RE = re.compile(r"^([A-Z]+)(\d+)?")
+
+
+def _col_number(letters):
+    n = 0
+    for ch in letters: n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _col_letters(n):
+    out = ""
+    while n: n, r = divmod(n - 1, 26); out = chr(65 + r) + out
+    return out
+
+
+def _parse_a1(a1):
+    """'C5' -> (5, 3), 'C' -> (None, 3) (ตัดชื่อชีตข้างหน้าออกก่อน)"""
+    m = _A1_RE.match(a1.split("!")[-1].replace("'", ""))
+    return (int(m.group(2)) if m.group(2) else None), _col_number(m.group(1))
+
+
+def _trim(values):
+    while values and values[-1] == "": values = values[:-1]
+    return values
+
+
+class FakeWorksheet:
+    def __init__(self, backend, title, header, rows):
+        self.backend = backend
+        self.title = title
+        self.grid = [list(header)] + [list(r) for r in rows]  # แถวที่ 1 = หัวตาราง
+        self.col_count = max(26, len(header))
+
+    def _cell(self, row_no, col_no):
+        row = self.grid[row_no - 1] if row_no <= len(self.grid) else []
+        return row[col_no - 1] if col_no <= len(row) else ""
+
+    def _put(self, row_no, col_no, value):
+        while len(self.grid) < row_no: self.grid.append([])
+        row = self.grid[row_no - 1]
+        if len(row) < col_no: row.extend([""] * (col_no - len(row)))
+        row[col_no - 1] = "" if value is None else str(value)
+
+    def row_values(self, row_no):
+        self.backend.call("row_values")
+        return _trim(list(self.grid[row_no - 1])) if row_no <= len(self.grid) else []
+
+    def col_values(self, col_no):
+        self.backend.call("col_values")
+        return _trim([self._cell(r, col_no) for r in range(1, len(self.grid) + 1)])
+
+    def get_all_values(self):
+        self.backend.call("get_all_values")
+        return [list(r) for r in self.grid]
+
+    def batch_get(self, ranges):
+        self.backend.call("batch_get")
+        out = []
+        for rng in ranges:
+            first, last = rng.split(":")
+            start, col_no = _parse_a1(first)
+            cells = [self._cell(r, col_no) for r in range(start or 1, len(self.grid) + 1)]
+            out.append([[v] if v != "" else [] for v in _trim(cells)])
+        return out
+
+    def append_rows(self, values, value_input_option="RAW", table_range=None):
+        self.backend.call("append_rows", rows=len(values))
+        start = len(self.grid) + 1
+        for i, row in enumerate(values):
+            for j, value in enumerate(row): self._put(start + i, j + 1, value)
+        end_col = _col_letters(max((len(r) for r in values), default=1))
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}:{end_col}{start + len(values) - 1}",
+                            "updatedRows": len(values)}}
+
+    def append_row(self, values, value_input_option="RAW", table_range=None):
+        return self.append_rows([values], value_input_option, table_range)
+
+    def batch_update(self, data, value_input_option="RAW", include_values_in_response=None, **kwargs):
+        self.backend.call("batch_update", rows=len(data))
+        self.backend.last_input_option = value_input_option
+        responses = []
+        for item in data:
+            row_no, col_no = _parse_a1(item["range"])
+            for i, row in enumerate(item["values"]):
+                for j, value in enumerate(row): self._put(row_no + i, col_no + j, value)
+            if include_values_in_response:
+                stored = [[self._cell(row_no + i, col_no + j) for j in range(len(row))] for i, row in enumerate(item["values"])]
+                responses.append({"updatedRange": item["range"], "updatedData": {"range": item["range"], "values": stored}})
+        return {"responses": responses}
+
+    def add_cols(self, n):
+        self.backend.call("add_cols")
+        self.col_count += n
+
+
+class _Spreadsheet:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def worksheet(self, title):
+        self.backend.call("worksheet")
+        if title not in self.backend.sheets:
+            from gspread.exceptions import WorksheetNotFound
+            raise WorksheetNotFound(title)
+        return self.backend.sheets[title]
+
+    def add_worksheet(self, title, rows=1000, cols=26):
+        self.backend.call("add_worksheet")
+        ws = self.backend.sheets[title] = FakeWorksheet(self.backend, title, [], [])
+        ws.grid = []
+        return ws
+
+
+class FakeGSheetsConnection:
+    """ใช้แทน st.connection("gsheets", type=GSheetsConnection)"""
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.sheets = {}
+        self.calls = {}  # ชื่อคำขอ -> จำนวนครั้ง
+        self.last_input_option = None  # value_input_option ของ batch_update ล่าสุด
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self, name, rows=0):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay: time.sleep(delay)
+
+    def open_spreadsheet(self):
+        return _Spreadsheet(self)
+
+    def total_calls(self):
+        with self._lock: return sum(self.calls.values())
+
+    def add_sheet(self, title, df):
+        df = df.fillna("").astype(str)
+        self.sheets[title] = FakeWorksheet(self, title, list(df.columns), df.values.tolist())
+
+    def read(self, worksheet=None, ttl=None, **kwargs):
+        self.call("read")
+        ws = self.sheets[worksheet]
+        header, rows = ws.grid[0], ws.grid[1:]
+        return pd.DataFrame([r + [""] * (len(header) - len(r)) for r in rows], columns=header)
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        # แบบเดิมของ st-gsheets-connection: เขียนทับทั้งชีต
+        self.call("update", rows=len(data))
+        self.add_sheet(worksheet, data)
@@ -0,0 +1,247 @@
+"""วัดเวลาเส้นทางหลักของแอปแบบ offline แล้วเขียนรายงาน JSON
+
+    python -m benchmarks.run --sizes 1000 10000 50000 --latency 0.05 --out bench_report.json
+    python -m benchmarks.run --compare bench_report.json --out bench_new.json
+
+ใช้ FakeGSheetsConnection แทน Google Sheets (หน่วงเวลาต่อคำขอได้) กับตารางสังเคราะห์
+ทุกเส้นทางเรียกคลาส/ฟังก์ชันเดียวกับที่ app.py ใช้ ไม่ได้เขียนตรรกะแยก
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from case_audit import GSheetsAuditStore, audit_sheet_name
+from case_cache import CaseCache
+from case_journal import CaseJournal, JournalFlusher, patch_case, with_pending
+from case_search import CaseSearchIndex
+from case_stats import CaseStats
+from case_store import GSheetsCaseStore, LIST_COLUMNS, row_etag
+from case_tracking import TrackingIndex
+from metrics import METRICS
+from submit_guard import SubmissionLedger
+
+from benchmarks.fake_gsheets import FakeGSheetsConnection
+from benchmarks.synthetic import DETAIL_PARTS, FIRST_NAMES, make_cases, new_submission, synthetic_jpeg
+
+PENDING = ["รอดำเนินการ", "อยู่ระหว่างการดำเนินการ"]
+
+
+def summarize(samples, api_calls=0):
+    ms = sorted(s * 1000 for s in samples)
+    q = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    return {"n": len(ms), "mean_ms": round(statistics.fmean(ms), 3), "p50_ms": round(q[49], 3), "p95_ms": round(q[94], 3),
+            "p99_ms": round(q[98], 3), "min_ms": round(ms[0], 3), "max_ms": round(ms[-1], 3),
+            "api_calls_per_op": round(api_calls / len(ms), 2)}
+
+
+def measure(conn, fn, repeat, warmup=1, setup=None):
+    """setup (ถ้ามี) เรียกก่อนทุกรอบ ไม่นับเวลา/คำขอของมัน"""
+    for _ in range(warmup):
+        if setup: setup()
+        fn()
+    calls = 0
+    samples = []
+    for _ in range(repeat):
+        if setup: setup()
+        before = conn.total_calls()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+        calls += conn.total_calls() - before
+    return summarize(samples, calls)
+
+
+class Bench:
+    """สภาพแวดล้อมหนึ่งชุดต่อขนาดตาราง: ชีตปลอม + store + journal + แคช/ดัชนีแบบเดียวกับแอป"""
+
+    def __init__(self, size, args, workdir):
+        self.rng = random.Random(args.seed)
+        self.year = args.year
+        self.sheet = f"Investigation_{args.year}"
+        self.conn = FakeGSheetsConnection(latency=args.latency, jitter=args.jitter, seed=args.seed)
+        self.df = make_cases(size, args.year, seed=args.seed, images=args.images)
+        self.conn.add_sheet(self.sheet, self.df)
+        self.store = GSheetsCaseStore(self.conn, self.sheet, self.conn.open_spreadsheet)
+        self.journal = CaseJournal(os.path.join(workdir, f"journal_{size}.db"))
+        self.ledger = SubmissionLedger(os.path.join(workdir, f"journal_{size}.db"))
+        self.flusher = JournalFlusher(self.journal)  # ไม่ start เรียก flush_once เองให้จับเวลาได้
+        self.flusher.register(self.sheet, self.store)
+        self.search = CaseSearchIndex()
+        self.tracking = TrackingIndex()
+        self.audit = GSheetsAuditStore(self.conn.open_spreadsheet, audit_sheet_name(self.sheet))
+        self.cache = CaseCache(lambda s: with_pending(self.store.read(columns=LIST_COLUMNS), self.journal, s), ttl=float("inf"),
+                               row_loader=lambda s, rid: self.journal.get_pending(rid) or self.store.fetch(rid))
+        for listener in (self.search, self.tracking, CaseStats()): self.cache.add_listener(listener)
+        self.ids = self.df['Report_ID'].tolist()
+
+    # --- นักเรียน ---
+    def student_submit(self):
+        # เหมือนแอป: จองเลขด้วยคีย์ฟอร์ม (ตรวจกับดัชนีติดตามผล) -> journal -> patch แคช
+        day = f"{self.year - 543 + 1}0430"
+        taken = lambda rid: any(r == rid for r, _ in self.tracking.lookup(self.sheet, rid[-4:]) or ())
+        rid = self.ledger.claim(f"bench-{self.rng.getrandbits(64):x}", day, taken)
+        row = new_submission(self.rng, self.year, rid)
+        if self.journal.enqueue(self.sheet, row): self.cache.apply_append(self.sheet, row)
+
+    def fill_journal(self):
+        for _ in range(self.flusher.batch_size): self.student_submit()
+
+    def journal_flush(self):
+        self.flusher.flush_once()
+
+    def tracking_lookup(self):
+        self.cache.get(self.sheet)
+        self.tracking.lookup(self.sheet, self.rng.choice(self.ids)[-4:])
+
+    # --- เจ้าหน้าที่ ---
+    def cold_load(self):
+        self.cache.invalidate(self.sheet)
+        self.cache.get(self.sheet)
+
+    def officer_search(self):
+        df = self.cache.get(self.sheet)
+        query = self.rng.choice([self.rng.choice(FIRST_NAMES), self.rng.choice(DETAIL_PARTS).split()[0], self.rng.choice(self.ids)[-4:]])
+        hits = self.search.search(self.sheet, query)
+        df[df.index.isin(hits)]
+
+    def pagination_rerun(self):
+        # สิ่งที่หน้ารายการทำทุก rerun: แคช hit -> แยกตามสถานะ -> กลับลำดับ -> ตัดหน้า -> วาด 5 แถว x 2 ตาราง
+        df = self.cache.get(self.sheet)
+        for part in (df[df['Status'].isin(PENDING)][::-1], df[df['Status'] == "ดำเนินการเรียบร้อย"][::-1]):
+            for _, row in part.iloc[0:5].iterrows(): (row['Report_ID'], row['Timestamp'], row['Incident_Type'], row['Status'])
+
+    def open_case(self):
+        self.cache.get_row(self.sheet, self.rng.choice(self.ids))
+
+    def case_save(self):
+        rid = self.rng.choice(self.ids)
+        row = self.cache.get_row(self.sheet, rid)
+        changes = {"Statement": f"บันทึกผล {self.rng.random():.6f}", "Status": "ดำเนินการเรียบร้อย"}
+        patch_case(self.journal, self.store, rid, changes, expected_etag=row_etag(row))
+        self.cache.apply_update(self.sheet, rid, changes)
+        self.audit.record(rid, "bench", "status", list(changes))
+
+    def case_timeline(self):
+        rid = self.rng.choice(self.ids)
+        self.audit.timeline(rid)
+        self.audit.last_updated(rid)
+
+    def full_row(self):
+        return self.df.iloc[self.rng.randrange(len(self.df))].to_dict()
+
+
+def run_size(size, args, workdir):
+    print(f"[{size}] สร้างข้อมูลสังเคราะห์...", file=sys.stderr)
+    b = Bench(size, args, workdir)
+    slow = max(3, args.repeat // 10)
+    out = {"rows": size}
+    out["officer.cold_load"] = measure(b.conn, b.cold_load, slow)
+    out["student.submit"] = measure(b.conn, b.student_submit, args.repeat)
+    out["student.journal_flush"] = measure(b.conn, b.journal_flush, slow, setup=b.fill_journal)
+    out["student.tracking"] = measure(b.conn, b.tracking_lookup, args.repeat)
+    out["officer.search"] = measure(b.conn, b.officer_search, args.repeat)
+    out["officer.pagination"] = measure(b.conn, b.pagination_rerun, args.repeat)
+    out["officer.open_case"] = measure(b.conn, b.open_case, args.repeat)
+    out["officer.case_save"] = measure(b.conn, b.case_save, args.repeat)
+    out["officer.case_timeline"] = measure(b.conn, b.case_timeline, args.repeat)
+    out["cache"] = b.cache.stats()['sheets'].get(b.sheet, {})
+    if not args.skip_pdf:
+        skipped = pdf_unavailable()
+        if skipped: out["pdf.render"] = out["pdf.cached"] = {"skipped": skipped}
+        else:
+            from pdf_engine import PDF_CACHE, render_pdf
+            out["pdf.render"] = measure(b.conn, lambda: render_pdf(b.full_row(), "bench"), slow)
+            row = b.full_row()
+            out["pdf.cached"] = measure(b.conn, lambda: PDF_CACHE.get_or_render(row, "bench"), args.repeat)
+    return out
+
+
+@functools.lru_cache(maxsize=None)
+def pdf_unavailable():
+    """เหตุผลที่วัด PDF ไม่ได้ หรือ "" — weasyprint ต้องมี pango ในเครื่อง ไม่มีจะ raise OSError ตอน import"""
+    try: import weasyprint  # noqa: F401
+    except (ImportError, OSError) as e:
+        reason = f"{type(e).__name__}: {str(e).splitlines()[0]}"
+        print(f"ข้ามชั้น PDF: {reason}", file=sys.stderr)
+        return reason
+    return ""
+
+
+def run_image(args):
+    import io
+    from image_cache import process_image
+    photo = synthetic_jpeg(4000, 3000, seed=args.seed)  # ขนาดรูปจากกล้องมือถือทั่วไป
+    samples = []
+    for _ in range(max(3, args.repeat // 10)):
+        start = time.perf_counter()
+        process_image(io.BytesIO(photo))
+        samples.append(time.perf_counter() - start)
+    return summarize(samples) | {"input_bytes": len(photo)}
+
+
+# โมดูลที่ app.py import ตอนเริ่ม (ยกเว้น streamlit) -> วัดต้นทุน cold start ใน process ใหม่ทุกครั้ง
+STARTUP_MODULES = "pandas, case_store, case_cache, case_search, case_journal, case_archive, pdf_engine, pdf_batch, image_cache, upload_pipeline"
+
+
+def run_startup(args):
+    code = f"import time; t = time.perf_counter(); import {STARTUP_MODULES}; print(time.perf_counter() - t)"
+    samples = [float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+               for _ in range(max(3, args.repeat // 10))]
+    return summarize(samples)
+
+
+def git_commit():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return ""
+
+
+def compare(old, new):
+    """พิมพ์ p50 เทียบรายงานเดิม (อัตราส่วน < 1 = เร็วขึ้น)"""
+    print(f"{'rows':>6}  {'path':<24}{'old p50':>10}{'new p50':>10}{'ratio':>8}")
+    for size, paths in new["results"].items():
+        for path, cur in paths.items():
+            prev = old.get("results", {}).get(size, {}).get(path)
+            if not isinstance(cur, dict) or "p50_ms" not in cur or not prev or "p50_ms" not in prev: continue
+            ratio = cur["p50_ms"] / prev["p50_ms"] if prev["p50_ms"] else float("inf")
+            print(f"{size:>6}  {path:<24}{prev['p50_ms']:>10.2f}{cur['p50_ms']:>10.2f}{ratio:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--latency", type=float, default=0.05, help="หน่วงต่อคำขอ Sheets (วินาที)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--images", action="store_true", help="ใส่รูป base64 ในคอลัมน์รูป")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--year", type=int, default=2568)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-pdf", action="store_true")
+    parser.add_argument("--out", default="bench_report.json")
+    parser.add_argument("--compare", help="รายงานเดิมที่จะเทียบ")
+    args = parser.parse_args(argv)
+    METRICS.log_calls = False
+
+    report = {"meta": {"started": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+                       "python": platform.python_version(), "platform": platform.platform(), "args": vars(args)},
+              "results": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes: report["results"][str(size)] = run_size(size, args, workdir)
+    report["image.process"] = run_image(args)
+    report["startup.imports"] = run_startup(args)
+    with open(args.out, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"เขียนรายงานที่ {args.out}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f: compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""สร้างตาราง Investigation_<ปี> สังเคราะห์ (ข้อความไทย, สถานที่/พิกัดจริงของโรงเรียน)
+
+ผลลัพธ์ซ้ำได้ทุกครั้งเมื่อใช้ seed เดิม Report_ID ไม่ซ้ำกันตามรูปแบบ POL-YYYYMMDD-NNNN
+"""
+import base64
+import io
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from case_options import COORD_MAP, INCIDENT_TYPES, LOCATION_OPTIONS, STATUS_OPTIONS
+from case_store import CASE_COLUMNS
+
+FIRST_NAMES = ["สมชาย", "สมหญิง", "ณัฐวุฒิ", "กิตติพงษ์", "พิมพ์ชนก", "ธนากร", "ศิริพร", "อนุชา", "ปิยะดา", "วรเชษฐ์", "จิราพร", "ภูมิพัฒน์"]
+LAST_NAMES = ["ใจดี", "ศรีสุข", "ทองคำ", "บุญมา", "แก้วประเสริฐ", "พรหมวงศ์", "สายทอง", "วงศ์ไทย", "จันทร์เพ็ญ", "มณีรัตน์"]
+CLASSES = ["ม.1/2", "ม.2/5", "ม.3/1", "ม.4/3", "ม.5/2", "ม.6/4"]
+DETAIL_PARTS = [
+    "มีนักเรียนกลุ่มหนึ่งรวมตัวกันหลังเลิกเรียน", "เห็นรุ่นพี่ข่มขู่เรียกเงินจากรุ่นน้อง", "ได้ยินเสียงทะเลาะกันเสียงดัง",
+    "พบขวดน้ำและซองบุหรี่ไฟฟ้าทิ้งไว้", "กระเป๋าสตางค์หายระหว่างคาบพละ", "มีการโพสต์ข้อความล้อเลียนในกลุ่มไลน์ห้อง",
+    "โต๊ะและเก้าอี้ถูกทำลายเสียหาย", "มีคนแปลกหน้าเดินวนเวียนบริเวณรั้วโรงเรียน", "เพื่อนถูกผลักจนล้มได้รับบาดเจ็บเล็กน้อย",
+    "เกิดเหตุช่วงพักกลางวันประมาณเที่ยงครึ่ง", "ผู้แจ้งไม่กล้าบอกครูประจำชั้นโดยตรง", "ขอให้ช่วยตรวจสอบกล้องวงจรปิด",
+]
+STATEMENT_PARTS = [
+    "เรียกคู่กรณีมาสอบถามข้อเท็จจริงแล้ว", "คู่กรณียอมรับและขอโทษ", "แจ้งผู้ปกครองทั้งสองฝ่ายทราบ",
+    "ทำบันทึกข้อตกลงไม่กระทำซ้ำ", "ส่งต่อฝ่ายแนะแนวเพื่อติดตามดูแล", "ตรวจสอบกล้องวงจรปิดไม่พบเหตุตามที่แจ้ง",
+]
+STATUS_WEIGHTS = [0.25, 0.2, 0.5, 0.05]  # ตามลำดับ STATUS_OPTIONS
+
+
+def academic_year_start(year_be):
+    """ปีการศึกษา (พ.ศ.) เริ่ม 1 พ.ค. ของปี ค.ศ. ที่ตรงกัน"""
+    return datetime(year_be - 543, 5, 1)
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(CLASSES)}"
+
+
+def synthetic_jpeg(width=1200, height=900, seed=0):
+    """รูป JPEG ที่มีสัญญาณรบกวน (บีบอัดได้ยากพอ ๆ กับภาพถ่ายจริง)"""
+    from PIL import Image
+    rng = random.Random(seed)
+    small = Image.frombytes("RGB", (width // 8, height // 8), bytes(rng.getrandbits(8) for _ in range(width // 8 * height // 8 * 3)))
+    buf = io.BytesIO()
+    small.resize((width, height)).save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def make_cases(n, year_be=2568, seed=0, images=False, image_variants=8):
+    """DataFrame n แถวตาม CASE_COLUMNS; images=True ใส่รูป base64 ใน Image_Data/Evidence_Image"""
+    rng = random.Random(seed)
+    start = academic_year_start(year_be)
+    blobs = [base64.b64encode(synthetic_jpeg(seed=seed + i)).decode() for i in range(image_variants)] if images else None
+    # เวลาแจ้งกระจายตลอดปีการศึกษา เรียงตามเวลาเหมือนแถวในชีตจริง
+    seconds = sorted(rng.randrange(365 * 24 * 3600) for _ in range(n))
+    per_day = {}
+    rows = []
+    for sec in seconds:
+        ts = start + timedelta(seconds=sec)
+        day = ts.strftime("%Y%m%d")
+        per_day[day] = per_day.get(day, 0) + 1
+        loc = rng.choice(LOCATION_OPTIONS)
+        coords = COORD_MAP.get(loc, COORD_MAP["อื่นๆ"])
+        status = rng.choices(STATUS_OPTIONS, STATUS_WEIGHTS)[0]
+        worked = status != "รอดำเนินการ"
+        rows.append({
+            "Report_ID": f"POL-{day}-{1000 + per_day[day]:04d}",
+            "Timestamp": ts.strftime("%d/%m/%Y %H:%M:%S"),
+            "Reporter": _name(rng),
+            "Incident_Type": rng.choice(INCIDENT_TYPES),
+            "Location": loc,
+            "Details": " ".join(rng.sample(DETAIL_PARTS, rng.randint(2, 5))),
+            "Status": status,
+            "Image_Data": rng.choice(blobs) if blobs and rng.random() < 0.4 else "",
+            "Audit_Log": f"Created: {ts}" + (f"\nUpdate by {rng.choice(FIRST_NAMES)}" if worked else ""),
+            "Victim": _name(rng) if worked else "",
+            "Accused": _name(rng) if worked else "",
+            "Witness": _name(rng) if worked and rng.random() < 0.5 else "",
+            "Teacher_Investigator": f"ครู{rng.choice(FIRST_NAMES)}" if worked else "",
+            "Student_Police_Investigator": _name(rng) if worked else "",
+            "Statement": " ".join(rng.sample(STATEMENT_PARTS, rng.randint(1, 3))) if worked else "",
+            "Evidence_Image": rng.choice(blobs) if blobs and worked and rng.random() < 0.2 else "",
+            "lat": round(coords["lat"] + rng.uniform(-0.0001, 0.0001), 7),
+            "lon": round(coords["lon"] + rng.uniform(-0.0001, 0.0001), 7),
+            "Security_Trace": f"IP: 10.0.{rng.randrange(256)}.{rng.randrange(256)} | Device: Mobile / Android 14 / Chrome 120",
+        })
+    return pd.DataFrame(rows, columns=CASE_COLUMNS)
+
+
+def new_submission(rng, year_be=2568, report_id=None):
+    """แถวรายงานใหม่แบบที่ฟอร์มนักเรียนสร้าง (ไม่มีรูป รูปอัปโหลดเบื้องหลัง)"""
+    loc = rng.choice(LOCATION_OPTIONS)
+    coords = COORD_MAP.get(loc, COORD_MAP["อื่นๆ"])
+    ts = academic_year_start(year_be) + timedelta(days=364, seconds=rng.randrange(86400))
+    return {
+        "Timestamp": ts.strftime("%d/%m/%Y %H:%M:%S"), "Reporter": _name(rng), "Incident_Type": rng.choice(INCIDENT_TYPES),
+        "Location": loc, "Details": " ".join(rng.sample(DETAIL_PARTS, 3)), "Status": "รอดำเนินการ",
+        "Report_ID": report_id or f"POL-{ts.strftime('%Y%m%d')}-{rng.randrange(10 ** 8):08d}",  # ยาวกว่าของจริง -> ไม่ชนกับข้อมูลสังเคราะห์
+        "Image_Data": "", "Audit_Log": f"Created: {ts}", "lat": coords["lat"], "lon": coords["lon"],
+        "Security_Trace": "IP: 10.0.0.1 | Device: Mobile / Android 14 / Chrome 120",
+    }
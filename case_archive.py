@@ -0,0 +1,96 @@
+"""คลังข้อมูลปีการศึกษาที่ปิดแล้ว (Arrow IPC ในเครื่อง)
+
+ปีที่ปิดแล้วข้อมูลไม่เปลี่ยนอีก จึง snapshot จาก Google Sheets ครั้งเดียวเก็บเป็นไฟล์ Arrow
+- <sheet>.arrow       : ทุกคอลัมน์ยกเว้นรูป (ใช้แสดงรายการ/ค้นหา/ส่งออก)
+- <sheet>.blobs.arrow : Report_ID + คอลัมน์รูป อ่านเฉพาะแถวที่เปิดดูจริง
+ไฟล์ไม่บีบอัด เปิดแบบ memory-map -> โหลดเร็วและไม่ต้องคัดลอกทั้งไฟล์เข้าแรม
+"""
+import glob
+import os
+import threading
+
+import pandas as pd
+
+from case_search import CaseSearchIndex
+from case_store import BLOB_COLUMNS, clean_report_id, prepare_case_frame
+
+ARCHIVE_KEY = "archive"  # ชื่อที่ใช้ใน CaseSearchIndex ของคลังรวมทุกปี
+
+
+def _paths(archive_dir, sheet_name):
+    base = os.path.join(archive_dir, sheet_name)
+    return base + ".arrow", base + ".blobs.arrow"
+
+
+def _write_table(df, path):
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df.astype(str), preserve_index=False)
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer: writer.write_table(table)
+    os.replace(tmp, path)  # เขียนเสร็จค่อยสลับไฟล์ ผู้อ่านจะไม่เห็นไฟล์ครึ่ง ๆ
+
+
+def _read_table(path):
+    import pyarrow as pa
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def snapshot_sheet(df, sheet_name, archive_dir):
+    """เก็บตารางของปีที่ปิดแล้วลงคลัง (เขียนทับ snapshot เดิมได้)"""
+    os.makedirs(archive_dir, exist_ok=True)
+    df = prepare_case_frame(df)
+    main_path, blob_path = _paths(archive_dir, sheet_name)
+    _write_table(df[['Report_ID'] + list(BLOB_COLUMNS)], blob_path)
+    _write_table(df.drop(columns=list(BLOB_COLUMNS)), main_path)
+    return len(df)
+
+
+class CaseArchive:
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.search_index = CaseSearchIndex()
+        self._frame = None
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def sheets(self):
+        paths = glob.glob(os.path.join(self.archive_dir, "*.arrow"))
+        return sorted(os.path.basename(p)[:-len(".arrow")] for p in paths if not p.endswith(".blobs.arrow"))
+
+    def snapshot(self, df, sheet_name):
+        n = snapshot_sheet(df, sheet_name, self.archive_dir)
+        with self._lock:
+            self._frame = None
+            self._blobs.pop(sheet_name, None)
+        return n
+
+    def frame(self):
+        """ตารางรวมทุกปีในคลัง (ไม่มีคอลัมน์รูป) พร้อมคอลัมน์ Sheet บอกปี"""
+        with self._lock:
+            if self._frame is None:
+                parts = []
+                for sheet_name in self.sheets():
+                    part = _read_table(_paths(self.archive_dir, sheet_name)[0]).to_pandas()
+                    part['Sheet'] = sheet_name
+                    parts.append(part)
+                frame = pd.concat(parts, ignore_index=True) if parts else prepare_case_frame(None).drop(columns=list(BLOB_COLUMNS)).assign(Sheet="")
+                self.search_index.rebuild(ARCHIVE_KEY, frame)
+                self._frame = frame
+            return self._frame
+
+    def search(self, query):
+        frame = self.frame()
+        hits = self.search_index.search(ARCHIVE_KEY, query)
+        return frame if hits is None else frame[frame.index.isin(hits)]
+
+    def blob(self, sheet_name, report_id, column):
+        """ค่าคอลัมน์รูปของคดีเดียว — เปิดไฟล์ blobs แบบ memory-map แล้วดึงเฉพาะแถวที่ต้องการ"""
+        import pyarrow.compute as pc
+        with self._lock:
+            table = self._blobs.get(sheet_name)
+            if table is None:
+                path = _paths(self.archive_dir, sheet_name)[1]
+                if not os.path.exists(path): return ""
+                table = self._blobs[sheet_name] = _read_table(path)
+        hit = table.filter(pc.equal(table['Report_ID'], clean_report_id(report_id)))
+        return hit[column][0].as_py() if hit.num_rows and column in hit.column_names else ""
@@ -0,0 +1,195 @@
+"""บันทึกการแก้ไขคดีแบบ append-only (แทนการต่อข้อความในเซลล์ Audit_Log)
+
+แต่ละเหตุการณ์ = Report_ID, เวลา, ผู้ทำ, การกระทำ, คอลัมน์ที่เปลี่ยน เก็บในตาราง/ชีตของตัวเอง
+- บันทึกคดีไม่ต้องเขียนทับเซลล์ที่ยาวขึ้นเรื่อย ๆ อีก (เพิ่มแถวเดียวต่อเหตุการณ์)
+- timeline ของคดีอ่านจากดัชนีตาม Report_ID -> เวลาขึ้นกับจำนวนเหตุการณ์ของคดีนั้นเท่านั้น
+- "อัปเดตล่าสุด" ของทุกคดีเก็บเป็น dict ในหน่วยความจำ ใช้ได้ทั้งหน้ารายการ/รายละเอียด/PDF
+เซลล์ Audit_Log เดิมยังอยู่ (อ่านอย่างเดียว) legacy_events แปลงเป็นเหตุการณ์ให้แสดงต่อท้าย timeline ได้
+ของที่โหลดไว้ในหน่วยความจำหมดอายุตาม ttl -> เหตุการณ์ที่ process อื่นบันทึกจะเห็นในรอบถัดไป
+record_or_defer: เขียนไม่สำเร็จ -> เก็บเหตุการณ์ลง journal ให้ JournalFlusher ส่งซ้ำ ไม่หายไปเฉย ๆ
+"""
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import pytz
+
+from case_store import clean_report_id
+from metrics import log_event
+
+AUDIT_COLUMNS = ['Report_ID', 'Timestamp', 'Actor', 'Action', 'Fields']
+TIME_FORMAT = "%d/%m/%Y %H:%M:%S"  # รูปแบบเดียวกับคอลัมน์ Timestamp ของรายงาน
+
+AuditEvent = namedtuple("AuditEvent", "report_id timestamp actor action fields")
+
+
+def audit_sheet_name(case_sheet):
+    """Investigation_2568 -> AuditLog_2568 (แยกตามปีการศึกษาเหมือนตารางคดี)"""
+    return case_sheet.replace("Investigation_", "AuditLog_", 1)
+
+
+def now_th():
+    return datetime.now(pytz.timezone('Asia/Bangkok')).strftime(TIME_FORMAT)
+
+
+def _fields(text):
+    return tuple(f for f in str(text or "").split(", ") if f)
+
+
+def legacy_events(report_id, audit_log):
+    """ข้อความในเซลล์ Audit_Log แบบเก่า -> [AuditEvent] (เวลาไม่รู้ = "")"""
+    events = []
+    for line in str(audit_log or "").split("\n"):
+        line = line.strip()
+        if not line: continue
+        if line.startswith("Created:"): events.append(AuditEvent(report_id, line[len("Created:"):].strip()[:19], "", "created", ()))
+        elif line.startswith("Update by "): events.append(AuditEvent(report_id, "", line[len("Update by "):], "update", ()))
+        elif line.startswith("[") and "]" in line: events.append(AuditEvent(report_id, line[1:line.index("]")], "", line[line.index("]") + 1:].strip(), ()))
+        else: events.append(AuditEvent(report_id, "", "", line, ()))
+    return events
+
+
+def record_or_defer(audit, journal, sheet, report_id, actor, action, fields=()):
+    """บันทึกเหตุการณ์ทันที ถ้าไม่สำเร็จเก็บลง journal (flusher ส่งซ้ำให้) — คืน True ถ้าถึงที่เก็บแล้ว"""
+    event = AuditEvent(clean_report_id(report_id), now_th(), str(actor), str(action), tuple(fields))
+    try:
+        audit.record(**event._asdict())
+        return True
+    except Exception as e:
+        journal.enqueue_audit(sheet, event._asdict())
+        log_event("audit.deferred", report_id=event.report_id, action=event.action, error=f"{type(e).__name__}: {e}")
+        return False
+
+
+class AuditStore:
+    """อินเทอร์เฟซกลางของที่เก็บเหตุการณ์ — backend ต้องมี _write, timeline, _load_latest"""
+
+    def __init__(self, ttl=120):
+        self.ttl = ttl
+        self._latest = None  # Report_ID -> เวลาของเหตุการณ์ล่าสุด (โหลดครั้งแรกที่ถูกขอ)
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def record(self, report_id, actor, action, fields=(), timestamp=None):
+        event = AuditEvent(clean_report_id(report_id), timestamp or now_th(), str(actor), str(action), tuple(fields))
+        with self._lock:
+            self._write(event)
+            # dict ใหม่ ไม่แก้ตัวที่ session อื่นถืออยู่
+            if self._latest is not None: self._latest = self._latest | {event.report_id: event.timestamp}
+        return event
+
+    def timeline(self, report_id):
+        """[AuditEvent] ของคดีเดียว เรียงตามลำดับที่บันทึก"""
+        raise NotImplementedError
+
+    def last_updated(self, report_id):
+        return self.last_updated_map().get(clean_report_id(report_id), "")
+
+    def last_updated_map(self):
+        """dict Report_ID -> เวลาอัปเดตล่าสุด (ใช้ร่วมกัน ห้ามแก้)"""
+        with self._lock:
+            self._expire()
+            if self._latest is None:
+                self._latest = self._load_latest()
+                self._mark_loaded()
+            return self._latest
+
+    def invalidate(self):
+        with self._lock: self._drop()
+
+    # เรียกภายใต้ _lock ทั้งสามตัว
+    def _expire(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at >= self.ttl: self._drop()
+
+    def _mark_loaded(self):
+        if self._loaded_at is None: self._loaded_at = time.monotonic()
+
+    def _drop(self):
+        self._latest = self._loaded_at = None
+
+    def _write(self, event):
+        raise NotImplementedError
+
+    def _load_latest(self):
+        raise NotImplementedError
+
+
+class GSheetsAuditStore(AuditStore):
+    """ชีต AuditLog_<ปี> แยกจากชีตคดี: append ทีละแถว, อ่านทั้งชีตครั้งเดียวแล้วทำดัชนีในหน่วยความจำ"""
+
+    def __init__(self, open_book, worksheet, ttl=120):
+        super().__init__(ttl)
+        self._open_book = open_book  # fn() -> gspread Spreadsheet
+        self.worksheet = worksheet
+        self._book = None
+        self._ws = None
+        self._events = None  # Report_ID -> [AuditEvent]
+
+    def _sheet(self, create=False):
+        """ชีตเหตุการณ์ หรือ None ถ้ายังไม่มี — สร้างเฉพาะตอนบันทึก (create=True) แค่เปิดดูคดีไม่สร้างชีต"""
+        if self._ws is None:
+            from gspread.exceptions import WorksheetNotFound
+            if self._book is None: self._book = self._open_book()
+            try: self._ws = self._book.worksheet(self.worksheet)
+            except WorksheetNotFound:
+                if not create: return None
+                self._ws = self._book.add_worksheet(self.worksheet, rows=1000, cols=len(AUDIT_COLUMNS))
+                self._ws.append_row(AUDIT_COLUMNS)
+        return self._ws
+
+    def _index(self):
+        self._expire()
+        if self._events is None:
+            ws = self._sheet()
+            events = {}
+            for values in (ws.get_all_values()[1:] if ws else ()):
+                values = values + [""] * (len(AUDIT_COLUMNS) - len(values))
+                rid = clean_report_id(values[0])
+                events.setdefault(rid, []).append(AuditEvent(rid, values[1], values[2], values[3], _fields(values[4])))
+            self._events = events
+            self._mark_loaded()
+        return self._events
+
+    def _write(self, event):
+        self._sheet(create=True).append_rows([[event.report_id, event.timestamp, event.actor, event.action, ", ".join(event.fields)]],
+                                  value_input_option="RAW", table_range="A1")
+        if self._events is not None: self._events[event.report_id] = self._events.get(event.report_id, []) + [event]
+
+    def timeline(self, report_id):
+        with self._lock: return list(self._index().get(clean_report_id(report_id), ()))
+
+    def _load_latest(self):
+        return {rid: evs[-1].timestamp for rid, evs in self._index().items() if evs}
+
+    def _drop(self):
+        super()._drop()
+        self._events = None
+
+
+class SQLiteAuditStore(AuditStore):
+    """ตารางเหตุการณ์ใน SQLite มีดัชนี (report_id, seq)"""
+
+    def __init__(self, path, table, ttl=120):
+        super().__init__(ttl)
+        self.table = table
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f'''CREATE TABLE IF NOT EXISTS "{table}" (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id TEXT NOT NULL, ts TEXT NOT NULL, actor TEXT, action TEXT, fields TEXT)''')
+        self._db.execute(f'CREATE INDEX IF NOT EXISTS "{table}_rid" ON "{table}" (report_id, seq)')
+
+    def _write(self, event):
+        self._db.execute(f'INSERT INTO "{self.table}" (report_id, ts, actor, action, fields) VALUES (?, ?, ?, ?, ?)',
+                         [event.report_id, event.timestamp, event.actor, event.action, ", ".join(event.fields)])
+
+    def timeline(self, report_id):
+        with self._lock:
+            cur = self._db.execute(f'SELECT report_id, ts, actor, action, fields FROM "{self.table}" WHERE report_id = ? ORDER BY seq',
+                                   [clean_report_id(report_id)])
+            return [AuditEvent(r, ts, a, act, _fields(f)) for r, ts, a, act, f in cur]
+
+    def _load_latest(self):
+        cur = self._db.execute(f'SELECT report_id, ts FROM "{self.table}" WHERE seq IN (SELECT MAX(seq) FROM "{self.table}" GROUP BY report_id)')
+        return dict(cur.fetchall())
@@ -0,0 +1,173 @@
+"""แคชตารางรายงานร่วมทั้ง process (ทุก session ใช้ชุดเดียวกัน)
+
+ข้อมูลแบ่งเป็นสองชั้น
+- ชั้นรายการ: ตารางเบา (to_index_frame) สำหรับรายการ/ค้นหา/แบ่งหน้า หมดอายุตาม TTL
+  ข้อความยาว ๆ ใช้สร้างดัชนีของ listener ตอนโหลดแล้วทิ้ง ไม่เก็บค้างใน DataFrame
+- ชั้นรายละเอียด: ทุกคอลัมน์ของคดีเดียว (รายละเอียด/ผลสอบสวน/รูป) โหลดเมื่อเปิดดูคดีนั้น
+  เก็บใน LRU ขนาดจำกัด หมดอายุตาม TTL เดียวกัน (เห็นการแก้จาก process อื่น/ในชีตเอง)
+  คดีที่หาไม่พบก็จำไว้ด้วย -> เลขที่ไม่มีในชีตปัจจุบันไม่ถูก fetch ซ้ำทุก rerun
+
+เมื่อแอปเขียนเอง (ส่งรายงาน/บันทึกคดี) จะ patch ทั้งสองชั้นทันที ไม่ต้องโหลดทั้งชีตใหม่
+การโหลดชีตทำนอก lock (ชีตเดียวกันโหลดทีละคน) -> โหลดช้าไม่ขวางการส่งรายงาน/เปิดคดี
+patch ที่เกิดระหว่างโหลดถูกจดไว้แล้วเล่นซ้ำบนตารางใหม่ ไม่หาย
+ตัวนับ hit/miss ไว้ดูว่าแคชได้ผลแค่ไหน
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from case_store import CASE_COLUMNS, clean_report_id, prepare_case_frame, set_index_value, to_index_frame
+
+
+class CaseCache:
+    def __init__(self, loader, ttl=120, row_loader=None, max_rows=64):
+        self._loader = loader  # fn(sheet_name) -> DataFrame ชั้นรายการจาก store
+        self._row_loader = row_loader  # fn(sheet_name, report_id) -> dict ทุกคอลัมน์ หรือ None
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._entries = {}  # sheet_name -> [index_df, loaded_at]
+        self._rows = OrderedDict()  # (sheet_name, report_id) -> (dict หรือ None = ไม่พบ, loaded_at)
+        self._lock = threading.RLock()
+        self._loading = {}  # sheet_name -> Lock ของการโหลด (single-flight)
+        self._replay = {}  # sheet_name -> [(method, args)] patch ที่เกิดระหว่างกำลังโหลด
+        self._generation = 0  # เพิ่มทุก invalidate -> ผลโหลดที่เริ่มก่อนหน้านั้นไม่ถูกเก็บ
+        self._listeners = []
+        self.hits = 0
+        self.misses = 0
+        self.row_hits = 0
+        self.row_misses = 0
+        self.patches = 0
+        self.invalidations = 0
+
+    def add_listener(self, listener):
+        """listener ต้องมี rebuild(sheet, df) และ upsert(sheet, label, old_row, new_row)
+
+        rebuild ได้ตารางเต็มชั้นรายการ (มีข้อความครบ) ส่วน upsert ได้แถวเบา + คอลัมน์ที่เปลี่ยน
+        """
+        self._listeners.append(listener)
+
+    def _fresh(self, sheet):
+        entry = self._entries.get(sheet)
+        if entry and time.monotonic() - entry[1] < self.ttl:
+            self.hits += 1
+            return entry[0]
+        return None
+
+    def get(self, sheet):
+        # DataFrame ที่คืนไปใช้ร่วมกันทุก session -> ห้ามแก้ในที่ (อ่านอย่างเดียว)
+        with self._lock:
+            idx = self._fresh(sheet)
+            if idx is not None: return idx
+            gate = self._loading.setdefault(sheet, threading.Lock())
+        with gate:
+            with self._lock:
+                idx = self._fresh(sheet)  # อีก session โหลดเสร็จระหว่างรอ
+                if idx is not None: return idx
+                self.misses += 1
+                self._replay[sheet] = []
+                generation = self._generation
+            try:
+                df = prepare_case_frame(self._loader(sheet))
+                idx = to_index_frame(df)
+            except Exception:
+                with self._lock: self._replay.pop(sheet, None)
+                raise
+            with self._lock:
+                replay = self._replay.pop(sheet, [])
+                if generation != self._generation: return idx  # ถูก invalidate ระหว่างโหลด -> ใช้รอบนี้ ไม่เก็บ
+                for listener in self._listeners: listener.rebuild(sheet, df)
+                self._entries[sheet] = [idx, time.monotonic()]
+                for method, args in replay: method(sheet, *args)
+                return self._entries[sheet][0]
+
+    def get_row(self, sheet, report_id):
+        """ทุกคอลัมน์ของคดีเดียว (dict ใช้ร่วมกัน ห้ามแก้) หรือ None ถ้าไม่พบ"""
+        key = (sheet, clean_report_id(report_id))
+        with self._lock:
+            entry = self._rows.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._rows.move_to_end(key)
+                self.row_hits += 1
+                return entry[0]
+            self.row_misses += 1
+        row = self._row_loader(sheet, key[1]) if self._row_loader else None
+        if row is not None:
+            row = {c: "" for c in CASE_COLUMNS} | {k: ("" if pd.isna(v) else v) for k, v in row.items()}
+            row['Report_ID'] = key[1]
+        with self._lock: self._remember(key, row)
+        return row
+
+    def _remember(self, key, row):
+        self._rows[key] = (row, time.monotonic())
+        self._rows.move_to_end(key)
+        while len(self._rows) > self.max_rows: self._rows.popitem(last=False)
+
+    def invalidate(self, sheet=None):
+        with self._lock:
+            if sheet is None:
+                self._entries.clear(); self._rows.clear()
+            else:
+                self._entries.pop(sheet, None)
+                for key in [k for k in self._rows if k[0] == sheet]: del self._rows[key]
+            self._generation += 1
+            self.invalidations += 1
+
+    def apply_append(self, sheet, row):
+        with self._lock:
+            rid = clean_report_id(row.get('Report_ID', ''))
+            full = {c: "" for c in CASE_COLUMNS} | dict(row) | {'Report_ID': rid}
+            self._remember((sheet, rid), full)
+            if sheet in self._replay: self._replay[sheet].append((self.apply_append, (row,)))
+            entry = self._entries.get(sheet)
+            if not entry: return  # ยังไม่เคยโหลด -> ครั้งหน้าโหลดใหม่ก็ได้แถวนี้อยู่แล้ว
+            idx = entry[0]
+            if (idx['Report_ID'] == rid).any(): return  # ตารางที่เพิ่งโหลดมีแถวนี้แล้ว (เล่นซ้ำหลังโหลด)
+            label = idx.index.max() + 1 if len(idx) else 0
+            new = to_index_frame(pd.DataFrame([full], index=[label]))
+            # copy-on-write: session อื่นที่ถือ df เดิมอยู่จะไม่เห็นข้อมูลครึ่ง ๆ กลาง ๆ
+            idx = pd.concat([idx, new])
+            for col in new.select_dtypes("category").columns: idx[col] = idx[col].astype("category")
+            entry[0] = idx
+            self.patches += 1
+            for listener in self._listeners: listener.upsert(sheet, label, None, full)
+
+    def apply_update(self, sheet, report_id, changes):
+        with self._lock:
+            rid = clean_report_id(report_id)
+            cached = self._rows.get((sheet, rid))
+            if cached is not None:
+                # dict ใหม่แทนการแก้ในที่: session อื่นที่ถือ dict เดิมอยู่ไม่เห็นค่าเปลี่ยนกลางการวาดหน้า
+                if cached[0] is None: del self._rows[(sheet, rid)]
+                else: self._rows[(sheet, rid)] = (cached[0] | dict(changes), cached[1])
+            if sheet in self._replay: self._replay[sheet].append((self.apply_update, (report_id, changes)))
+            entry = self._entries.get(sheet)
+            if not entry: return
+            idx = entry[0]
+            labels = idx.index[idx['Report_ID'] == rid]
+            if len(labels) == 0:
+                self._entries.pop(sheet, None)  # ไม่เจอในแคช -> ทิ้งแล้วโหลดใหม่รอบหน้า
+                return
+            label = labels[0]
+            old = idx.loc[label].to_dict()
+            idx = idx.copy()
+            for col, val in changes.items():
+                if col in idx.columns: set_index_value(idx, label, col, val)
+            entry[0] = idx
+            self.patches += 1
+            new = idx.loc[label].to_dict() | dict(changes)
+            for listener in self._listeners: listener.upsert(sheet, label, old, new)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            now = time.monotonic()
+            return {
+                "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "row_hits": self.row_hits, "row_misses": self.row_misses,
+                "patches": self.patches, "invalidations": self.invalidations,
+                "sheets": {s: {"rows": len(df), "bytes": int(df.memory_usage(deep=True).sum()), "age_s": round(now - t, 1)}
+                           for s, (df, t) in self._entries.items()},
+            }
@@ -0,0 +1,68 @@
+"""ส่งออกรายการคดีเป็น CSV / XLSX สำหรับรายงานฝ่ายบริหาร
+
+- ไม่มีคอลัมน์รูป (base64/ลิงก์) และไม่มี IP/อุปกรณ์ของผู้แจ้ง
+- เขียนทีละช่วง (chunk) จาก generator -> ไม่ต้องสร้างตารางผลลัพธ์ทั้งก้อนในหน่วยความจำ
+- ปลายทางเป็น SpooledTemporaryFile: ไฟล์ใหญ่จะล้นลงดิสก์แทนการกินแรม
+- กันสูตรใน Excel/Sheets (ค่าที่ขึ้นต้นด้วย = + - @ ถูกเติม ' นำหน้า)
+"""
+import csv
+import io
+import tempfile
+
+from metrics import timed, timed_import
+
+EXPORT_COLUMNS = ['Report_ID', 'Timestamp', 'Last_Updated', 'Reporter', 'Incident_Type', 'Location', 'Details', 'Status',
+    'Victim', 'Accused', 'Witness', 'Teacher_Investigator', 'Student_Police_Investigator', 'Statement', 'Sheet']
+CHUNK_ROWS = 500
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+MIME = {"csv": "text/csv", "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+
+
+def iter_records(df, chunk_rows=CHUNK_ROWS):
+    """DataFrame -> dict ทีละแถว แปลงทีละ chunk (ไม่ to_dict ทั้งตารางในครั้งเดียว)"""
+    for start in range(0, len(df), chunk_rows):
+        yield from df.iloc[start:start + chunk_rows].to_dict("records")
+
+
+def _safe(value):
+    if value is None: return ""
+    text = str(value)
+    if text == "nan": return ""
+    return "'" + text if text.startswith(("=", "+", "-", "@")) else text
+
+
+def iter_csv(rows, columns=EXPORT_COLUMNS, chunk_rows=CHUNK_ROWS):
+    """คืน bytes ของ CSV (UTF-8) ทีละ chunk — BOM ให้ผู้เรียกเขียนเองถ้าจะเปิดด้วย Excel"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    pending = 1
+    for row in rows:
+        writer.writerow([_safe(row.get(c)) for c in columns])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0); buf.truncate(); pending = 0
+    if pending: yield buf.getvalue().encode("utf-8")
+
+
+def write_xlsx(rows, out, columns=EXPORT_COLUMNS):
+    """XLSX แบบ write-only ของ openpyxl (เขียนแถวลงไฟล์ชั่วคราวทันที ไม่เก็บ cell ทั้งชีตไว้)"""
+    wb = timed_import("openpyxl").Workbook(write_only=True)
+    ws = wb.create_sheet("Cases")
+    ws.append(columns)
+    for row in rows: ws.append([_safe(row.get(c)) for c in columns])
+    wb.save(out)
+
+
+def export_cases(rows, fmt="csv", columns=EXPORT_COLUMNS):
+    """rows = iterable ของ dict -> ไฟล์ (SpooledTemporaryFile) ที่ seek(0) แล้ว"""
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    with timed(f"export.{fmt}") as m:
+        if fmt == "xlsx": write_xlsx(rows, out, columns)
+        else:
+            out.write(b"\xef\xbb\xbf")  # BOM -> Excel อ่านภาษาไทยถูก
+            for chunk in iter_csv(rows, columns): out.write(chunk)
+        m["bytes"] = out.tell()
+    out.seek(0)
+    return out
@@ -0,0 +1,359 @@
+"""สมุดบันทึกล่วงหน้า (write-ahead journal) ของรายงานที่ยังไม่ถึง Google Sheets
+
+นักเรียนกดส่ง -> เขียนลง SQLite ในเครื่อง (WAL + synchronous=FULL) เสร็จก็ตอบกลับทันที
+JournalFlusher (เธรดเบื้องหลัง) ทยอยส่งแถวที่ค้างไปชีตเป็นชุด ลองซ้ำแบบ backoff เมื่อ
+Sheets ช้า/ติดโควตา และกันส่งซ้ำด้วย Report_ID — รายงานจึงไม่หายแม้ Sheets ล่ม
+ความล้มเหลวแยกรายชีตและรายแถว: แถวที่ส่งไม่ผ่านถูกเลื่อนรอบของตัวเองออกไป (backoff) ไม่ขวางแถวหลัง ๆ
+ลองครบ max_attempts แล้วเป็น dead-letter (หยุดลองเอง ยังแสดงในรายการ) จนกว่า flusher จะเริ่มใหม่
+เหตุการณ์ audit ที่บันทึกไม่สำเร็จตอนแก้คดี (record_or_defer) ก็ค้างไว้ที่นี่ (audit_outbox) ให้ flusher ส่งซ้ำ
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from case_store import ConflictError, clean_report_id, row_etag
+from metrics import log_event
+
+
+def _error_text(e):
+    return f"{type(e).__name__}: {e}"
+
+
+class CaseJournal:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS journal (
+            report_id TEXT PRIMARY KEY, sheet TEXT NOT NULL, payload TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT,
+            created_at REAL NOT NULL, flushed_at REAL, next_at REAL NOT NULL DEFAULT 0, dead_at REAL,
+            patched TEXT NOT NULL DEFAULT '[]')""")
+        # journal.db จากรุ่นก่อน
+        self._add_columns("journal", {"next_at": "REAL NOT NULL DEFAULT 0", "dead_at": "REAL", "patched": "TEXT NOT NULL DEFAULT '[]'"})
+        self._db.execute("CREATE INDEX IF NOT EXISTS journal_pending ON journal (sheet, flushed_at)")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS uploads (
+            report_id TEXT PRIMARY KEY, sheet TEXT NOT NULL, filename TEXT NOT NULL, data BLOB, url TEXT,
+            last_error TEXT, created_at REAL NOT NULL, done_at REAL, failed_at REAL)""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS audit_outbox (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT, sheet TEXT NOT NULL, payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, created_at REAL NOT NULL,
+            next_at REAL NOT NULL DEFAULT 0, sent_at REAL)""")
+
+    def _add_columns(self, table, columns):
+        have = {r[1] for r in self._db.execute(f'PRAGMA table_info("{table}")')}
+        for name, decl in columns.items():
+            if name not in have: self._db.execute(f'ALTER TABLE "{table}" ADD COLUMN {name} {decl}')
+
+    def enqueue(self, sheet, row, upload=None):
+        """บันทึกรายงานใหม่ (ส่งซ้ำด้วย Report_ID เดิมจะถูกเมิน) คืน True ถ้าเป็นแถวใหม่
+
+        upload = (filename, bytes) ของรูป -> ลงตาราง uploads ใน transaction เดียวกับแถว (มีแถวก็มีรูปเสมอ)
+        """
+        rid, now = clean_report_id(row['Report_ID']), time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                cur = self._db.execute("INSERT OR IGNORE INTO journal (report_id, sheet, payload, created_at) VALUES (?, ?, ?, ?)",
+                                       [rid, sheet, json.dumps(row, ensure_ascii=False, default=str), now])
+                if upload:
+                    self._db.execute("INSERT OR IGNORE INTO uploads (report_id, sheet, filename, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                                     [rid, sheet, upload[0], upload[1], now])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            return cur.rowcount == 1
+
+    def pending(self, sheet=None, limit=None, due=False):
+        """[(report_id, sheet, row, version, attempts), ...] ที่ยังไม่ถึงชีต เรียงตามเวลาส่ง
+
+        due=True เฉพาะแถวที่ถึงรอบลองส่งแล้ว (ไม่รวมแถวที่รอ backoff และ dead-letter)
+        """
+        sql = "SELECT report_id, sheet, payload, version, attempts FROM journal WHERE flushed_at IS NULL"
+        args = []
+        if sheet is not None: sql += " AND sheet = ?"; args.append(sheet)
+        if due: sql += " AND dead_at IS NULL AND next_at <= ?"; args.append(time.time())
+        sql += " ORDER BY created_at"
+        if limit: sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [(rid, sh, json.loads(p), v, a) for rid, sh, p, v, a in self._db.execute(sql, args)]
+
+    def has_pending(self):
+        with self._lock:
+            return (self._db.execute("SELECT 1 FROM journal WHERE flushed_at IS NULL LIMIT 1").fetchone() is not None
+                    or self._db.execute("SELECT 1 FROM audit_outbox WHERE sent_at IS NULL LIMIT 1").fetchone() is not None)
+
+    def get_pending(self, report_id):
+        """payload ของแถวที่ยังค้าง หรือ None ถ้าไม่มี/ส่งถึงชีตแล้ว"""
+        with self._lock:
+            found = self._db.execute("SELECT payload FROM journal WHERE report_id = ? AND flushed_at IS NULL", [clean_report_id(report_id)]).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def patch_pending(self, report_id, changes, expected_etag=None):
+        """แก้ payload ของแถวที่ยังค้าง คืน False ถ้าแถวนั้นถึงชีตแล้ว (ให้ไปแก้ที่ store แทน)"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                found = self._db.execute("SELECT payload, patched FROM journal WHERE report_id = ? AND flushed_at IS NULL",
+                                         [clean_report_id(report_id)]).fetchone()
+                if found is None:
+                    self._db.execute("COMMIT")
+                    return False
+                row = json.loads(found[0])
+                if expected_etag and row_etag(row) != expected_etag: raise ConflictError(report_id)
+                row.update(changes)
+                # จดคอลัมน์ที่ถูกแก้: แถวที่ถึงชีตไปแล้วส่งซ้ำเฉพาะคอลัมน์เหล่านี้ (ไม่เขียนทับทั้งแถวแบบ RAW)
+                patched = list(dict.fromkeys(json.loads(found[1]) + list(changes)))
+                self._db.execute("UPDATE journal SET payload = ?, patched = ?, version = version + 1 WHERE report_id = ?",
+                                 [json.dumps(row, ensure_ascii=False, default=str), json.dumps(patched), clean_report_id(report_id)])
+                self._db.execute("COMMIT")
+                return True
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def patched_keys(self, report_id):
+        with self._lock:
+            found = self._db.execute("SELECT patched FROM journal WHERE report_id = ?", [clean_report_id(report_id)]).fetchone()
+        return json.loads(found[0]) if found else []
+
+    def mark_attempt(self, report_ids):
+        with self._lock:
+            self._db.executemany("UPDATE journal SET attempts = attempts + 1 WHERE report_id = ?", [[r] for r in report_ids])
+
+    def mark_flushed(self, flushed):
+        """flushed = [(report_id, version)] — แถวที่ถูก patch ระหว่างส่ง (version เปลี่ยน) จะยังค้างไว้ส่งรอบหน้า"""
+        with self._lock:
+            self._db.executemany("UPDATE journal SET flushed_at = ?, last_error = NULL WHERE report_id = ? AND version = ?",
+                                 [[time.time(), r, v] for r, v in flushed])
+
+    def mark_failed(self, report_id, error, retry_in=0.0, dead=False):
+        """เลื่อนแถวนี้ไปลองใหม่อีก retry_in วินาที; dead=True -> หยุดลองอัตโนมัติ (dead-letter)"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE journal SET last_error = ?, next_at = ?, dead_at = ? WHERE report_id = ?",
+                             [_error_text(error)[:500], now + retry_in, now if dead else None, report_id])
+
+    def revive(self):
+        """dead-letter กลับมาลองส่งใหม่ (เรียกตอน flusher เริ่ม) คืนจำนวนแถว"""
+        with self._lock:
+            return self._db.execute("UPDATE journal SET dead_at = NULL, next_at = 0 WHERE flushed_at IS NULL AND dead_at IS NOT NULL").rowcount
+
+    # --- รูปที่รออัปโหลด: bytes ลงดิสก์ก่อนตอบนักเรียนว่าสำเร็จ -> รีสตาร์ตแล้วยังอัปโหลดต่อได้ ---
+    def enqueue_upload(self, sheet, report_id, filename, data):
+        with self._lock:
+            cur = self._db.execute("INSERT OR IGNORE INTO uploads (report_id, sheet, filename, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                                   [clean_report_id(report_id), sheet, filename, data, time.time()])
+            return cur.rowcount == 1
+
+    def upload_pending(self, report_id):
+        """รูปของคดีนี้ยังรออัปโหลด (ยังไม่เสร็จและยังไม่ถูกตัดว่าล้มเหลว)"""
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM uploads WHERE report_id = ? AND done_at IS NULL AND failed_at IS NULL",
+                                    [clean_report_id(report_id)]).fetchone() is not None
+
+    def pending_uploads(self):
+        """[(report_id, sheet, filename, data, url), ...] ที่ยังไม่เสร็จและยังไม่ถูกตัดว่าล้มเหลว"""
+        with self._lock:
+            return self._db.execute("""SELECT report_id, sheet, filename, data, url FROM uploads
+                WHERE done_at IS NULL AND failed_at IS NULL ORDER BY created_at""").fetchall()
+
+    def set_upload_url(self, report_id, url):
+        # อัปโหลดแล้วแต่ยัง patch ชีตไม่ได้ -> รอบหน้าใช้ลิงก์นี้ ไม่อัปโหลดซ้ำใน Drive
+        with self._lock: self._db.execute("UPDATE uploads SET url = ? WHERE report_id = ?", [url, clean_report_id(report_id)])
+
+    def mark_uploaded(self, report_id):
+        with self._lock:
+            self._db.execute("UPDATE uploads SET done_at = ?, data = NULL, last_error = NULL WHERE report_id = ?",
+                             [time.time(), clean_report_id(report_id)])
+
+    def mark_upload_failed(self, report_id, error):
+        # เก็บ bytes ไว้ (ไม่ลบ) เผื่อกู้คืนเอง
+        with self._lock:
+            self._db.execute("UPDATE uploads SET failed_at = ?, last_error = ? WHERE report_id = ?",
+                             [time.time(), _error_text(error)[:500], clean_report_id(report_id)])
+
+    # --- เหตุการณ์ audit ที่ยังส่งไม่ถึงที่เก็บ (payload = kwargs ของ AuditStore.record) ---
+    def enqueue_audit(self, sheet, event):
+        with self._lock:
+            self._db.execute("INSERT INTO audit_outbox (sheet, payload, created_at) VALUES (?, ?, ?)",
+                             [sheet, json.dumps(event, ensure_ascii=False, default=str), time.time()])
+
+    def pending_audit(self, sheet, limit=None):
+        """[(seq, event, attempts), ...] ที่ถึงรอบลองส่งแล้ว เรียงตามลำดับที่เกิด"""
+        sql = "SELECT seq, payload, attempts FROM audit_outbox WHERE sent_at IS NULL AND sheet = ? AND next_at <= ? ORDER BY seq"
+        if limit: sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [(seq, json.loads(p), a) for seq, p, a in self._db.execute(sql, [sheet, time.time()])]
+
+    def mark_audit_sent(self, seq):
+        with self._lock: self._db.execute("UPDATE audit_outbox SET sent_at = ?, last_error = NULL WHERE seq = ?", [time.time(), seq])
+
+    def mark_audit_failed(self, seq, error, retry_in=0.0):
+        with self._lock:
+            self._db.execute("UPDATE audit_outbox SET attempts = attempts + 1, last_error = ?, next_at = ? WHERE seq = ?",
+                             [_error_text(error)[:500], time.time() + retry_in, seq])
+
+    def purge(self, older_than_s=7 * 24 * 3600):
+        with self._lock:
+            self._db.execute("DELETE FROM journal WHERE flushed_at IS NOT NULL AND flushed_at < ?", [time.time() - older_than_s])
+            self._db.execute("DELETE FROM uploads WHERE done_at IS NOT NULL AND done_at < ?", [time.time() - older_than_s])
+            self._db.execute("DELETE FROM audit_outbox WHERE sent_at IS NOT NULL AND sent_at < ?", [time.time() - older_than_s])
+
+    def stats(self):
+        with self._lock:
+            pending, dead, oldest = self._db.execute(
+                "SELECT COUNT(*), COUNT(dead_at), MIN(created_at) FROM journal WHERE flushed_at IS NULL").fetchone()
+            flushed = self._db.execute("SELECT COUNT(*) FROM journal WHERE flushed_at IS NOT NULL").fetchone()[0]
+            uploads, failed = self._db.execute("SELECT COUNT(*) - COUNT(failed_at), COUNT(failed_at) FROM uploads WHERE done_at IS NULL").fetchone()
+            audit = self._db.execute("SELECT COUNT(*) FROM audit_outbox WHERE sent_at IS NULL").fetchone()[0]
+        return {"pending": pending, "dead": dead, "flushed": flushed, "oldest_pending_s": round(time.time() - oldest, 1) if oldest else 0.0,
+                "uploads": uploads, "uploads_failed": failed, "audit_pending": audit}
+
+
+def with_pending(df, journal, sheet):
+    """ต่อแถวที่ยังค้างใน journal (ยังไม่ถึงชีต) ท้ายตาราง ไม่ให้หายจากหน้ารายการ/ติดตามผล"""
+    import pandas as pd
+    pending = [row for _, _, row, _, _ in journal.pending(sheet)]
+    if not pending: return df
+    known = set(df['Report_ID'].map(clean_report_id)) if 'Report_ID' in df.columns else set()
+    pending = [row for row in pending if clean_report_id(row['Report_ID']) not in known]
+    return pd.concat([df, pd.DataFrame(pending)], ignore_index=True) if pending else df
+
+
+def patch_case(journal, store, report_id, changes, expected_etag=None):
+    """แก้คดีเดียว: ถ้ายังค้างใน journal แก้ที่ journal ไม่งั้นแก้ที่ store โดยตรง"""
+    if not journal.patch_pending(report_id, changes, expected_etag):
+        store.update(report_id, changes, expected_etag=expected_etag)
+
+
+class JournalFlusher(threading.Thread):
+    def __init__(self, journal, batch_size=50, interval=2.0, max_backoff=300.0, max_attempts=50, purge_every=3600.0):
+        super().__init__(name="journal-flusher", daemon=True)
+        self.journal = journal
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts  # ลองครบแล้วเป็น dead-letter (backoff สูงสุด 300 วินาที -> ราว 4 ชั่วโมง)
+        self.purge_every = purge_every
+        self._stores = {}  # sheet -> CaseStore (ลงทะเบียนจากเธรดหลักของแอป)
+        self._audits = {}  # sheet -> AuditStore สำหรับส่งเหตุการณ์ใน audit_outbox
+        self._purgers = [journal.purge]  # งานเก็บกวาดที่ทำทุก purge_every วินาที
+        self._wake = threading.Event()
+        self.flushed = 0
+        self.errors = 0
+        self.dead = 0
+
+    def register(self, sheet, store, audit=None):
+        self._stores[sheet] = store
+        if audit is not None: self._audits[sheet] = audit
+
+    def add_purger(self, fn):
+        self._purgers.append(fn)
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self):
+        revived = self.journal.revive()
+        if revived: log_event("journal.revive", level=logging.INFO, rows=revived)
+        delay = self.interval
+        last_purge = None
+        while True:
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                while self.flush_once() >= self.batch_size: pass  # ค้างเยอะ -> ส่งต่อเนื่องจนหมด
+                delay = self.interval
+            except Exception as e:
+                # ข้อผิดพลาดรายชีต/รายแถวถูกจัดการใน flush_once แล้ว ที่หลุดมาถึงนี่คือตัว journal เอง (เช่นดิสก์เต็ม)
+                self.errors += 1
+                delay = min(max(delay, self.interval) * 2, self.max_backoff)
+                log_event("journal.flush", level=logging.ERROR, error=_error_text(e), retry_in_s=delay)
+            if last_purge is None or time.monotonic() - last_purge >= self.purge_every:
+                last_purge = time.monotonic()
+                self.purge()
+
+    def purge(self):
+        for fn in list(self._purgers):
+            try: fn()
+            except Exception as e: log_event("journal.purge", error=_error_text(e))
+
+    def flush_once(self):
+        """ส่งแถวที่ถึงรอบแล้วชีตละไม่เกิน batch_size แถว คืนจำนวนแถวมากสุดที่ส่งสำเร็จในชีตเดียว"""
+        most = 0
+        for sheet, store in list(self._stores.items()):
+            # ชีตหนึ่งล้ม (เช่นชีตถูกลบ/ไม่มีสิทธิ์) ไม่หยุดชีตอื่น
+            try: most = max(most, self._flush_sheet(sheet, store))
+            except Exception as e:
+                self.errors += 1
+                log_event("journal.flush", sheet=sheet, error=_error_text(e))
+        for sheet, audit in list(self._audits.items()):
+            most = max(most, self._flush_audit(sheet, audit))
+        return most
+
+    def _flush_audit(self, sheet, audit):
+        sent = 0
+        for seq, event, attempts in self.journal.pending_audit(sheet, limit=self.batch_size):
+            try: audit.record(**event)
+            except Exception as e:
+                retry_in = min(self.interval * 2 ** (attempts + 1), self.max_backoff)
+                self.journal.mark_audit_failed(seq, e, retry_in)
+                self.errors += 1
+                log_event("journal.audit_failed", sheet=sheet, report_id=event.get("report_id"), attempts=attempts + 1,
+                          retry_in_s=retry_in, error=_error_text(e))
+                break  # ที่เก็บเดียวกัน ตัวหนึ่งล้มตัวถัดไปก็น่าจะล้ม -> รอรอบหน้า
+            self.journal.mark_audit_sent(seq)
+            sent += 1
+        return sent
+
+    def _flush_sheet(self, sheet, store):
+        items = self.journal.pending(sheet, limit=self.batch_size, due=True)
+        if not items: return 0
+        # แถวที่เคยลองส่งแล้วอาจถึงชีตไปแล้ว (ล่มก่อน mark) -> เช็กก่อน เพื่อไม่ให้เกิดแถวซ้ำ
+        existing = store.existing_ids() if any(a > 0 for *_, a in items) else set()
+        self.journal.mark_attempt([rid for rid, *_ in items])
+        try:
+            self._write(store, items, existing)
+            done = items
+        except Exception as e:
+            if len(items) == 1:
+                self._failed(sheet, items[0], e)
+                return 0
+            # ทั้งชุดล้ม -> ลองทีละแถว แถวที่มีปัญหาถูกเลื่อนรอบออกไปเอง ไม่ขวางแถวอื่น
+            # อ่าน Report_ID ใหม่ก่อน: ชุดที่ล้มอาจ append ไปแล้วบางส่วน (ล้มตอน update)
+            existing = store.existing_ids()
+            done = []
+            for item in items:
+                try:
+                    self._write(store, [item], existing)
+                    done.append(item)
+                except Exception as row_error:
+                    self._failed(sheet, item, row_error)
+        if done:
+            self.journal.mark_flushed([(rid, v) for rid, _, _, v, _ in done])
+            self.flushed += len(done)
+        return len(done)
+
+    def _write(self, store, items, existing):
+        new = [row for rid, _, row, _, _ in items if rid not in existing]
+        if new: store.append_many(new)
+        # ถึงชีตแล้วแต่มีการ patch ระหว่างทาง -> เขียนเฉพาะคอลัมน์ที่ถูก patch (ค่าอื่นคือที่ append ไว้แบบ USER_ENTERED แล้ว)
+        for rid, _, row, _, _ in items:
+            if rid not in existing: continue
+            keys = [k for k in self.journal.patched_keys(rid) if k in row and k != 'Report_ID']
+            if keys: store.update(rid, {k: row[k] for k in keys})
+
+    def _failed(self, sheet, item, error):
+        rid, attempts = item[0], item[4] + 1  # รวมครั้งนี้
+        dead = attempts >= self.max_attempts
+        retry_in = min(self.interval * 2 ** attempts, self.max_backoff)
+        self.journal.mark_failed(rid, error, retry_in, dead)
+        self.errors += 1
+        if dead: self.dead += 1
+        log_event("journal.dead_letter" if dead else "journal.row_failed", level=logging.ERROR if dead else logging.WARNING,
+                  sheet=sheet, report_id=rid, attempts=attempts, retry_in_s=None if dead else retry_in, error=_error_text(error))
@@ -0,0 +1,29 @@
+"""ตัวเลือกในฟอร์มแจ้งเหตุ/หน้าเจ้าหน้าที่ และพิกัดของสถานที่ในโรงเรียน"""
+
+LOCATION_OPTIONS = ["อาคาร 1", "อาคาร 2", "อาคาร 3", "อาคาร 4", "อาคาร 5", "หอประชุมเทาทอง", "หอประชุมไทรทอง", "อาคารไฟฟ้าสนามฟุตบอล", "สนามบาส", "โรงอาหาร", "สนามปิงปอง", "สวนหลังห้องปกครอง", "สวนสนามเปตอง", "สวนเกษตร", "สวนหลังไทรทอง", "ห้องน้ำโรงอาหารติดอาคาร 4", "ห้องน้ำโรงอาหารติดประตูโรงอาหาร", "ห้องน้ำหลังอาคาร 3", "ห้องน้ำอาคารไฟฟ้า", "ห้องน้ำหลังอาคาร 5", "อื่นๆ"]
+INCIDENT_TYPES = ["ทะเลาะวิวาท/ทำร้ายร่างกาย", "สารเสพติด/บุหรี่ไฟฟ้า", "พกพาอาวุธ", "ลักทรัพย์/ทำลายทรัพย์", "บูลลี่/Cyberbully", "ล่วงละเมิดทางเพศ", "ความรุนแรงในครอบครัว", "อื่นๆ"]
+STATUS_OPTIONS = ["รอดำเนินการ", "อยู่ระหว่างการดำเนินการ", "ดำเนินการเรียบร้อย", "ยกเลิก"]
+
+# สร้างตารางอ้างอิงพิกัด (ตัวเลขสมมติ คุณนำพิกัดจริงมาเปลี่ยนได้เลย)
+COORD_MAP = {
+    "อาคาร 1": {"lat": 16.293080624461656, "lon": 103.97334404257019},
+    "อาคาร 2": {"lat": 16.29279814390506, "lon": 103.97334845175875},
+    "อาคาร 3": {"lat": 16.292547130677022, "lon": 103.9742885660193},
+    "อาคาร 4": {"lat": 16.292464708883504, "lon": 103.97328212630455},
+    "อาคาร 5": {"lat": 16.29409615213189, "lon": 103.97431743733651},
+    "หอประชุมเทาทอง": {"lat": 16.2933910148143, "lon": 103.97435250954894},
+    "หอประชุมไทรทอง": {"lat": 16.292976522262947, "lon": 103.97455635743196},
+    "อาคารไฟฟ้าสนามฟุตบอล": {"lat": 16.29471891331982, "lon": 103.97219748923851},
+    "สนามบาส": {"lat": 16.294180437912743, "lon": 103.97201431305878},
+    "โรงอาหาร": {"lat": 16.292685117630384, "lon": 103.97202378933812},
+    "สนามปิงปอง": {"lat": 16.293241855058024, "lon": 103.97291845970389},
+    "สวนหลังห้องปกครอง": {"lat": 16.29356823258865, "lon": 103.97472900714698},
+    "สนามเปตอง": {"lat": 16.29400957119914, "lon": 103.97312938272556},
+    "สวนเกษตร": {"lat": 16.294127310210936, "lon": 103.97369507232361},
+    "สวนหลังไทรทอง": {"lat": 16.29297281083706, "lon": 103.9741158275382},
+    "ห้องน้ำโรงอาหาารติดอาคาร4": {"lat": 16.292463682879095, "lon": 103.97264722383926},
+    "ห้องน้ำหลังอาคาร3": {"lat": 16.292126722514713, "lon": 103.97403520772245},
+    "ห้องน้ำอาคารไฟฟ้า": {"lat": 16.29465819963838, "lon": 103.97237918736676},
+    "ห้องน้ำหลังอาคาร5": {"lat": 16.293816914880985, "lon": 103.97437580456852},
+    "อื่นๆ": {"lat": 16.293596638838643, "lon": 103.97250289339189} # พิกัดกลางโรงเรียน
+}
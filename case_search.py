@@ -0,0 +1,108 @@
+"""ดัชนีค้นหาคดี (แทนการ apply ทีละแถวทุกคอลัมน์)
+
+- ไม่รวมคอลัมน์รูป base64 (BLOB_COLUMNS) ที่ใหญ่และค้นไม่ได้ความหมาย
+- ต่อข้อความทุกคอลัมน์ของแต่ละคดีเป็นข้อความเดียว ทำ NFC + casefold ไว้ล่วงหน้า
+- inverted index ของ token -> ชุด label แถว
+
+ภาษาไทยไม่เว้นวรรคระหว่างคำ จึงตัด token ที่ช่องว่าง/เครื่องหมายเท่านั้น
+(สระ/วรรณยุกต์ไทยเป็น combining mark ห้ามใช้ \\w ตัด) แล้วค้นแบบ substring
+ใน vocabulary ซึ่งเล็กกว่าข้อความทั้งหมดมาก ผลลัพธ์จึงเหมือน str.contains เดิมทุกประการ
+"""
+import re
+import threading
+import unicodedata
+from functools import reduce
+
+from case_store import BLOB_COLUMNS
+
+_SPLIT_RE = re.compile(r"[\s\.,;:!?()\[\]{}\"'/\\|<>=+*&^%$#@~`_\-]+")
+_SEP = "\x1f"  # unit separator: ไม่มีในข้อความจริง จึงแยกกลับเป็นรายคอลัมน์ได้ (และนับเป็นช่องว่างตอนตัด token)
+
+
+def normalize_text(text):
+    return unicodedata.normalize("NFC", str(text)).casefold()
+
+
+def tokenize(text):
+    return {t for t in _SPLIT_RE.split(text) if t}
+
+
+class _SheetIndex:
+    def __init__(self):
+        self.text = {}  # label -> ข้อความรวมที่ normalize แล้ว
+        self.postings = {}  # token -> set(label)
+        self.memo = {}  # query token -> set(label) (ล้างเมื่อข้อมูลเปลี่ยน)
+
+    def add(self, label, text):
+        self.text[label] = text
+        for tok in tokenize(text): self.postings.setdefault(tok, set()).add(label)
+
+    def remove(self, label):
+        text = self.text.pop(label, None)
+        if text is None: return
+        for tok in tokenize(text):
+            labels = self.postings.get(tok)
+            if labels is None: continue
+            labels.discard(label)
+            if not labels: del self.postings[tok]
+
+    def lookup(self, tok):
+        hit = self.memo.get(tok)
+        if hit is None:
+            hit = set(self.postings.get(tok, ()))
+            for vocab, labels in self.postings.items():
+                if tok in vocab and vocab != tok: hit |= labels
+            self.memo[tok] = hit
+        return hit
+
+
+def _row_text(row, columns, old_text=None):
+    # แถวที่ patch มาอาจมีไม่ครบทุกคอลัมน์ -> คอลัมน์ที่ไม่มีใช้ค่าเดิมจากข้อความเก่า
+    old = old_text.split(_SEP) if old_text is not None else [""] * len(columns)
+    return _SEP.join(normalize_text(row[c]) if c in row else prev for c, prev in zip(columns, old))
+
+
+class CaseSearchIndex:
+    """ลงทะเบียนเป็น listener ของ CaseCache -> สร้างใหม่ตอนโหลด, อัปเดตรายแถวตอน patch"""
+
+    def __init__(self):
+        self._sheets = {}
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def rebuild(self, sheet, df):
+        columns = [c for c in df.columns if c not in BLOB_COLUMNS]
+        idx = _SheetIndex()
+        if len(df):
+            # ต่อสตริงแบบ vectorized ทั้งคอลัมน์ ไม่วนทีละแถว
+            joined = reduce(lambda a, b: a + _SEP + b, (df[c].astype(str) for c in columns))
+            for label, text in joined.str.normalize("NFC").str.casefold().items(): idx.add(label, text)
+        with self._lock:
+            self._sheets[sheet] = idx
+            self._columns[sheet] = columns
+
+    def upsert(self, sheet, label, old_row, new_row):
+        with self._lock:
+            idx = self._sheets.get(sheet)
+            if idx is None: return
+            text = _row_text(new_row, self._columns[sheet], idx.text.get(label) if old_row is not None else None)
+            idx.remove(label)
+            idx.add(label, text)
+            idx.memo.clear()
+
+    def search(self, sheet, query):
+        """คืน set ของ label ที่ข้อความมี query (ไม่สนตัวพิมพ์) หรือ None ถ้ายังไม่มีดัชนีของชีตนี้"""
+        q = normalize_text(query).strip()
+        with self._lock:
+            idx = self._sheets.get(sheet)
+            if idx is None: return None
+            if not q: return set(idx.text)
+            toks = sorted(tokenize(q), key=len, reverse=True)
+            if not toks: return {label for label, text in idx.text.items() if q in text}
+            found = None
+            for tok in toks:
+                found = idx.lookup(tok) if found is None else found & idx.lookup(tok)
+                if not found: return set()
+            # query หลายคำ/มีเครื่องหมาย -> ตรวจวลีเต็มซ้ำเฉพาะแถวที่ผ่านดัชนี
+            if len(toks) > 1 or toks[0] != q: found = {label for label in found if q in idx.text[label]}
+            return found
@@ -0,0 +1,67 @@
+"""ตัวนับสถิติเหตุการณ์แบบ incremental สำหรับแดชบอร์ด
+
+group-by ทั้งตารางครั้งเดียวตอนแคชโหลด หลังจากนั้นทุกการส่งรายงาน/บันทึกคดี
+จะปรับตัวนับเฉพาะแถวที่เปลี่ยน (ลบค่าเก่า + บวกค่าใหม่) หน้าแดชบอร์ดจึงอ่านตัวนับได้ทันที
+"""
+import threading
+from collections import Counter
+from datetime import datetime
+
+from case_store import parse_timestamps
+
+DIMENSIONS = ('type', 'location', 'status', 'day', 'hour', 'coord')
+
+
+def _coord(lat, lon):
+    try: lat, lon = round(float(lat), 6), round(float(lon), 6)
+    except (TypeError, ValueError): return None
+    return (lat, lon) if lat and lon else None
+
+
+def _row_keys(row):
+    try: ts = datetime.strptime(str(row.get('Timestamp', '')), "%d/%m/%Y %H:%M:%S")
+    except ValueError: ts = None
+    return {
+        'type': str(row.get('Incident_Type', '')), 'location': str(row.get('Location', '')),
+        'status': str(row.get('Status', '')),
+        'day': ts.strftime("%Y-%m-%d") if ts else None, 'hour': ts.hour if ts else None,
+        'coord': _coord(row.get('lat'), row.get('lon')),
+    }
+
+
+class CaseStats:
+    def __init__(self):
+        self._sheets = {}  # sheet -> {dimension: Counter}
+        self._lock = threading.Lock()
+
+    def rebuild(self, sheet, df):
+        agg = {d: Counter() for d in DIMENSIONS}
+        if len(df):
+            agg['type'].update(df['Incident_Type'].astype(str).value_counts().to_dict())
+            agg['location'].update(df['Location'].astype(str).value_counts().to_dict())
+            agg['status'].update(df['Status'].astype(str).value_counts().to_dict())
+            ts = parse_timestamps(df['Timestamp']).dropna()
+            agg['day'].update(ts.dt.strftime("%Y-%m-%d").value_counts().to_dict())
+            agg['hour'].update({int(h): n for h, n in ts.dt.hour.value_counts().items()})
+            for (lat, lon), n in df.groupby(['lat', 'lon']).size().items():
+                c = _coord(lat, lon)
+                if c: agg['coord'][c] += n
+        with self._lock: self._sheets[sheet] = agg
+
+    def upsert(self, sheet, label, old_row, new_row):
+        with self._lock:
+            agg = self._sheets.get(sheet)
+            if agg is None: return
+            if old_row is not None:
+                for d, k in _row_keys(old_row).items():
+                    if k is None: continue
+                    agg[d][k] -= 1
+                    if agg[d][k] <= 0: del agg[d][k]
+            for d, k in _row_keys(new_row).items():
+                if k is not None: agg[d][k] += 1
+
+    def snapshot(self, sheet):
+        """สำเนาตัวนับทุกมิติ ({dimension: Counter}) หรือ None ถ้ายังไม่มีข้อมูลของชีตนี้"""
+        with self._lock:
+            agg = self._sheets.get(sheet)
+            return {d: Counter(c) for d, c in agg.items()} if agg is not None else None
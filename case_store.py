@@ -0,0 +1,347 @@
+"""ชั้นจัดเก็บข้อมูลรายงาน (Case Store)
+
+แยกการอ่าน/เขียนตาราง Investigation_<ปี> ออกจากหน้า UI
+- GSheetsCaseStore : ของจริง เขียนแบบ append ทีละแถว (ไม่ rewrite ทั้งชีต)
+- SQLiteCaseStore  : ตัวแทนในเครื่อง สำหรับทดสอบ/พัฒนาโดยไม่ต้องต่อ Google Sheets
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+
+import pandas as pd
+
+from metrics import instrument, timed
+
+CASE_COLUMNS = ['Report_ID', 'Timestamp', 'Reporter', 'Incident_Type', 'Location', 'Details', 'Status', 'Image_Data', 'Audit_Log',
+    'Victim', 'Accused', 'Witness', 'Teacher_Investigator', 'Student_Police_Investigator', 'Statement', 'Evidence_Image',
+    'lat', 'lon', 'Security_Trace']
+
+# คอลัมน์รูปภาพ (base64/ลิงก์) ขนาดใหญ่ ไม่ใช้ค้นหา/สรุปสถิติ
+BLOB_COLUMNS = ('Image_Data', 'Evidence_Image')
+
+# ชั้นรายการ (list tier): อ่านทุกคอลัมน์ยกเว้นรูป -> ใช้สร้างดัชนีค้นหา/สถิติ แล้วเก็บไว้เฉพาะ INDEX_COLUMNS
+LIST_COLUMNS = [c for c in CASE_COLUMNS if c not in BLOB_COLUMNS]
+INDEX_COLUMNS = ['Report_ID', 'Timestamp', 'Incident_Type', 'Location', 'Status', 'lat', 'lon']
+CATEGORY_COLUMNS = ['Incident_Type', 'Location', 'Status']
+
+# คอลัมน์ที่เจ้าหน้าที่แก้ได้ -> ใช้คำนวณ ETag ตรวจการแก้ไขชนกัน
+ETAG_COLUMNS = ['Victim', 'Accused', 'Witness', 'Teacher_Investigator', 'Student_Police_Investigator', 'Statement', 'Status', 'Audit_Log']
+
+
+class ConflictError(Exception):
+    """แถวถูกแก้โดยคนอื่นหลังจากที่เปิดอ่าน (ETag ไม่ตรง)"""
+
+
+def clean_report_id(value):
+    # ชีตบางครั้งคืนค่าเป็น float -> ตัด .0 ท้ายออก
+    return re.sub(r'\.0$', '', str(value)).strip()
+
+
+def prepare_case_frame(df):
+    """เติมคอลัมน์ที่ขาด + แทนค่าว่าง + ทำความสะอาด Report_ID (ทำครั้งเดียวตอนโหลด)"""
+    if df is None or df.empty: df = pd.DataFrame(columns=CASE_COLUMNS)
+    else: df = df.copy()
+    for col in CASE_COLUMNS:
+        if col not in df.columns: df[col] = ""
+    df = df.fillna("")
+    df['Report_ID'] = df['Report_ID'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
+    return df.reset_index(drop=True)
+
+
+def parse_timestamps(series):
+    # Timestamp ในชีตเป็นรูปแบบ dd/mm/YYYY HH:MM:SS (เวลาไทย)
+    return pd.to_datetime(series.astype(str), format="%d/%m/%Y %H:%M:%S", errors="coerce")
+
+
+def to_index_frame(df):
+    """ตารางเบาสำหรับรายการ/ค้นหา/แบ่งหน้า: เฉพาะ INDEX_COLUMNS, สถานะ/ประเภท/สถานที่เป็น category, เวลาแปลงแล้ว"""
+    idx = df[INDEX_COLUMNS].copy()
+    for col in CATEGORY_COLUMNS: idx[col] = idx[col].astype(str).astype("category")
+    idx['Submitted'] = parse_timestamps(idx['Timestamp'])
+    return idx
+
+
+def set_index_value(idx, label, col, value):
+    # คอลัมน์ category ต้องเพิ่มหมวดก่อนจึงจะใส่ค่าใหม่ได้
+    if col in CATEGORY_COLUMNS:
+        value = str(value)
+        if value not in idx[col].cat.categories: idx[col] = idx[col].cat.add_categories([value])
+    idx.at[label, col] = value
+    if col == 'Timestamp': idx.at[label, 'Submitted'] = parse_timestamps(pd.Series([value])).iloc[0]
+
+
+def filter_cases(df, statuses=None, date_from=None, date_to=None, incident_types=None):
+    """กรองตาม สถานะ / ช่วงวันที่แจ้ง (date, รวมปลายทั้งสองข้าง) / ประเภทเหตุ — ค่า None = ไม่กรอง"""
+    mask = pd.Series(True, index=df.index)
+    if statuses: mask &= df['Status'].isin(statuses)
+    if incident_types: mask &= df['Incident_Type'].isin(incident_types)
+    if date_from or date_to:
+        days = (df['Submitted'] if 'Submitted' in df.columns else parse_timestamps(df['Timestamp'])).dt.date
+        if date_from: mask &= days >= date_from
+        if date_to: mask &= days <= date_to
+    return df[mask]
+
+
+def _cell(value):
+    if value is None: return ""
+    try:
+        if pd.isna(value): return ""
+    except (TypeError, ValueError): pass
+    return value
+
+
+def row_etag(row):
+    """hash ของค่าที่แก้ได้ในแถว — ค่าเดียวกันไม่ว่าจะอ่านจาก DataFrame หรือจากเซลล์ในชีต"""
+    # ตัด .0 เฉพาะ Report_ID (ชีตคืนเป็น float ได้) ข้อความอิสระ "1.0" กับ "1" ต้องถือว่าต่างกัน
+    raw = "\x1f".join(clean_report_id(_cell(row.get(c, ""))) if c == 'Report_ID' else str(_cell(row.get(c, ""))).strip()
+                       for c in ETAG_COLUMNS)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class CaseStore:
+    """อินเทอร์เฟซกลางของที่เก็บรายงาน — ทุก backend ต้องมีเมธอดเหล่านี้"""
+
+    def read(self, columns=None):
+        """คืน DataFrame ของทั้งตาราง หรือเฉพาะ columns (ไม่ต้องดาวน์โหลดคอลัมน์รูป)"""
+        raise NotImplementedError
+
+    def fetch(self, report_id):
+        """คืนทุกคอลัมน์ของคดีเดียวเป็น dict หรือ None ถ้าไม่พบ"""
+        raise NotImplementedError
+
+    def append(self, row):
+        """เพิ่มรายงานใหม่ 1 แถว (dict) ต่อท้ายตาราง โดยไม่แตะแถวเดิม"""
+        raise NotImplementedError
+
+    def append_many(self, rows):
+        """เพิ่มหลายแถวในครั้งเดียว (backend ที่ทำเป็นชุดได้ควร override)"""
+        for row in rows: self.append(row)
+
+    def existing_ids(self):
+        """set ของ Report_ID ทั้งหมดในตาราง (อ่านเฉพาะคอลัมน์เดียว)"""
+        raise NotImplementedError
+
+    def update(self, report_id, changes, expected_etag=None):
+        """แก้เฉพาะเซลล์ใน changes ของแถวที่ Report_ID ตรงกัน แล้วคืน ETag ใหม่
+
+        ถ้าให้ expected_etag แล้วแถวปัจจุบันไม่ตรง -> ConflictError (ไม่เขียนทับ)
+        ไม่พบ Report_ID -> KeyError
+        """
+        raise NotImplementedError
+
+
+def open_spreadsheet(settings):
+    """gspread Spreadsheet จากค่าใน [connections.gsheets] ของ secrets (service account + spreadsheet URL/key)
+
+    ใช้ API สาธารณะของ gspread แทน conn.client._open_spreadsheet() ที่เป็นของภายในของ st-gsheets-connection
+    """
+    import gspread
+    settings = dict(settings)
+    target = str(settings.pop("spreadsheet"))
+    settings.pop("worksheet", None)
+    client = gspread.service_account_from_dict(settings)
+    return client.open_by_url(target) if target.startswith("http") else client.open_by_key(target)
+
+
+class GSheetsCaseStore(CaseStore):
+    """เขียนผ่าน Sheets API values.append โดยตรง
+
+    values.append ทำงานฝั่งเซิร์ฟเวอร์แบบ atomic นักเรียนสองคนที่ส่งพร้อมกัน
+    จะได้คนละแถวเสมอ และต้นทุนการส่งไม่ขึ้นกับจำนวนแถวในชีต
+    conn ใช้อ่านทั้งตาราง ส่วน open_book() -> gspread Spreadsheet ใช้อ่าน/เขียนรายแถว
+    """
+
+    def __init__(self, conn, worksheet, open_book):
+        self.conn = conn
+        self.worksheet = worksheet
+        self._open_book = open_book
+        self._ws = None
+        self._header = None
+        self._row_hint = {}  # Report_ID -> เลขแถวในชีต (ใช้กับการแก้ไขรายแถว)
+        self._lock = threading.Lock()
+
+    def _sheet(self):
+        if self._ws is None:
+            self._ws = self._open_book().worksheet(self.worksheet)
+        return self._ws
+
+    def _ensure_header(self, keys):
+        ws = self._sheet()
+        if self._header is None: self._header = ws.row_values(1)
+        missing = [k for k in keys if k not in self._header]
+        if missing:
+            # คอลัมน์ใหม่ (เช่น Security_Trace) -> ต่อท้ายหัวตาราง
+            from gspread.utils import rowcol_to_a1
+            start = len(self._header) + 1
+            need = start + len(missing) - 1
+            if ws.col_count < need: ws.add_cols(need - ws.col_count)
+            ws.batch_update([{"range": rowcol_to_a1(1, start), "values": [missing]}])
+            self._header = self._header + missing
+        return self._header
+
+    @instrument("sheets.read", rows=len)
+    def read(self, columns=None):
+        if columns is not None: return self._read_columns(columns)
+        df = self.conn.read(worksheet=self.worksheet, ttl="0")
+        if df is None: raise ConnectionError("ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
+        with self._lock:
+            self._header = None
+            self._row_hint = {}
+            if 'Report_ID' in df.columns:
+                for pos, rid in enumerate(df['Report_ID']):
+                    self._row_hint.setdefault(clean_report_id(rid), pos + 2)
+        return df
+
+    def _read_columns(self, columns):
+        # batch_get เฉพาะช่วงคอลัมน์ที่ต้องการในคำขอเดียว -> ไม่ดาวน์โหลดรูป base64 เลย
+        from gspread.utils import rowcol_to_a1
+        with self._lock:
+            self._header = self._sheet().row_values(1)
+            cols = [c for c in columns if c in self._header]
+            letters = [rowcol_to_a1(1, self._header.index(c) + 1)[:-1] for c in cols]
+            ranges = self._sheet().batch_get([f"{l}2:{l}" for l in letters]) if cols else []
+            data = {c: [r[0] if r else "" for r in vr] for c, vr in zip(cols, ranges)}
+            n = max((len(v) for v in data.values()), default=0)
+            df = pd.DataFrame({c: v + [""] * (n - len(v)) for c, v in data.items()}, columns=cols)
+            self._row_hint = {}
+            if 'Report_ID' in df.columns:
+                for pos, rid in enumerate(df['Report_ID']): self._row_hint.setdefault(clean_report_id(rid), pos + 2)
+        return df[(df != "").any(axis=1)] if len(df) else df
+
+    @instrument("sheets.fetch")
+    def fetch(self, report_id):
+        with self._lock:
+            header = self._ensure_header([])
+            try: _, values = self._locate(report_id, header)
+            except KeyError: return None
+            return dict(zip(header, values + [""] * (len(header) - len(values))))
+
+    def append(self, row):
+        self.append_many([row])
+
+    def append_many(self, rows):
+        if not rows: return
+        with self._lock:
+            header = self._ensure_header(list(dict.fromkeys(k for row in rows for k in row)))
+            values = [[_cell(row.get(h, "")) for h in header] for row in rows]
+            with timed("sheets.append") as m:
+                m["rows"] = len(values)
+                resp = self._sheet().append_rows(values, value_input_option="USER_ENTERED", table_range="A1")
+            first = re.search(r'![A-Z]+(\d+)', (resp or {}).get("updates", {}).get("updatedRange", ""))
+            if first:
+                for offset, row in enumerate(rows): self._row_hint[clean_report_id(row.get('Report_ID', ''))] = int(first.group(1)) + offset
+
+    @instrument("sheets.existing_ids", rows=len)
+    def existing_ids(self):
+        with self._lock:
+            header = self._ensure_header([])
+            col = self._sheet().col_values(header.index('Report_ID') + 1)
+            for row_no, value in enumerate(col[1:], start=2): self._row_hint.setdefault(clean_report_id(value), row_no)
+            return {clean_report_id(v) for v in col[1:]}
+
+    def _locate(self, report_id, header):
+        ws = self._sheet()
+        rid = clean_report_id(report_id)
+        rid_col = header.index('Report_ID')
+        row_no = self._row_hint.get(rid)
+        if row_no:
+            values = ws.row_values(row_no)
+            if len(values) > rid_col and clean_report_id(values[rid_col]) == rid: return row_no, values
+        # hint พลาด (มีคนแทรก/ลบแถวในชีตเอง) -> ค้นจากคอลัมน์ Report_ID คอลัมน์เดียว
+        for row_no, value in enumerate(ws.col_values(rid_col + 1)[1:], start=2):
+            if clean_report_id(value) == rid:
+                self._row_hint[rid] = row_no
+                return row_no, ws.row_values(row_no)
+        raise KeyError(report_id)
+
+    @instrument("sheets.update")
+    def update(self, report_id, changes, expected_etag=None):
+        """ตรวจ ETag แล้วเขียนภายใต้ lock ของ process นี้เท่านั้น
+
+        Sheets ไม่มี compare-and-set ฝั่งเซิร์ฟเวอร์: อีก process หรือคนที่แก้ในชีตเองระหว่างอ่าน-เขียน
+        ยังเขียนทับกันได้ (ต่างจาก SQLiteCaseStore ที่ล็อกด้วย BEGIN IMMEDIATE)
+        เขียนแบบ RAW -> ข้อความของเจ้าหน้าที่ไม่ถูกแปลงเป็นตัวเลข/วันที่ หรือถูกตีความเป็นสูตร
+        """
+        from gspread.utils import rowcol_to_a1
+        with self._lock:
+            header = self._ensure_header(list(changes))
+            row_no, values = self._locate(report_id, header)
+            current = dict(zip(header, values + [""] * (len(header) - len(values))))
+            if expected_etag and row_etag(current) != expected_etag: raise ConflictError(report_id)
+            cols = [col for col, val in changes.items() if str(current.get(col, "")) != str(_cell(val))]
+            if cols:
+                resp = self._sheet().batch_update(
+                    [{"range": rowcol_to_a1(row_no, header.index(col) + 1), "values": [[_cell(changes[col])]]} for col in cols],
+                    value_input_option="RAW", include_values_in_response=True, response_value_render_option="FORMATTED_VALUE")
+                # ETag จากค่าที่ชีตเก็บจริง (แบบเดียวกับที่ row_values อ่านได้รอบหน้า) ไม่ใช่จาก changes
+                for col, result in zip(cols, (resp or {}).get("responses", [])):
+                    stored = (result.get("updatedData") or {}).get("values") or [[]]
+                    current[col] = stored[0][0] if stored[0] else ""
+            return row_etag(current)
+
+
+class SQLiteCaseStore(CaseStore):
+    """ตัวแทนในเครื่อง: หนึ่งตาราง SQLite ต่อหนึ่งชีต"""
+
+    def __init__(self, path, table):
+        self.table = table
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        cols = ", ".join(f'"{c}"' for c in CASE_COLUMNS)
+        self._db.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({cols})')
+
+    def _columns(self):
+        return [r[1] for r in self._db.execute(f'PRAGMA table_info("{self.table}")')]
+
+    @instrument("sqlite.read", rows=len)
+    def read(self, columns=None):
+        with self._lock:
+            select = "*" if columns is None else ", ".join(f'"{c}"' for c in columns if c in self._columns())
+            return pd.read_sql_query(f'SELECT {select} FROM "{self.table}" ORDER BY rowid', self._db)
+
+    @instrument("sqlite.fetch")
+    def fetch(self, report_id):
+        with self._lock:
+            cur = self._db.execute(f'SELECT * FROM "{self.table}" WHERE "Report_ID" = ? ORDER BY rowid LIMIT 1', [clean_report_id(report_id)])
+            found = cur.fetchone()
+            return dict(zip([d[0] for d in cur.description], found)) if found else None
+
+    @instrument("sqlite.append")
+    def append(self, row):
+        with self._lock:
+            cols = self._columns()
+            for k in row:
+                if k not in cols: self._db.execute(f'ALTER TABLE "{self.table}" ADD COLUMN "{k}"')
+            keys = list(row)
+            names = ", ".join(f'"{k}"' for k in keys)
+            marks = ", ".join("?" for _ in keys)
+            self._db.execute(f'INSERT INTO "{self.table}" ({names}) VALUES ({marks})', [_cell(row[k]) for k in keys])
+
+    def existing_ids(self):
+        with self._lock:
+            return {clean_report_id(r[0]) for r in self._db.execute(f'SELECT "Report_ID" FROM "{self.table}"')}
+
+    @instrument("sqlite.update")
+    def update(self, report_id, changes, expected_etag=None):
+        with self._lock:
+            cols = self._columns()
+            for k in changes:
+                if k not in cols: self._db.execute(f'ALTER TABLE "{self.table}" ADD COLUMN "{k}"')
+            # BEGIN IMMEDIATE = ล็อกเขียนก่อนตรวจ ETag -> compare-and-set จริงแม้มีหลาย process
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                cur = self._db.execute(f'SELECT rowid, * FROM "{self.table}" WHERE "Report_ID" = ? ORDER BY rowid LIMIT 1', [clean_report_id(report_id)])
+                found = cur.fetchone()
+                if found is None: raise KeyError(report_id)
+                current = dict(zip([d[0] for d in cur.description][1:], found[1:]))
+                if expected_etag and row_etag(current) != expected_etag: raise ConflictError(report_id)
+                sets = ", ".join(f'"{k}" = ?' for k in changes)
+                self._db.execute(f'UPDATE "{self.table}" SET {sets} WHERE rowid = ?', [_cell(v) for v in changes.values()] + [found[0]])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            current.update(changes)
+            return row_etag(current)
@@ -0,0 +1,37 @@
+"""ดัชนีติดตามสถานะสำหรับนักเรียน: เลข 4 ตัวท้าย -> (Report_ID, Status)
+
+เป็น listener ของ CaseCache เหมือน CaseSearchIndex การค้นแต่ละครั้งจึงเป็น dict lookup
+ไม่ต้องดาวน์โหลดทั้งชีตและไม่ต้องสแกน str.endswith ทุกแถว
+"""
+import threading
+
+SUFFIX_LEN = 4
+
+
+class TrackingIndex:
+    def __init__(self):
+        self._sheets = {}  # sheet -> {suffix: {label: (report_id, status)}}
+        self._lock = threading.Lock()
+
+    def rebuild(self, sheet, df):
+        idx = {}
+        for label, rid, status in zip(df.index, df['Report_ID'].astype(str), df['Status'].astype(str)):
+            idx.setdefault(rid[-SUFFIX_LEN:], {})[label] = (rid, status)
+        with self._lock: self._sheets[sheet] = idx
+
+    def upsert(self, sheet, label, old_row, new_row):
+        with self._lock:
+            idx = self._sheets.get(sheet)
+            if idx is None: return
+            if old_row is not None:
+                bucket = idx.get(str(old_row.get('Report_ID', ''))[-SUFFIX_LEN:])
+                if bucket: bucket.pop(label, None)
+            rid = str(new_row.get('Report_ID', ''))
+            idx.setdefault(rid[-SUFFIX_LEN:], {})[label] = (rid, str(new_row.get('Status', '')))
+
+    def lookup(self, sheet, code):
+        """คืน [(Report_ID, Status), ...] ที่ลงท้ายด้วย code หรือ None ถ้ายังไม่มีดัชนีของชีตนี้"""
+        with self._lock:
+            idx = self._sheets.get(sheet)
+            if idx is None: return None
+            return [v for _, v in sorted(idx.get(code, {}).items())]
@@ -0,0 +1,86 @@
+"""ร่องรอยดิจิทัลของผู้แจ้ง (คอลัมน์ Security_Trace)
+
+IP อ่านจาก header ที่ reverse proxy ส่งต่อมา (X-Forwarded-For ฯลฯ) ไม่ต้องเรียกเว็บภายนอก
+— ipify ที่ใช้เดิมคืน IP ขาออกของเซิร์ฟเวอร์เอง ไม่ใช่ของนักเรียน
+X-Forwarded-For ฝั่งซ้ายผู้ใช้ปลอมใส่มาเองได้ -> นับจากขวาตามจำนวน proxy ที่เชื่อถือ (TRUSTED_PROXY_HOPS)
+User-Agent ถูกย่อเป็นระเบียนอุปกรณ์สั้น ๆ และแคชไว้ (มือถือรุ่นเดียวกันส่ง UA ซ้ำกันบ่อย)
+"""
+import hashlib
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+IP_HEADERS = ("X-Real-Ip", "CF-Connecting-IP", "True-Client-IP")  # ใช้เมื่อไม่มี X-Forwarded-For
+TRUSTED_PROXY_HOPS = max(1, int(os.environ.get("TRUSTED_PROXY_HOPS", "1")))  # จำนวน proxy ของเราที่ต่อท้าย X-Forwarded-For
+
+Device = namedtuple("Device", "kind os browser model")
+
+
+def _header(headers, name):
+    if not headers: return ""
+    return headers.get(name) or headers.get(name.lower()) or ""
+
+
+def client_ip(headers, hops=TRUSTED_PROXY_HOPS):
+    # X-Forwarded-For: <ที่ผู้ใช้ส่งมาเอง...>, client, proxy2 -> proxy แต่ละตัวต่อท้ายที่อยู่ของคนที่ต่อเข้ามา
+    # ตัวที่ hops จากขวาคือที่ proxy ตัวนอกสุดของเราเห็น ปลอมไม่ได้
+    hops_seen = [v.strip() for v in _header(headers, "X-Forwarded-For").split(",") if v.strip()]
+    if hops_seen: return hops_seen[-min(hops, len(hops_seen))]
+    for name in IP_HEADERS:
+        value = _header(headers, name).strip()
+        if value: return value
+    return "Unknown IP"
+
+
+_OS_RULES = [
+    (re.compile(r"Android ([\d.]+)"), lambda m: f"Android {m.group(1)}"),
+    (re.compile(r"(?:iPhone|CPU) OS (\d+)_(\d+)"), lambda m: f"iOS {m.group(1)}.{m.group(2)}"),
+    (re.compile(r"Windows NT ([\d.]+)"), lambda m: "Windows 10+" if m.group(1) == "10.0" else f"Windows NT {m.group(1)}"),
+    (re.compile(r"Mac OS X (\d+)[_.](\d+)"), lambda m: f"macOS {m.group(1)}.{m.group(2)}"),
+    (re.compile(r"CrOS"), lambda m: "ChromeOS"),
+    (re.compile(r"Linux"), lambda m: "Linux"),
+]
+# ลำดับสำคัญ: in-app browser / Edge / Opera ต่างก็มีคำว่า Chrome หรือ Safari ปนอยู่
+_BROWSER_RULES = [
+    (re.compile(r"\bLine/([\d.]+)"), "LINE"),
+    (re.compile(r"FBAV/([\d.]+)"), "Facebook"),
+    (re.compile(r"Edg[A-Za-z]*/([\d.]+)"), "Edge"),
+    (re.compile(r"OPR/([\d.]+)"), "Opera"),
+    (re.compile(r"SamsungBrowser/([\d.]+)"), "Samsung"),
+    (re.compile(r"Firefox/([\d.]+)"), "Firefox"),
+    (re.compile(r"(?:CriOS|Chrome)/([\d.]+)"), "Chrome"),
+    (re.compile(r"Version/([\d.]+).*Safari"), "Safari"),
+]
+_MODEL_RE = re.compile(r"Android [\d.]+; ([^;)]+)")
+
+
+@lru_cache(maxsize=1024)
+def parse_user_agent(ua):
+    ua = ua or ""
+    os_name = next((fmt(m) for rx, fmt in _OS_RULES for m in [rx.search(ua)] if m), "Unknown OS")
+    browser = next((f"{name} {m.group(1).split('.')[0]}" for rx, name in _BROWSER_RULES for m in [rx.search(ua)] if m), "Unknown Browser")
+    if "iPad" in ua or ("Android" in ua and "Mobile" not in ua): kind = "Tablet"
+    elif "Mobi" in ua or "iPhone" in ua: kind = "Mobile"
+    elif ua: kind = "Desktop"
+    else: kind = "Unknown"
+    m = _MODEL_RE.search(ua)
+    model = m.group(1).split(" Build")[0].strip() if m and m.group(1).strip() not in ("K", "wv") else ""
+    return Device(kind, os_name, browser, model)
+
+
+def format_device(device):
+    return " / ".join(p for p in (device.kind, device.os, device.browser, device.model) if p)
+
+
+def client_fingerprint(headers):
+    """คีย์สั้น ๆ ของเครื่องผู้ใช้ (IP + User-Agent) สำหรับจำกัดความถี่ ไม่เก็บลงชีต"""
+    raw = f"{client_ip(headers)}|{_header(headers, 'User-Agent')}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def security_trace(headers):
+    """ข้อความสำหรับคอลัมน์ Security_Trace (รูปแบบเดิม: 'IP: ... | Device: ...')"""
+    ua = _header(headers, "User-Agent")
+    device = format_device(parse_user_agent(ua)) if ua else "Unknown Device"
+    return f"IP: {client_ip(headers)} | Device: {device}"
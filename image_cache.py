@@ -0,0 +1,144 @@
+"""แคชรูปหลายขนาดต่อรายงาน (preview / pdf / original)
+
+รูปในชีตมีทั้งแบบเก่า (base64 ในเซลล์) และแบบใหม่ (ลิงก์ Drive จาก upload_pipeline)
+ถอด/ดาวน์โหลดครั้งเดียว ย่อเป็นขนาดที่ใช้จริง แล้วเก็บใน LRU ที่จำกัดขนาดเป็นไบต์
+คีย์ = (Report_ID, hash ของค่าในเซลล์, ขนาด) -> รูปถูกเปลี่ยนก็ได้คีย์ใหม่เอง
+โหลด/ย่อไม่สำเร็จก็จำไว้ failure_ttl วินาที -> รูปเสียรูปเดียวไม่ทำให้ทุก rerun รอ timeout ซ้ำ
+"""
+import base64
+import binascii
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from metrics import instrument, log_event, timed_import
+
+# ขนาดกรอบสูงสุด (กว้าง, สูง) ของแต่ละแบบ; None = ไฟล์เดิม
+VARIANTS = {
+    "preview": (800, 800),  # แสดงกว้าง 400px บนเว็บ เผื่อจอ HiDPI 2 เท่า
+    "pdf": (600, 450),      # ช่องหลักฐานใน PDF สูง 150px พิมพ์ที่ ~3 เท่า
+    "original": None,
+}
+
+
+def fetch_source(value, timeout=10):
+    """ค่าในเซลล์ (ลิงก์ หรือ base64) -> bytes ของรูป; อ่านไม่ได้คืน b"" """
+    value = str(value or "").strip()
+    if not value: return b""
+    if value.startswith(("http://", "https://")):
+        try: resp = requests.get(value, timeout=timeout)
+        except requests.RequestException as e:
+            log_event("image.fetch", error=f"{type(e).__name__}: {e}")
+            return b""
+        # Drive ตอบหน้า HTML (ขอสิทธิ์/สแกนไวรัส) ได้ทั้งที่เป็น 200 -> ไม่ส่งไปให้ PIL ถอด
+        kind = resp.headers.get("Content-Type", "")
+        if resp.status_code != 200 or not kind.startswith("image/"):
+            log_event("image.fetch", status=resp.status_code, content_type=kind)
+            return b""
+        return resp.content
+    try: return base64.b64decode(value)
+    except (binascii.Error, ValueError): return b""
+
+
+@instrument("image.process", size=len)
+def process_image(img_file):
+    """ไฟล์ที่นักเรียนอัปโหลด -> JPEG bytes (หมุนตาม EXIF, กรอบไม่เกิน 1600px, quality 85)"""
+    if not img_file: return b""
+    Image, ImageOps = timed_import("PIL.Image"), timed_import("PIL.ImageOps")
+    try:
+        # แก้รูปหมุน (EXIF Orientation) ให้รูปแนวตั้งจากมือถือไม่นอนตะแคง
+        img = ImageOps.exif_transpose(Image.open(img_file)).convert('RGB')
+        # 1600px คมพอสำหรับพิมพ์เอกสาร quality 85 ตาแยกไม่ออกแต่ไฟล์ไม่ใหญ่
+        img.thumbnail((1600, 1600))
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=85, optimize=True)
+        return buf.getvalue()
+    except Exception as e:
+        log_event("image.process", error=f"{type(e).__name__}: {e}")
+        return b""
+
+
+def make_variant(data, size):
+    img = timed_import("PIL.Image").open(io.BytesIO(data)).convert('RGB')
+    img.thumbnail(size)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=80, optimize=True)
+    return buf.getvalue()
+
+
+class ImageCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, fetch=fetch_source, failure_ttl=60.0, max_failures=1024):
+        self.max_bytes = max_bytes
+        self.failure_ttl = failure_ttl
+        self.max_failures = max_failures
+        self._fetch = fetch
+        self._items = OrderedDict()
+        self._failed = {}  # key -> เวลาที่ลองใหม่ได้ (time.monotonic)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            else: self.misses += 1
+            return data
+
+    def _recently_failed(self, key):
+        with self._lock:
+            retry_at = self._failed.get(key)
+            if retry_at is None: return False
+            if time.monotonic() < retry_at: return True
+            del self._failed[key]
+            return False
+
+    def _remember_failure(self, key):
+        with self._lock:
+            if len(self._failed) >= self.max_failures:
+                now = time.monotonic()
+                self._failed = {k: t for k, t in self._failed.items() if t > now}
+                if len(self._failed) >= self.max_failures: self._failed.clear()
+            self._failed[key] = time.monotonic() + self.failure_ttl
+
+    def _put(self, key, data):
+        with self._lock:
+            if key in self._items or len(data) > self.max_bytes: return
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self._size -= len(old)
+
+    def get(self, report_id, source, variant="preview"):
+        """คืน JPEG bytes ของรูปขนาด variant หรือ b"" ถ้าไม่มี/อ่านไม่ได้"""
+        if not str(source or "").strip(): return b""
+        digest = hashlib.sha1(str(source).encode("utf-8")).hexdigest()
+        key = (str(report_id), digest, variant)
+        data = self._get(key)
+        if data is not None: return data
+        if self._recently_failed(key): return b""
+        if variant == "original": data = self._fetch(source)
+        else:
+            original = self.get(report_id, source, "original")
+            try: data = make_variant(original, VARIANTS[variant]) if original else b""
+            except Exception as e:
+                log_event("image.resize", report_id=report_id, variant=variant, error=f"{type(e).__name__}: {e}")
+                data = b""
+        if data: self._put(key, data)
+        else: self._remember_failure(key)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {"items": len(self._items), "bytes": self._size, "hits": self.hits, "misses": self.misses, "failed": len(self._failed)}
+
+
+IMAGE_CACHE = ImageCache()
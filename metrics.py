@@ -0,0 +1,164 @@
+"""จับเวลาเส้นทางหลัก (อ่าน/เขียนชีต, สร้าง PDF, ย่อรูป, อัปโหลด, ค้นหา)
+
+ต่อการเรียกหนึ่งครั้งเก็บ: เวลา (histogram แบบ bucket คงที่), จำนวนแถว, ขนาด payload
+และเขียน log JSON หนึ่งบรรทัด (logger "metrics") ไว้ไล่ดูย้อนหลังจาก log ของเซิร์ฟเวอร์
+ไม่พึ่ง streamlit -> ใช้ได้ทั้งจากเธรดเบื้องหลัง (journal/upload) และสคริปต์ทดสอบ
+ปิด log รายครั้งได้ด้วย METRICS_LOG=0 (ตัวนับยังทำงาน)
+timed_import: import ไลบรารีหนัก ๆ ตอนใช้ครั้งแรก พร้อมบันทึกเวลา import เป็น op "import.<ชื่อ>"
+log_event: ข้อผิดพลาด/การลองซ้ำจากเธรดเบื้องหลัง เป็น JSON บรรทัดเดียวใน logger เดียวกัน (ไม่ใช้ print)
+"""
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # วินาที
+
+log = logging.getLogger("metrics")
+if not log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+
+class _Op:
+    __slots__ = ("buckets", "count", "errors", "total_s", "max_s", "rows", "bytes")
+
+    def __init__(self, n):
+        self.buckets = [0] * (n + 1)  # ช่องสุดท้าย = เกิน bucket บนสุด (+Inf)
+        self.count = self.errors = self.rows = self.bytes = 0
+        self.total_s = self.max_s = 0.0
+
+
+class Metrics:
+    def __init__(self, buckets=BUCKETS, log_calls=None):
+        self.bucket_bounds = tuple(buckets)
+        self.log_calls = os.environ.get("METRICS_LOG", "1") != "0" if log_calls is None else log_calls
+        self._ops = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def observe(self, op, seconds, rows=None, size=None, error=None):
+        with self._lock:
+            s = self._ops.get(op)
+            if s is None: s = self._ops[op] = _Op(len(self.bucket_bounds))
+            s.buckets[bisect_left(self.bucket_bounds, seconds)] += 1
+            s.count += 1
+            s.total_s += seconds
+            s.max_s = max(s.max_s, seconds)
+            if rows: s.rows += rows
+            if size: s.bytes += size
+            if error: s.errors += 1
+        if self.log_calls:
+            event = {"ts": round(time.time(), 3), "op": op, "ms": round(seconds * 1000, 2)}
+            if rows is not None: event["rows"] = rows
+            if size is not None: event["bytes"] = size
+            if error: event["error"] = error
+            log.info(json.dumps(event, ensure_ascii=False))
+
+    def event(self, op, level=logging.WARNING, **fields):
+        """เหตุการณ์ที่ไม่ใช่การจับเวลา (ลองซ้ำ/ล้มเหลว) — log เสมอแม้ตั้ง METRICS_LOG=0"""
+        event = {"ts": round(time.time(), 3), "op": op, "level": logging.getLevelName(level).lower()} | fields
+        log.log(level, json.dumps(event, ensure_ascii=False, default=str))
+
+    @contextmanager
+    def timed(self, op):
+        """with timed("sheets.read") as m: ...; m["rows"] = len(df) — ใส่ rows/bytes ได้ถ้ารู้"""
+        m = {"rows": None, "bytes": None}
+        start = time.perf_counter()
+        try:
+            yield m
+        except Exception as e:
+            self.observe(op, time.perf_counter() - start, m["rows"], m["bytes"], error=type(e).__name__)
+            raise
+        self.observe(op, time.perf_counter() - start, m["rows"], m["bytes"])
+
+    def instrument(self, op, rows=None, size=None):
+        """decorator: rows/size = fn(ผลลัพธ์) -> จำนวนแถว/ขนาด bytes"""
+        def wrap(fn):
+            @wraps(fn)
+            def inner(*args, **kwargs):
+                with self.timed(op) as m:
+                    result = fn(*args, **kwargs)
+                    if rows: m["rows"] = rows(result)
+                    if size: m["bytes"] = size(result)
+                    return result
+            return inner
+        return wrap
+
+    def _quantile(self, s, q):
+        # ประมาณจาก bucket: interpolate เชิงเส้นภายใน bucket ที่ quantile ตกอยู่
+        target = q * s.count
+        seen = 0
+        for i, n in enumerate(s.buckets):
+            if n and seen + n >= target:
+                lo = self.bucket_bounds[i - 1] if i else 0.0
+                hi = self.bucket_bounds[i] if i < len(self.bucket_bounds) else s.max_s
+                return min(lo + (hi - lo) * (target - seen) / n, s.max_s)
+            seen += n
+        return s.max_s
+
+    def snapshot(self):
+        """{op: {count, errors, mean_ms, p50_ms, p95_ms, p99_ms, max_ms, rows, bytes}}"""
+        with self._lock:
+            return {op: {"count": s.count, "errors": s.errors,
+                         "mean_ms": round(s.total_s / s.count * 1000, 2),
+                         "p50_ms": round(self._quantile(s, 0.50) * 1000, 2),
+                         "p95_ms": round(self._quantile(s, 0.95) * 1000, 2),
+                         "p99_ms": round(self._quantile(s, 0.99) * 1000, 2),
+                         "max_ms": round(s.max_s * 1000, 2),
+                         "rows": s.rows, "bytes": s.bytes}
+                    for op, s in sorted(self._ops.items())}
+
+    def prometheus_text(self, prefix="police_report"):
+        """ข้อความรูปแบบ Prometheus exposition (text/plain; version=0.0.4)"""
+        lines = [f"# HELP {prefix}_op_seconds Latency of instrumented operations.",
+                 f"# TYPE {prefix}_op_seconds histogram"]
+        with self._lock:
+            ops = sorted(self._ops.items())
+            for op, s in ops:
+                cumulative = 0
+                for bound, n in zip(self.bucket_bounds + (float("inf"),), s.buckets):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{prefix}_op_seconds_bucket{{op="{op}",le="{le}"}} {cumulative}')
+                lines.append(f'{prefix}_op_seconds_sum{{op="{op}"}} {s.total_s:.6f}')
+                lines.append(f'{prefix}_op_seconds_count{{op="{op}"}} {s.count}')
+            for name, attr, help_text in (("op_errors_total", "errors", "Failed calls."),
+                                          ("op_rows_total", "rows", "Rows read or written."),
+                                          ("op_bytes_total", "bytes", "Payload bytes handled.")):
+                lines += [f"# HELP {prefix}_{name} {help_text}", f"# TYPE {prefix}_{name} counter"]
+                lines += [f'{prefix}_{name}{{op="{op}"}} {getattr(s, attr)}' for op, s in ops]
+        lines += [f"# HELP {prefix}_start_time_seconds Process start time.", f"# TYPE {prefix}_start_time_seconds gauge",
+                  f"{prefix}_start_time_seconds {self.started_at:.0f}"]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock: self._ops.clear()
+
+
+METRICS = Metrics()
+timed = METRICS.timed
+instrument = METRICS.instrument
+log_event = METRICS.event
+
+_import_lock = threading.Lock()
+
+
+def timed_import(name):
+    # import ครั้งแรกของ process เท่านั้นที่ถูกจับเวลา ครั้งต่อไปได้จาก sys.modules ทันที
+    module = sys.modules.get(name)
+    if module is not None: return module
+    with _import_lock:
+        module = sys.modules.get(name)
+        if module is None:
+            with timed(f"import.{name}"): module = importlib.import_module(name)
+    return module
@@ -0,0 +1,65 @@
+"""พิมพ์ PDF หลายคดีพร้อมกันด้วย process pool
+
+ใช้ render_pdf ตัวเดียวกับหน้ารายละเอียด แต่กระจายไปหลาย process (PDF_WORKERS ตัว ค่าเริ่มต้น 2)
+ไม่ใช้ทุกคอร์: แต่ละ process โหลด weasyprint/ฟอนต์ของตัวเอง และเครื่องเดียวกันยังต้องตอบหน้าเว็บผู้ใช้คนอื่น
+ผลลัพธ์เป็น ZIP (ไฟล์ละคดี) หรือ PDF เล่มเดียว (ต้องมี pypdf)
+เขียนลง SpooledTemporaryFile -> ไฟล์ใหญ่ ๆ จะล้นลงดิสก์แทนการกินแรม
+"""
+import io
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pytz
+
+from pdf_engine import render_pdf
+
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+PDF_WORKERS = max(1, int(os.environ.get("PDF_WORKERS", "2")))
+
+
+def _render_job(job):
+    row, printer_name, print_time = job
+    return render_pdf(row, printer_name, print_time)
+
+
+def iter_rendered(rows, printer_name="System", max_workers=None):
+    """คืน (row, pdf_bytes) ตามลำดับเดิม ทีละคดีเมื่อเสร็จ"""
+    if not rows: return
+    print_time = datetime.now(pytz.timezone('Asia/Bangkok')).strftime("%d/%m/%Y %H:%M:%S")
+    jobs = [(row, printer_name, print_time) for row in rows]
+    workers = max(1, min(max_workers or PDF_WORKERS, os.cpu_count() or 1, len(jobs)))
+    if workers == 1:
+        for job in jobs: yield job[0], _render_job(job)
+        return
+    # spawn: process ของ streamlit มีหลายเธรด การ fork จึงไม่ปลอดภัย
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        for job, pdf in zip(jobs, pool.map(_render_job, jobs, chunksize=max(1, len(jobs) // (workers * 4)))):
+            yield job[0], pdf
+
+
+def export_pdfs(rows, printer_name="System", fmt="zip", on_progress=None, max_workers=None):
+    """สร้างไฟล์รวมของทุกคดีใน rows แล้วคืน file object (seek ไว้ที่ 0)
+
+    fmt: "zip" หรือ "pdf" (รวมเป็นเล่มเดียว)
+    on_progress(done, total) ถูกเรียกทุกครั้งที่คดีหนึ่งเสร็จ
+    """
+    total = len(rows)
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    if fmt == "pdf":
+        from pypdf import PdfReader, PdfWriter
+        writer = PdfWriter()
+    else:
+        archive = zipfile.ZipFile(out, "w", compression=zipfile.ZIP_STORED)  # PDF บีบอัดมาแล้ว
+    for done, (row, pdf) in enumerate(iter_rendered(rows, printer_name, max_workers), start=1):
+        if fmt == "pdf": writer.append(PdfReader(io.BytesIO(pdf)))
+        else: archive.writestr(f"Report_{row.get('Report_ID', done)}.pdf", pdf)
+        if on_progress: on_progress(done, total)
+    if fmt == "pdf": writer.write(out)
+    else: archive.close()
+    out.seek(0)
+    return out
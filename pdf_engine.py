@@ -0,0 +1,194 @@
+"""ระบบสร้าง PDF ใบสรุปรายงานเหตุการณ์
+
+- FontConfiguration + CSS หลัก compile ครั้งเดียวต่อ process
+- QR code / โลโก้ base64 แคชไว้ ไม่สร้างใหม่ทุกครั้ง
+- weasyprint / qrcode import ตอนสร้าง PDF ครั้งแรก (หน้าฟอร์มนักเรียนไม่ต้องรอโหลด)
+- PdfCache: LRU จำกัดขนาดเป็นไบต์ คีย์ด้วย hash ของเนื้อหาแถว + ผู้พิมพ์ + เวลาพิมพ์ (ระดับนาที)
+  (แถวถูกแก้ -> hash เปลี่ยน -> ได้ PDF ใหม่เอง ตัวเก่าหลุดจาก LRU ไปตามลำดับ
+   ท้ายกระดาษแสดงเวลาพิมพ์ -> ใช้ตัวที่แคชได้เฉพาะภายในนาทีเดียวกัน)
+
+ไม่พึ่ง streamlit เพื่อให้เรียกใช้จาก worker process ได้
+"""
+import base64
+import glob
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+
+import pytz
+
+from image_cache import IMAGE_CACHE
+from metrics import instrument, log_event, timed, timed_import
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_FILE = os.path.join(BASE_DIR, "THSarabunNew.ttf")
+LOGO_MIME = "image/png"
+PRINT_MINUTE_FORMAT = "%d/%m/%Y %H:%M"  # เวลาพิมพ์ของ PDF ที่ผ่านแคช (ตรงกับคีย์แคช)
+
+# คอลัมน์ที่ปรากฏใน PDF -> ใช้ทำคีย์แคช
+PDF_FIELDS = ['Report_ID', 'Timestamp', 'Reporter', 'Incident_Type', 'Location', 'Details', 'Statement', 'Audit_Log',
+    'Evidence_Image', 'Victim', 'Accused', 'Witness', 'Student_Police_Investigator', 'Teacher_Investigator', 'Last_Updated']
+
+BASE_CSS = f"""
+    @font-face {{ font-family: 'THSarabunNew'; src: url('file://{FONT_FILE}'); }}
+    @page {{ size: A4; margin: 2cm; }}
+    body {{ font-family: 'THSarabunNew'; font-size: 16pt; line-height: 1.3; }}
+    .header {{ text-align: center; position: relative; margin-bottom: 20px; min-height: 80px; }}
+    .logo {{ position: absolute; top: 0; left: 0; width: 60px; }}
+    .qr {{ position: absolute; top: 0; right: 0; width: 60px; }}
+    .box {{ border: 1px solid #000; background: #f9f9f9; padding: 10px; min-height: 50px; white-space: pre-wrap; }}
+    .sig-table {{ width: 100%; margin-top: 30px; text-align: center; }} .sig-table td {{ padding-bottom: 30px; vertical-align: top; }}
+"""
+
+_init_lock = threading.Lock()
+_font_config = None
+_stylesheet = None
+
+
+def _resources():
+    global _font_config, _stylesheet
+    with _init_lock:
+        if _stylesheet is None:
+            weasyprint = timed_import("weasyprint")
+            _font_config = timed_import("weasyprint.text.fonts").FontConfiguration()
+            _stylesheet = weasyprint.CSS(string=BASE_CSS, font_config=_font_config)
+    return _font_config, _stylesheet
+
+
+@lru_cache(maxsize=1)
+def logo_base64():
+    logos = glob.glob(os.path.join(BASE_DIR, "school_logo*"))
+    if not logos: return ""
+    try:
+        with open(logos[0], "rb") as f: return base64.b64encode(f.read()).decode('utf-8')
+    except OSError: return ""
+
+
+@lru_cache(maxsize=512)
+def qr_base64(rid):
+    buf = io.BytesIO()
+    timed_import("qrcode").make(rid).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def _latest_date(audit_log):
+    # สำรองสำหรับแถวที่ไม่มี Last_Updated (เช่นข้อมูลจากคลัง): หา [วันที่] ในบรรทัดสุดท้ายของ Audit_Log แบบเก่า
+    lines = [l for l in str(audit_log).split('\n') if l.strip()]
+    if lines and '[' in lines[-1] and ']' in lines[-1]:
+        return lines[-1][lines[-1].find('[')+1:lines[-1].find(']')]
+    return "-"
+
+
+def now_th(fmt="%d/%m/%Y %H:%M:%S"):
+    return datetime.now(pytz.timezone('Asia/Bangkok')).strftime(fmt)
+
+
+def pdf_html(row, printer_name="System", print_time=None):
+    """HTML ของใบสรุป (ท้ายกระดาษ = ผู้พิมพ์ + เวลาพิมพ์)"""
+    rid = str(row.get('Report_ID', '')); date_str = str(row.get('Timestamp', ''))
+    reporter = str(row.get('Reporter', '-')); incident = str(row.get('Incident_Type', '-'))
+    location = str(row.get('Location', '-')); details = str(row.get('Details', '-'))
+    statement = str(row.get('Statement', '-'))
+    latest_date = row.get('Last_Updated') or _latest_date(row.get('Audit_Log', ''))
+    if print_time is None: print_time = now_th()
+
+    evidence_html = ""
+    # ฝังรูปที่ย่อแล้วสำหรับช่อง 150px แทนไฟล์เต็ม -> PDF เล็กลงและ render เร็วขึ้น
+    evidence = IMAGE_CACHE.get(rid, row.get('Evidence_Image'), "pdf")
+    if evidence:
+        evidence_html = f"<div style='margin-top:10px;'><b>หลักฐาน:</b><br><img src='data:image/jpeg;base64,{base64.b64encode(evidence).decode()}' style='max-height:150px;'></div>"
+
+    logo = logo_base64()
+    logo_html = f'<img class="logo" src="data:{LOGO_MIME};base64,{logo}">' if logo else ""
+
+    # เหลือเฉพาะส่วนที่เปลี่ยนทุกครั้ง (ท้ายกระดาษ) เป็น inline style ส่วนที่เหลืออยู่ใน stylesheet ที่ compile แล้ว
+    html_content = f"""
+    <!DOCTYPE html><html><head><style>
+        @page {{ @bottom-right {{ content: "ผู้พิมพ์: {printer_name} | เวลา: {print_time}"; font-family: 'THSarabunNew'; font-size: 12pt; }} }}
+    </style></head><body>
+        <div class="header">{logo_html}<div style="font-size:22pt; font-weight:bold; margin-top:10px;">สถานีตำรวจภูธรโรงเรียนโพนทองพัฒนาวิทยา</div>
+        <div style="font-size:18pt; font-weight:bold;">ใบสรุปรายงานเหตุการณ์</div><img class="qr" src="data:image/png;base64,{qr_base64(rid)}"></div><hr>
+        <table style="width:100%"><tr><td width="60%"><b>เลขที่:</b> {rid}</td><td width="40%" align="right"><b>วันที่แจ้ง:</b> {date_str}<br><b>อัปเดต:</b> {latest_date}</td></tr></table>
+        <p><b>ผู้แจ้ง:</b> {reporter} | <b>เหตุ:</b> {incident} | <b>สถานที่:</b> {location}</p>
+        <div style="margin-top:10px;"><b>รายละเอียด:</b></div><div class="box">{details}</div>
+        <div><b>ผลการสอบสวน:</b></div><div class="box">{statement}</div>{evidence_html}
+        <table class="sig-table">
+            <tr><td width="50%">ลงชื่อ.......................................<br>({row.get('Victim','')})<br>ผู้เสียหาย</td><td width="50%">ลงชื่อ.......................................<br>({row.get('Accused','')})<br>ผู้ถูกกล่าวหา</td></tr>
+            <tr><td>ลงชื่อ.......................................<br>({row.get('Student_Police_Investigator','')})<br>ตำรวจนักเรียน</td><td>ลงชื่อ.......................................<br>({row.get('Witness','')})<br>พยาน</td></tr>
+            <tr><td colspan="2"><br>ลงชื่อ.......................................<br>({row.get('Teacher_Investigator','')})<br>ครูผู้สอบสวน</td></tr>
+        </table>
+    </body></html>"""
+    return html_content
+
+
+@instrument("pdf.render", size=len)
+def render_pdf(row, printer_name="System", print_time=None):
+    font_config, stylesheet = _resources()
+    html_content = pdf_html(row, printer_name, print_time)
+    return timed_import("weasyprint").HTML(string=html_content, base_url=BASE_DIR).write_pdf(stylesheets=[stylesheet], font_config=font_config)
+
+
+def warm_up():
+    """โหลดไลบรารี/ฟอนต์/โลโก้ล่วงหน้า (เรียกจากเธรดเบื้องหลังหลังหน้าแรกแสดงแล้ว)
+
+    โหลดไม่ได้ (เช่น weasyprint หา libpango ไม่เจอ -> OSError) ไม่ให้เธรดตายพร้อม traceback
+    นับเป็น error ของ pdf.warm_up ใน metrics แล้วจบ — กด PDF จริงค่อยแจ้งผู้ใช้
+    """
+    try:
+        with timed("pdf.warm_up"):
+            _resources()
+            logo_base64()
+            timed_import("qrcode")
+            timed_import("PIL.Image")
+    except Exception as e:
+        log_event("pdf.warm_up", error=f"{type(e).__name__}: {e}")
+
+
+def pdf_key(row, printer_name, print_time=""):
+    h = hashlib.sha256(f"{printer_name}\x1f{print_time}".encode("utf-8"))
+    for f in PDF_FIELDS: h.update(b"\x1f" + str(row.get(f, "")).encode("utf-8"))
+    return h.hexdigest()
+
+
+class PdfCache:
+    """LRU ของ PDF ที่สร้างแล้ว จำกัดรวมไม่เกิน max_bytes"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, row, printer_name="System", print_time=None):
+        # เวลาพิมพ์อยู่ในคีย์: คนละนาทีได้ PDF ใหม่ ท้ายกระดาษจึงไม่ค้างเวลาของครั้งแรก
+        if print_time is None: print_time = now_th(PRINT_MINUTE_FORMAT)
+        key = pdf_key(row, printer_name, print_time)
+        with self._lock:
+            pdf = self._items.get(key)
+            if pdf is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return pdf
+            self.misses += 1
+        pdf = render_pdf(row, printer_name, print_time)
+        with self._lock:
+            if key not in self._items and len(pdf) <= self.max_bytes:
+                self._items[key] = pdf
+                self._size += len(pdf)
+                while self._size > self.max_bytes:
+                    _, old = self._items.popitem(last=False)
+                    self._size -= len(old)
+        return pdf
+
+    def stats(self):
+        with self._lock:
+            return {"items": len(self._items), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+
+PDF_CACHE = PdfCache()
@@ -0,0 +1,112 @@
+"""ด่านหน้าการส่งรายงาน: กันส่งซ้ำ, ออกเลข Report_ID ไม่ชน, จำกัดความถี่ต่อเครื่อง
+
+- SubmissionLedger: คีย์ idempotency ต่อฟอร์ม -> Report_ID เดิมเสมอ (กดซ้ำ/rerun ได้แถวเดียว)
+  และจอง Report_ID ในตาราง SQLite ที่มี PRIMARY KEY -> ไม่ชนกัน ไม่ต้องอ่านทั้งชีตมาตรวจ
+- TokenBucket: จำกัดจำนวนครั้งต่อ fingerprint ของเครื่อง (IP + User-Agent) กันสแปมกินโควตา Google API
+"""
+import random
+import sqlite3
+import threading
+import time
+
+SUFFIX_MIN, SUFFIX_MAX = 1000, 9999  # 4 หลักท้ายที่นักเรียนใช้ติดตามผล
+
+
+class SubmissionLedger:
+    def __init__(self, path, attempts=200):
+        self.attempts = attempts
+        self._rng = random.SystemRandom()  # เลขท้ายสุ่มเหมือนเดิม เดาเลขของคนอื่นยากกว่าเลขเรียง
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS report_ids (report_id TEXT PRIMARY KEY, created_at REAL NOT NULL)")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS submissions (
+            key TEXT PRIMARY KEY, report_id TEXT NOT NULL, created_at REAL NOT NULL)""")
+
+    def lookup(self, key):
+        with self._lock:
+            found = self._db.execute("SELECT report_id FROM submissions WHERE key = ?", [key]).fetchone()
+        return found[0] if found else None
+
+    def reserve(self, report_ids):
+        """จองเลขที่มีอยู่แล้วในชีต (ledger ว่างหลังรีสตาร์ต) — อ่านชีตก่อนเรียก ที่นี่เขียน SQLite อย่างเดียว"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("INSERT OR IGNORE INTO report_ids VALUES (?, ?)", [[rid, now] for rid in report_ids])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def claim(self, key, day, taken=None, prefix="POL"):
+        """Report_ID ของคีย์นี้ (ออกเลขใหม่ถ้ายังไม่เคย)
+
+        taken(rid) = ตรวจเพิ่มกับข้อมูลในหน่วยความจำเท่านั้น (ถูกเรียกระหว่างถือ write lock ของ journal.db ห้ามเรียกเครือข่าย)
+        """
+        with self._lock:
+            # BEGIN IMMEDIATE = ล็อกเขียนก่อนตรวจ -> หลาย process ออกเลขพร้อมกันก็ไม่ชน
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                found = self._db.execute("SELECT report_id FROM submissions WHERE key = ?", [key]).fetchone()
+                if found:
+                    self._db.execute("COMMIT")
+                    return found[0]
+                now = time.time()
+                for _ in range(self.attempts):
+                    rid = f"{prefix}-{day}-{self._rng.randint(SUFFIX_MIN, SUFFIX_MAX)}"
+                    if taken and taken(rid): continue
+                    if self._db.execute("INSERT OR IGNORE INTO report_ids VALUES (?, ?)", [rid, now]).rowcount == 1: break
+                else:
+                    raise RuntimeError(f"ไม่มีเลข Report_ID ว่างสำหรับวันที่ {day}")
+                self._db.execute("INSERT INTO submissions VALUES (?, ?, ?)", [key, rid, now])
+                self._db.execute("COMMIT")
+                return rid
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def purge(self, older_than_s=7 * 24 * 3600):
+        # ลบเฉพาะคีย์ฟอร์มเก่า; เลขที่จองแล้วเก็บไว้ตลอด (แถวละไม่กี่ไบต์)
+        with self._lock:
+            self._db.execute("DELETE FROM submissions WHERE created_at < ?", [time.time() - older_than_s])
+
+
+class TokenBucket:
+    """burst ครั้งติดกันได้ แล้วเติมคืน rate ครั้งต่อวินาที แยกถังตาม key"""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def allow(self, key, cost=1):
+        """คืน (ผ่านไหม, ต้องรออีกกี่วินาที)"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys: self._prune(now)
+                bucket = self._buckets[key] = [float(self.burst), now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                self.allowed += 1
+                return True, 0.0
+            self.rejected += 1
+            return False, (cost - bucket[0]) / self.rate
+
+    def _prune(self, now):
+        # ถังที่เติมจนเต็มแล้วไม่ต่างจากถังใหม่ -> ทิ้งได้
+        full_after = self.burst / self.rate
+        for key in [k for k, (_, t) in self._buckets.items() if now - t >= full_after]: del self._buckets[key]
+        if len(self._buckets) >= self.max_keys: self._buckets.clear()
+
+    def stats(self):
+        with self._lock: return {"clients": len(self._buckets), "allowed": self.allowed, "rejected": self.rejected}
@@ -0,0 +1,49 @@
+from benchmarks.fake_gsheets import FakeGSheetsConnection
+from case_audit import GSheetsAuditStore, record_or_defer
+from case_journal import CaseJournal, JournalFlusher
+
+
+class DownAudit:
+    """ที่เก็บเหตุการณ์ที่ล่มจนกว่าจะตั้ง up = True"""
+
+    def __init__(self):
+        self.up = False
+        self.events = []
+
+    def record(self, **event):
+        if not self.up: raise ConnectionError("quota")
+        self.events.append(event)
+
+
+def test_viewing_does_not_create_audit_sheet():
+    conn = FakeGSheetsConnection()
+    audit = GSheetsAuditStore(conn.open_spreadsheet, "AuditLog_2568")
+    assert audit.timeline("POL-1") == [] and audit.last_updated("POL-1") == ""
+    assert "AuditLog_2568" not in conn.sheets
+    audit.record("POL-1", "ครูสมชาย", "update", ["Statement"])
+    assert conn.sheets["AuditLog_2568"].grid[0][0] == "Report_ID"
+
+
+def test_cached_events_expire(tmp_path):
+    conn = FakeGSheetsConnection()
+    mine = GSheetsAuditStore(conn.open_spreadsheet, "AuditLog_2568", ttl=0)
+    other = GSheetsAuditStore(conn.open_spreadsheet, "AuditLog_2568", ttl=0)  # process อื่น
+    assert mine.timeline("POL-1") == []
+    other.record("POL-1", "ครูสมชาย", "status", ["Status"])
+    assert [e.action for e in mine.timeline("POL-1")] == ["status"]
+    assert mine.last_updated("POL-1")
+
+
+def test_failed_audit_is_deferred_and_flushed(tmp_path):
+    journal = CaseJournal(str(tmp_path / "journal.db"))
+    audit = DownAudit()
+    assert not record_or_defer(audit, journal, "Investigation_2568", "POL-1", "ครูสมชาย", "update", ["Statement"])
+    assert journal.has_pending() and journal.stats()["audit_pending"] == 1
+    flusher = JournalFlusher(journal, interval=0.0)
+    flusher.register("Investigation_2568", None, audit)
+    flusher.flush_once()
+    assert audit.events == [] and journal.stats()["audit_pending"] == 1
+    audit.up = True
+    flusher.flush_once()
+    assert [e["report_id"] for e in audit.events] == ["POL-1"] and audit.events[0]["fields"] == ["Statement"]
+    assert journal.stats()["audit_pending"] == 0
@@ -0,0 +1,59 @@
+from case_cache import CaseCache
+
+SHEET = "Investigation_2568"
+
+
+def make_cache(rows, ttl=120):
+    calls = []
+    def row_loader(sheet, rid):
+        calls.append(rid)
+        return dict(rows[rid]) if rid in rows else None
+    return CaseCache(lambda sheet: None, ttl=ttl, row_loader=row_loader), calls
+
+
+def test_missing_case_is_fetched_once_per_ttl():
+    cache, calls = make_cache({})
+    assert cache.get_row(SHEET, "POL-20240601-1234") is None
+    assert cache.get_row(SHEET, "POL-20240601-1234") is None
+    assert calls == ["POL-20240601-1234"]
+
+
+def test_rows_expire_with_the_list_ttl():
+    rows = {"POL-1": {"Report_ID": "POL-1", "Statement": "เดิม"}}
+    cache, calls = make_cache(rows, ttl=0)
+    cache.get_row(SHEET, "POL-1")
+    rows["POL-1"]["Statement"] = "แก้จากอีก process"
+    assert cache.get_row(SHEET, "POL-1")["Statement"] == "แก้จากอีก process"
+    assert calls == ["POL-1", "POL-1"]
+
+
+def test_apply_update_replaces_the_cached_dict():
+    cache, _ = make_cache({"POL-1": {"Report_ID": "POL-1", "Status": "รอดำเนินการ"}})
+    held = cache.get_row(SHEET, "POL-1")
+    cache.apply_update(SHEET, "POL-1", {"Status": "ดำเนินการเรียบร้อย"})
+    assert held["Status"] == "รอดำเนินการ"
+    assert cache.get_row(SHEET, "POL-1")["Status"] == "ดำเนินการเรียบร้อย"
+
+
+def test_slow_load_does_not_block_appends_and_keeps_them():
+    import threading
+    from benchmarks.synthetic import make_cases
+    df = make_cases(20, seed=1)
+    started, release, loads = threading.Event(), threading.Event(), []
+    def loader(sheet):
+        loads.append(sheet)
+        started.set(); release.wait(5)
+        return df
+    cache = CaseCache(loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(SHEET))) for _ in range(3)]
+    for t in threads: t.start()
+    started.wait(5)
+    new = {"Report_ID": "POL-20260430-9999", "Status": "รอดำเนินการ"}
+    cache.apply_append(SHEET, new)  # ไม่ต้องรอการโหลดที่ค้างอยู่
+    assert cache.get_row(SHEET, new["Report_ID"])["Status"] == "รอดำเนินการ"
+    release.set()
+    for t in threads: t.join(5)
+    assert loads == [SHEET]  # โหลดครั้งเดียว
+    assert len(results) == 3 and all(len(r) == 21 for r in results)
+    assert (cache.get(SHEET)['Report_ID'] == new["Report_ID"]).sum() == 1
@@ -0,0 +1,87 @@
+from case_journal import CaseJournal, JournalFlusher
+
+
+class FlakyStore:
+    """CaseStore ในหน่วยความจำ: append ที่มีแถว Report_ID อยู่ใน bad จะล้มทั้งคำขอ"""
+
+    def __init__(self, bad=()):
+        self.rows = []
+        self.bad = set(bad)
+
+    def append_many(self, rows):
+        if any(r['Report_ID'] in self.bad for r in rows): raise ConnectionError("quota")
+        self.rows += rows
+
+    def existing_ids(self):
+        return {r['Report_ID'] for r in self.rows}
+
+    def update(self, report_id, changes, expected_etag=None):
+        pass
+
+
+def make_journal(tmp_path, *ids, sheet="Investigation_2568"):
+    journal = CaseJournal(str(tmp_path / "journal.db"))
+    for rid in ids: journal.enqueue(sheet, {"Report_ID": rid, "Status": "รอดำเนินการ"})
+    return journal
+
+
+def test_failing_row_does_not_block_later_rows(tmp_path):
+    journal = make_journal(tmp_path, "POL-1", "POL-2", "POL-3")
+    store = FlakyStore(bad={"POL-1"})
+    flusher = JournalFlusher(journal)
+    flusher.register("Investigation_2568", store)
+    assert flusher.flush_once() == 2
+    assert [r['Report_ID'] for r in store.rows] == ["POL-2", "POL-3"]
+    # แถวที่ล้มรอ backoff ยังไม่ถึงรอบ แต่ยังค้างอยู่ (แสดงในรายการได้)
+    assert journal.pending(due=True) == []
+    assert [rid for rid, *_ in journal.pending()] == ["POL-1"]
+
+
+def test_failing_sheet_does_not_stop_other_sheets(tmp_path):
+    journal = make_journal(tmp_path, "POL-1")
+    journal.enqueue("Investigation_2567", {"Report_ID": "POL-9", "Status": "รอดำเนินการ"})
+    good = FlakyStore()
+    flusher = JournalFlusher(journal)
+    flusher.register("Investigation_2568", FlakyStore(bad={"POL-1"}))
+    flusher.register("Investigation_2567", good)
+    flusher.flush_once()
+    assert [r['Report_ID'] for r in good.rows] == ["POL-9"]
+
+
+def test_row_becomes_dead_letter_after_max_attempts(tmp_path):
+    journal = make_journal(tmp_path, "POL-1")
+    flusher = JournalFlusher(journal, max_attempts=2, interval=0.0)
+    flusher.register("Investigation_2568", FlakyStore(bad={"POL-1"}))
+    flusher.flush_once(); flusher.flush_once()
+    assert journal.stats()["dead"] == 1
+    assert journal.pending(due=True) == []
+    assert journal.revive() == 1
+    assert len(journal.pending(due=True)) == 1
+
+
+def test_resync_of_appended_row_writes_only_patched_columns(tmp_path):
+    # แถวถึงชีตแล้วแต่ล่มก่อน mark_flushed และถูกแก้ระหว่างนั้น -> ส่งซ้ำเฉพาะคอลัมน์ที่แก้
+    journal = make_journal(tmp_path, "POL-1")
+    journal.mark_attempt(["POL-1"])
+    journal.patch_pending("POL-1", {"Image_Data": "https://drive.google.com/uc?id=x"})
+    updates = []
+    store = FlakyStore()
+    store.rows = [{"Report_ID": "POL-1", "Status": "รอดำเนินการ"}]
+    store.update = lambda rid, changes, expected_etag=None: updates.append((rid, changes))
+    flusher = JournalFlusher(journal)
+    flusher.register("Investigation_2568", store)
+    assert flusher.flush_once() == 1
+    assert updates == [("POL-1", {"Image_Data": "https://drive.google.com/uc?id=x"})]
+    assert len(store.rows) == 1
+
+
+def test_enqueue_stores_case_and_image_together(tmp_path):
+    journal = CaseJournal(str(tmp_path / "journal.db"))
+    row = {"Report_ID": "POL-1", "Status": "รอดำเนินการ"}
+    assert journal.enqueue("Investigation_2568", row, ("POL-1_incident.jpg", b"jpeg"))
+    # ส่งซ้ำหลังถูกขัดจังหวะ: แถวไม่ซ้ำ แต่ยังรู้ว่ารูปค้างอยู่ให้เข้าคิวใหม่ได้
+    assert not journal.enqueue("Investigation_2568", row, ("POL-1_incident.jpg", b"jpeg"))
+    assert journal.upload_pending("POL-1")
+    assert [(rid, data) for rid, _, _, data, _ in journal.pending_uploads()] == [("POL-1", b"jpeg")]
+    journal.mark_uploaded("POL-1")
+    assert not journal.upload_pending("POL-1")
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from benchmarks.fake_gsheets import FakeGSheetsConnection
+from case_store import CASE_COLUMNS, ConflictError, GSheetsCaseStore, row_etag
+
+SHEET = "Investigation_2568"
+
+
+def make_store():
+    conn = FakeGSheetsConnection()
+    rows = [{c: "" for c in CASE_COLUMNS} | {"Report_ID": f"POL-20250601-{n}", "Status": "รอดำเนินการ"} for n in (1001, 1002)]
+    conn.add_sheet(SHEET, pd.DataFrame(rows, columns=CASE_COLUMNS))
+    return conn, GSheetsCaseStore(conn, SHEET, conn.open_spreadsheet)
+
+
+def test_update_writes_raw_and_returns_etag_of_stored_row():
+    conn, store = make_store()
+    etag = store.update("POL-20250601-1002", {"Statement": "=HYPERLINK('x')", "Victim": "0812345678"})
+    row = store.fetch("POL-20250601-1002")
+    assert row["Statement"] == "=HYPERLINK('x')" and row["Victim"] == "0812345678"
+    assert conn.last_input_option == "RAW"
+    assert etag == row_etag(row)
+    # บันทึกครั้งถัดไปด้วย ETag ที่ได้กลับมาต้องไม่ชน
+    store.update("POL-20250601-1002", {"Status": "ดำเนินการเรียบร้อย"}, expected_etag=etag)
+
+
+def test_update_with_stale_etag_conflicts():
+    conn, store = make_store()
+    stale = row_etag(store.fetch("POL-20250601-1001"))
+    store.update("POL-20250601-1001", {"Statement": "แก้โดยคนแรก"})
+    with pytest.raises(ConflictError):
+        store.update("POL-20250601-1001", {"Statement": "แก้โดยคนที่สอง"}, expected_etag=stale)
+
+
+def test_etag_sees_trailing_dot_zero_edits_in_text():
+    row = {"Statement": "ค่าเสียหาย 1", "Status": "รอดำเนินการ"}
+    assert row_etag(row) != row_etag(row | {"Statement": "ค่าเสียหาย 1.0"})
+    assert row_etag(row) == row_etag(row | {"Statement": " ค่าเสียหาย 1 "})
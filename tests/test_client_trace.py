@@ -0,0 +1,19 @@
+from client_trace import client_fingerprint, client_ip, security_trace
+
+UA = "Mozilla/5.0 (Linux; Android 14; SM-A546E) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36"
+
+
+def test_spoofed_forwarded_for_is_ignored():
+    real = {"X-Forwarded-For": "203.0.113.7", "User-Agent": UA}
+    spoofed = {"X-Forwarded-For": "10.9.8.7, 203.0.113.7", "User-Agent": UA}  # ผู้ใช้ใส่ 10.9.8.7 มาเอง
+    assert client_ip(spoofed) == "203.0.113.7"
+    assert client_fingerprint(spoofed) == client_fingerprint(real)
+    assert security_trace(spoofed).startswith("IP: 203.0.113.7 |")
+
+
+def test_trusted_proxy_hops():
+    headers = {"X-Forwarded-For": "1.1.1.1, 203.0.113.7, 172.16.0.2"}
+    assert client_ip(headers, hops=2) == "203.0.113.7"
+    assert client_ip(headers, hops=5) == "1.1.1.1"
+    assert client_ip({"X-Real-Ip": "198.51.100.4"}) == "198.51.100.4"
+    assert client_ip({}) == "Unknown IP"
@@ -0,0 +1,41 @@
+import base64
+
+import image_cache
+from image_cache import ImageCache, fetch_source
+
+
+class Response:
+    def __init__(self, content, content_type, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.headers = {"Content-Type": content_type}
+
+
+def test_html_interstitial_is_rejected(monkeypatch):
+    monkeypatch.setattr(image_cache.requests, "get", lambda url, timeout: Response(b"<html>", "text/html; charset=utf-8"))
+    assert fetch_source("https://drive.google.com/uc?id=x") == b""
+    monkeypatch.setattr(image_cache.requests, "get", lambda url, timeout: Response(b"\xff\xd8jpeg", "image/jpeg"))
+    assert fetch_source("https://drive.google.com/uc?id=x") == b"\xff\xd8jpeg"
+
+
+def test_failures_are_cached_for_failure_ttl():
+    calls = []
+    cache = ImageCache(fetch=lambda source: calls.append(source) or b"", failure_ttl=60)
+    assert cache.get("POL-1", "https://drive.google.com/uc?id=x") == b""
+    assert cache.get("POL-1", "https://drive.google.com/uc?id=x") == b""
+    assert len(calls) == 1 and cache.stats()["failed"] == 2  # preview + original
+    cache._failed.clear()  # ครบ failure_ttl แล้ว
+    cache.get("POL-1", "https://drive.google.com/uc?id=x")
+    assert len(calls) == 2
+
+
+def test_undecodable_image_is_not_resized_again(monkeypatch):
+    resized = []
+    def broken(data, size):
+        resized.append(size)
+        raise OSError("cannot identify image file")
+    monkeypatch.setattr(image_cache, "make_variant", broken)
+    cache = ImageCache()
+    source = base64.b64encode(b"not an image").decode()
+    assert cache.get("POL-1", source) == b"" and cache.get("POL-1", source) == b""
+    assert len(resized) == 1
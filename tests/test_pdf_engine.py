@@ -0,0 +1,36 @@
+import pdf_engine
+from pdf_engine import PdfCache, pdf_html
+
+ROW = {"Report_ID": "POL-20250601-1234", "Timestamp": "01/06/2025 08:00:00", "Reporter": "สมชาย ใจดี",
+       "Incident_Type": "ทะเลาะวิวาท", "Location": "โรงอาหาร", "Details": "ทะเลาะกันช่วงพักกลางวัน", "Status": "รอดำเนินการ"}
+
+
+def html_render(row, printer_name="System", print_time=None):
+    # แทน weasyprint: คืน HTML ที่จะถูกแปลงเป็น PDF (ท้ายกระดาษอยู่ในนี้)
+    return pdf_html(row, printer_name, print_time).encode("utf-8")
+
+
+def footer(printer_name, print_time):
+    return f"ผู้พิมพ์: {printer_name} | เวลา: {print_time}".encode("utf-8")
+
+
+def test_cached_pdf_footer_follows_print_time(monkeypatch):
+    monkeypatch.setattr(pdf_engine, "render_pdf", html_render)
+    cache = PdfCache()
+    first = cache.get_or_render(ROW, "ครูสมศรี", print_time="01/06/2025 09:00")
+    again = cache.get_or_render(ROW, "ครูสมศรี", print_time="01/06/2025 09:00")
+    later = cache.get_or_render(ROW, "ครูสมศรี", print_time="01/06/2025 09:05")
+    assert again is first
+    assert footer("ครูสมศรี", "01/06/2025 09:00") in first
+    assert footer("ครูสมศรี", "01/06/2025 09:05") in later
+    assert footer("ครูสมศรี", "01/06/2025 09:00") not in later
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_default_print_time_is_the_current_minute(monkeypatch):
+    monkeypatch.setattr(pdf_engine, "render_pdf", html_render)
+    clock = iter(["01/06/2025 09:00", "01/06/2025 10:30"])
+    monkeypatch.setattr(pdf_engine, "now_th", lambda fmt=None: next(clock))
+    cache = PdfCache()
+    assert footer("System", "01/06/2025 09:00") in cache.get_or_render(ROW)
+    assert footer("System", "01/06/2025 10:30") in cache.get_or_render(ROW)
@@ -0,0 +1,16 @@
+from submit_guard import SubmissionLedger
+
+
+def test_reserved_sheet_ids_are_not_reissued(tmp_path):
+    # ledger ว่าง (เช่นหลังรีสตาร์ต) แต่ชีตมีเลขเกือบเต็มวันนั้นแล้ว -> จองจากชีตก่อน claim ไม่ต้องเรียก taken
+    free = "POL-20250601-5000"
+    ledger = SubmissionLedger(str(tmp_path / "journal.db"), attempts=100000)
+    ledger.reserve({f"POL-20250601-{n}" for n in range(1000, 10000)} - {free})
+    assert ledger.claim("form-1", "20250601") == free
+    assert ledger.claim("form-1", "20250601") == free  # คีย์เดิมได้เลขเดิม
+
+
+def test_reserve_is_idempotent(tmp_path):
+    ledger = SubmissionLedger(str(tmp_path / "journal.db"))
+    ledger.reserve(["POL-20250601-1234"]); ledger.reserve(["POL-20250601-1234"])
+    assert all(ledger.claim(f"form-{i}", "20250601") != "POL-20250601-1234" for i in range(50))
@@ -0,0 +1,50 @@
+from case_journal import CaseJournal
+from upload_pipeline import UploadPipeline
+
+SHEET = "Investigation_2568"
+
+
+def run(pipeline, *args, **kwargs):
+    future = pipeline.submit(*args, **kwargs)
+    return future.result(timeout=5) if future else None
+
+
+def test_bytes_are_stored_before_upload_and_released_after(tmp_path):
+    journal = CaseJournal(str(tmp_path / "journal.db"))
+    seen, patched = [], []
+    def upload(data, filename):
+        seen.append(journal.pending_uploads())  # ระหว่างอัปโหลด bytes อยู่ในดิสก์แล้ว
+        return "https://drive/x"
+    pipeline = UploadPipeline(upload, journal=journal, backoff=0)
+    run(pipeline, SHEET, "POL-1", b"jpeg", "POL-1_incident.jpg", lambda rid, url: patched.append((rid, url)))
+    assert seen == [[("POL-1", SHEET, "POL-1_incident.jpg", b"jpeg", None)]]
+    assert patched == [("POL-1", "https://drive/x")]
+    assert journal.pending_uploads() == []
+
+
+def test_failure_is_recorded_and_reported(tmp_path):
+    journal = CaseJournal(str(tmp_path / "journal.db"))
+    failed = []
+    def upload(data, filename): raise ConnectionError("drive down")
+    pipeline = UploadPipeline(upload, journal=journal, retries=2, backoff=0)
+    run(pipeline, SHEET, "POL-1", b"jpeg", "f.jpg", lambda rid, url: None, lambda rid, e: failed.append(rid))
+    assert failed == ["POL-1"]
+    assert journal.stats()["uploads_failed"] == 1
+    assert journal.pending_uploads() == []
+
+
+def test_resume_after_restart_skips_upload_when_url_is_known(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = CaseJournal(path)
+    journal.enqueue_upload(SHEET, "POL-1", "a.jpg", b"a")
+    journal.enqueue_upload(SHEET, "POL-2", "b.jpg", b"b")
+    journal.set_upload_url("POL-2", "https://drive/b")  # อัปโหลดแล้วแต่ล่มก่อน patch
+    uploads, patched = [], {}
+    def upload(data, filename):
+        uploads.append(filename)
+        return "https://drive/a"
+    restarted = UploadPipeline(upload, journal=CaseJournal(path), backoff=0)
+    assert restarted.resume(lambda sheet: (lambda rid, url: patched.__setitem__(rid, url), None)) == 2
+    restarted._pool.shutdown(wait=True)
+    assert uploads == ["a.jpg"]
+    assert patched == {"POL-1": "https://drive/a", "POL-2": "https://drive/b"}
@@ -0,0 +1,101 @@
+"""อัปโหลดรูปไป Google Drive (ผ่านสะพาน GAS) แบบเบื้องหลัง
+
+นักเรียนกดส่ง -> บันทึกรายงานทันที (Image_Data ว่างไว้ก่อน)
+-> worker อัปโหลดรูป ลองซ้ำแบบ backoff -> สำเร็จแล้วค่อย patch ลิงก์รูปลงแถวนั้น
+เวลาที่นักเรียนรอจึงไม่ขึ้นกับความเร็วของ Drive อีกต่อไป
+ถ้าให้ journal: bytes ลง journal.db ก่อน submit คืน, จำลิงก์ที่ได้, จดผลสำเร็จ/ล้มเหลว
+-> process รีสตาร์ตแล้ว resume() ส่งงานที่ค้างเข้าคิวใหม่ได้ รูปไม่หายไปกับหน่วยความจำ
+"""
+import base64
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from metrics import log_event, timed
+
+
+class UploadError(Exception):
+    pass
+
+
+def upload_to_drive(file_bytes, filename, gas_url, timeout=30):
+    """ส่ง bytes ไป GAS แล้วคืนลิงก์รูป — ผิดพลาดจะ raise UploadError"""
+    # GAS รับ JSON เท่านั้น จึงต้อง base64 ครั้งเดียวตอนส่งออก
+    payload = {"filename": filename, "filedata": base64.b64encode(file_bytes).decode()}
+    try:
+        with timed("drive.upload") as m:
+            m["bytes"] = len(file_bytes)
+            response = requests.post(gas_url, json=payload, timeout=timeout)
+    except requests.RequestException as e:
+        raise UploadError(f"Upload System Error: {e}") from e
+    if response.status_code != 200: raise UploadError(f"Connection Error (HTTP {response.status_code})")
+    result = response.json()
+    if result.get("status") != "success": raise UploadError(f"GAS Error: {result.get('message')}")
+    return result.get("url")
+
+
+class UploadPipeline:
+    def __init__(self, upload_fn, journal=None, workers=2, retries=4, backoff=2.0):
+        self._upload = upload_fn  # fn(file_bytes, filename) -> url
+        self.journal = journal  # CaseJournal (ไม่บังคับ)
+        self.retries = retries
+        self.backoff = backoff
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload")
+        self._lock = threading.Lock()
+        self._inflight = set()
+        self.pending = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def submit(self, sheet, report_id, file_bytes, filename, on_uploaded, on_failed=None, url=None):
+        """เก็บลง journal แล้วคืนทันที on_uploaded(report_id, url) ถูกเรียกจาก worker เมื่ออัปโหลดสำเร็จ
+
+        ลองครบแล้วยังไม่ได้ -> on_failed(report_id, error); url = ลิงก์ที่เคยอัปโหลดได้แล้ว (ข้ามการอัปโหลด)
+        """
+        if self.journal: self.journal.enqueue_upload(sheet, report_id, filename, file_bytes)
+        with self._lock:
+            if report_id in self._inflight: return None  # อยู่ในคิวแล้ว (เช่น resume ซ้อนกับการส่งจากหน้าเว็บ)
+            self._inflight.add(report_id)
+            self.pending += 1
+        return self._pool.submit(self._run, report_id, file_bytes, filename, on_uploaded, on_failed, url)
+
+    def resume(self, callbacks):
+        """งานที่ค้างใน journal (เช่นหลังรีสตาร์ต) เข้าคิวใหม่ — callbacks(sheet) -> (on_uploaded, on_failed)"""
+        if not self.journal: return 0
+        items = self.journal.pending_uploads()
+        for report_id, sheet, filename, data, url in items: self.submit(sheet, report_id, data, filename, *callbacks(sheet), url=url)
+        if items: log_event("upload.resume", level=logging.INFO, uploads=len(items))
+        return len(items)
+
+    def _retry(self, label, report_id, fn):
+        for attempt in range(self.retries):
+            try: return fn()
+            except Exception as e:
+                log_event(label, report_id=report_id, error=f"{type(e).__name__}: {e}", attempt=attempt + 1, retries=self.retries)
+                if attempt + 1 == self.retries: raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def _run(self, report_id, file_bytes, filename, on_uploaded, on_failed, url):
+        try:
+            # แยกลองซ้ำสองช่วง: patch ชีตล้มเหลวต้องไม่ทำให้อัปโหลดรูปซ้ำใน Drive
+            if not url:
+                url = self._retry("upload.drive", report_id, lambda: self._upload(file_bytes, filename))
+                if self.journal: self.journal.set_upload_url(report_id, url)
+            self._retry("upload.patch", report_id, lambda: on_uploaded(report_id, url))
+            if self.journal: self.journal.mark_uploaded(report_id)
+            with self._lock: self.succeeded += 1
+            return url
+        except Exception as e:
+            with self._lock: self.failed += 1
+            log_event("upload.failed", level=logging.ERROR, report_id=report_id, error=f"{type(e).__name__}: {e}")
+            if self.journal: self.journal.mark_upload_failed(report_id, e)
+            if on_failed:
+                try: on_failed(report_id, e)
+                except Exception as cb_error: log_event("upload.on_failed", report_id=report_id, error=f"{type(cb_error).__name__}: {cb_error}")
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self._inflight.discard(report_id)